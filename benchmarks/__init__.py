@@ -0,0 +1,9 @@
+# benchmarks/__init__.py
+"""
+Benchmarks del sistema hospitalario
+Miden rendimiento sin pausas artificiales y guardan resultados en JSON
+para comparar entre versiones
+
+Uso:
+    python -m benchmarks.bench_buffer [opciones]
+"""
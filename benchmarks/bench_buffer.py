@@ -0,0 +1,177 @@
+# benchmarks/bench_buffer.py
+"""
+Benchmark de throughput y latencia del buffer de pacientes
+
+Ejecuta productores y consumidores sin pausas sobre una matriz de
+(productores, consumidores, capacidad) y mide:
+- ops/s: pacientes transferidos por segundo de reloj
+- p50/p99: latencia de traspaso (desde agregar() hasta que extraer() retorna)
+- cpu_s: tiempo de CPU del proceso durante la corrida
+
+Uso:
+    python -m benchmarks.bench_buffer
+    python -m benchmarks.bench_buffer --productores 1,4 --consumidores 1,4 --capacidades 1,64
+    python -m benchmarks.bench_buffer --impl concurrencia.buffer:BufferPacientes --impl otro.modulo:Buffer
+    python -m benchmarks.bench_buffer --comparar benchmarks/resultados/buffer_20250101_120000.json
+"""
+
+import argparse
+import logging
+import statistics
+import sys
+import os
+import threading
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.paciente import Paciente
+from benchmarks.comun import cargar_impl, percentil, guardar_resultados, comparar
+
+IMPL_DEFAULT = 'concurrencia.buffer:BufferPacientes'
+
+
+def _lista_enteros(texto: str) -> List[int]:
+    """Convierte '1,2,4' en [1, 2, 4]"""
+    return [int(x) for x in texto.split(',') if x.strip()]
+
+
+def _repartir(total: int, partes: int) -> List[int]:
+    """Reparte total en partes lo más iguales posible"""
+    base, resto = divmod(total, partes)
+    return [base + (1 if i < resto else 0) for i in range(partes)]
+
+
+def correr(clase_buffer, productores: int, consumidores: int, capacidad: int,
+           operaciones: int) -> Dict:
+    """
+    Ejecuta una corrida con una configuración
+
+    Args:
+        clase_buffer: Clase con agregar(paciente) y extraer()
+        productores: Threads productores
+        consumidores: Threads consumidores
+        capacidad: Capacidad del buffer
+        operaciones: Pacientes totales a transferir
+
+    Returns:
+        Métricas de la corrida
+    """
+    buffer = clase_buffer(capacidad)
+
+    # Los pacientes se crean antes de medir: solo se mide el buffer
+    lotes = [
+        [Paciente(i, "Bench", 2, "Benchmark") for i in range(n)]
+        for n in _repartir(operaciones, productores)
+    ]
+    cuotas = _repartir(operaciones, consumidores)
+    latencias: List[List[float]] = [[] for _ in range(consumidores)]
+    barrera = threading.Barrier(productores + consumidores + 1)
+    reloj = time.perf_counter
+
+    def producir(lote):
+        barrera.wait()
+        for paciente in lote:
+            paciente.t_bench = reloj()
+            buffer.agregar(paciente)
+
+    def consumir(cuota, destino):
+        barrera.wait()
+        for _ in range(cuota):
+            paciente = buffer.extraer()
+            destino.append(reloj() - paciente.t_bench)
+
+    hilos = [threading.Thread(target=producir, args=(lote,)) for lote in lotes]
+    hilos += [threading.Thread(target=consumir, args=(cuota, destino))
+              for cuota, destino in zip(cuotas, latencias)]
+    for hilo in hilos:
+        hilo.start()
+
+    barrera.wait()
+    cpu_inicio = time.process_time()
+    inicio = reloj()
+    for hilo in hilos:
+        hilo.join()
+    duracion = reloj() - inicio
+    cpu = time.process_time() - cpu_inicio
+
+    todas = [lat for lista in latencias for lat in lista]
+    return {
+        'ops_s': operaciones / duracion,
+        'p50_us': percentil(todas, 50) * 1e6,
+        'p99_us': percentil(todas, 99) * 1e6,
+        'cpu_s': cpu,
+        'duracion_s': duracion
+    }
+
+
+def main():
+    """Ejecuta la matriz de configuraciones y guarda los resultados"""
+    parser = argparse.ArgumentParser(description="Benchmark de throughput y latencia del buffer")
+    parser.add_argument("--impl", action="append",
+                        help=f"Implementación modulo:Clase, repetible (default: {IMPL_DEFAULT})")
+    parser.add_argument("--productores", type=_lista_enteros, default=[1, 2, 4],
+                        help="Lista de productores (default: 1,2,4)")
+    parser.add_argument("--consumidores", type=_lista_enteros, default=[1, 2, 4],
+                        help="Lista de consumidores (default: 1,2,4)")
+    parser.add_argument("--capacidades", type=_lista_enteros, default=[1, 5, 64],
+                        help="Lista de capacidades (default: 1,5,64)")
+    parser.add_argument("--operaciones", type=int, default=20000,
+                        help="Pacientes por corrida (default: 20000)")
+    parser.add_argument("--repeticiones", type=int, default=3,
+                        help="Corridas por configuración; se reporta la mediana (default: 3)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (default: benchmarks/resultados/)")
+    parser.add_argument("--comparar", metavar="ARCHIVO", help="Resultados anteriores para detectar regresiones")
+    args = parser.parse_args()
+
+    # Los logs por operación del buffer dominarían la medición
+    logging.disable(logging.CRITICAL)
+
+    impls = args.impl or [IMPL_DEFAULT]
+    resultados = []
+
+    print(f"{'IMPL':<40} {'P':>3} {'C':>3} {'CAP':>5} {'OPS/S':>11} {'P50(us)':>9} {'P99(us)':>10} {'CPU(s)':>7}")
+    for ruta in impls:
+        clase = cargar_impl(ruta)
+        for productores in args.productores:
+            for consumidores in args.consumidores:
+                for capacidad in args.capacidades:
+                    corridas = [
+                        correr(clase, productores, consumidores, capacidad, args.operaciones)
+                        for _ in range(args.repeticiones)
+                    ]
+                    resultado = {
+                        'impl': ruta,
+                        'productores': productores,
+                        'consumidores': consumidores,
+                        'capacidad': capacidad,
+                        'operaciones': args.operaciones,
+                        **{
+                            metrica: statistics.median(c[metrica] for c in corridas)
+                            for metrica in ('ops_s', 'p50_us', 'p99_us', 'cpu_s', 'duracion_s')
+                        }
+                    }
+                    resultados.append(resultado)
+                    print(
+                        f"{ruta:<40} {productores:>3} {consumidores:>3} {capacidad:>5} "
+                        f"{resultado['ops_s']:>11.0f} {resultado['p50_us']:>9.1f} "
+                        f"{resultado['p99_us']:>10.1f} {resultado['cpu_s']:>7.2f}"
+                    )
+
+    parametros = {k: v for k, v in vars(args).items() if k not in ('salida', 'comparar')}
+    parametros['impl'] = impls
+    ruta = guardar_resultados('buffer', parametros, resultados, args.salida)
+    print(f"\n💾 Resultados guardados en {ruta}")
+
+    if args.comparar:
+        print()
+        print("\n".join(comparar(
+            resultados, args.comparar,
+            claves=['impl', 'productores', 'consumidores', 'capacidad'],
+            metricas={'ops_s': True, 'p50_us': False, 'p99_us': False, 'cpu_s': False}
+        )))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# benchmarks/bench_expedientes.py
+"""
+Benchmark de escalabilidad del almacén de expedientes
+
+Pobla el almacén con N expedientes (10k, 100k, 1M por defecto) y mide la
+latencia de escribir_expediente, leer_expediente, leer_todos_expedientes y
+obtener_estadisticas con lectores y escritores concurrentes.
+
+El almacén es cualquier clase construible con la ruta del archivo que exponga
+esas cuatro operaciones y cargar_masivo(lista) para poblarla.
+
+Uso:
+    python -m benchmarks.bench_expedientes
+    python -m benchmarks.bench_expedientes --registros 10000,100000 --lectores 4 --escritores 2
+    python -m benchmarks.bench_expedientes --impl concurrencia.lector_escritor:SistemaExpedientes --impl otro.modulo:Almacen
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.paciente import Paciente
+from benchmarks.comun import cargar_impl, percentil, guardar_resultados, comparar
+
+IMPL_DEFAULT = 'concurrencia.lector_escritor:SistemaExpedientes'
+
+# Mezcla de lecturas: (operación, peso)
+MEZCLA_LECTURAS = [
+    ('leer_expediente', 80),
+    ('obtener_estadisticas', 15),
+    ('leer_todos_expedientes', 5),
+]
+
+OPERACIONES = ['escribir_expediente'] + [op for op, _ in MEZCLA_LECTURAS]
+
+
+def _lista_enteros(texto: str) -> List[int]:
+    """Convierte '10000,100000' en [10000, 100000]"""
+    return [int(x) for x in texto.split(',') if x.strip()]
+
+
+def generar_expedientes(cantidad: int) -> List[Dict]:
+    """
+    Genera expedientes con el mismo formato que escribe SistemaExpedientes
+
+    Args:
+        cantidad: Número de expedientes
+
+    Returns:
+        Lista de expedientes con IDs 0..cantidad-1
+    """
+    ahora = datetime.now().isoformat()
+    return [
+        {
+            'id': i,
+            'nombre': f"Paciente {i}",
+            'prioridad': 1 + i % 3,
+            'diagnostico': "Benchmark",
+            'estado': 'Atendido',
+            'hora_llegada': ahora,
+            'hora_atencion': ahora,
+            'medico_asignado': "Dr. Benchmark",
+            'tiempo_espera': 1.0,
+            'fecha_registro': ahora
+        }
+        for i in range(cantidad)
+    ]
+
+
+def correr(clase, archivo: str, registros: int, lectores: int, escritores: int,
+           duracion: float) -> Dict[str, List[float]]:
+    """
+    Pobla el almacén y lo somete a carga concurrente durante un tiempo
+
+    Cada hilo completa al menos una operación aunque supere la duración.
+
+    Args:
+        clase: Clase del almacén
+        archivo: Ruta del archivo del almacén
+        registros: Expedientes iniciales
+        lectores: Threads lectores
+        escritores: Threads escritores
+        duracion: Segundos de carga
+
+    Returns:
+        Latencias en segundos por operación
+    """
+    sistema = clase(archivo)
+    sistema.cargar_masivo(generar_expedientes(registros))
+
+    latencias = {op: [] for op in OPERACIONES}
+    mutex = threading.Lock()  # Protege latencias
+    barrera = threading.Barrier(lectores + escritores + 1)
+    reloj = time.perf_counter
+    fin = [0.0]
+
+    def escritor(semilla):
+        siguiente_id = registros + semilla * 10_000_000
+        propias = []
+        barrera.wait()
+        while not propias or reloj() < fin[0]:
+            paciente = Paciente(siguiente_id, "Bench", 2, "Benchmark")
+            siguiente_id += 1
+            inicio = reloj()
+            sistema.escribir_expediente(paciente)
+            propias.append(reloj() - inicio)
+        with mutex:
+            latencias['escribir_expediente'].extend(propias)
+
+    def lector(semilla):
+        azar = random.Random(semilla)
+        operaciones = [op for op, _ in MEZCLA_LECTURAS]
+        pesos = [peso for _, peso in MEZCLA_LECTURAS]
+        propias = {op: [] for op in operaciones}
+        hechas = 0
+        barrera.wait()
+        while not hechas or reloj() < fin[0]:
+            op = azar.choices(operaciones, weights=pesos)[0]
+            inicio = reloj()
+            if op == 'leer_expediente':
+                sistema.leer_expediente(azar.randrange(registros or 1))
+            else:
+                getattr(sistema, op)()
+            propias[op].append(reloj() - inicio)
+            hechas += 1
+        with mutex:
+            for op, valores in propias.items():
+                latencias[op].extend(valores)
+
+    hilos = [threading.Thread(target=escritor, args=(i,)) for i in range(escritores)]
+    hilos += [threading.Thread(target=lector, args=(i,)) for i in range(lectores)]
+    for hilo in hilos:
+        hilo.start()
+
+    fin[0] = reloj() + duracion
+    barrera.wait()
+    for hilo in hilos:
+        hilo.join()
+
+    return latencias
+
+
+def main():
+    """Ejecuta el benchmark para cada tamaño e implementación"""
+    parser = argparse.ArgumentParser(description="Benchmark de escalabilidad del almacén de expedientes")
+    parser.add_argument("--impl", action="append",
+                        help=f"Almacén modulo:Clase, repetible (default: {IMPL_DEFAULT})")
+    parser.add_argument("--registros", type=_lista_enteros, default=[10_000, 100_000, 1_000_000],
+                        help="Tamaños iniciales del almacén (default: 10000,100000,1000000)")
+    parser.add_argument("--lectores", type=int, default=4, help="Threads lectores (default: 4)")
+    parser.add_argument("--escritores", type=int, default=1, help="Threads escritores (default: 1)")
+    parser.add_argument("--duracion", type=float, default=5, help="Segundos de carga por tamaño (default: 5)")
+    parser.add_argument("--directorio", help="Directorio para los archivos del almacén (default: temporal)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (default: benchmarks/resultados/)")
+    parser.add_argument("--comparar", metavar="ARCHIVO", help="Resultados anteriores para detectar regresiones")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    impls = args.impl or [IMPL_DEFAULT]
+    directorio = args.directorio or tempfile.mkdtemp(prefix="bench_expedientes_")
+    resultados = []
+
+    print(f"{'IMPL':<48} {'REGISTROS':>9} {'OPERACIÓN':<24} {'N':>6} "
+          f"{'P50(ms)':>9} {'P99(ms)':>9} {'MAX(ms)':>9}")
+    try:
+        for ruta in impls:
+            clase = cargar_impl(ruta)
+            for registros in args.registros:
+                archivo = os.path.join(directorio, f"{clase.__name__}_{registros}", "expedientes.json")
+                latencias = correr(clase, archivo, registros, args.lectores, args.escritores, args.duracion)
+
+                for op in OPERACIONES:
+                    valores = latencias[op]
+                    resultado = {
+                        'impl': ruta,
+                        'registros': registros,
+                        'operacion': op,
+                        'lectores': args.lectores,
+                        'escritores': args.escritores,
+                        'n': len(valores),
+                        'p50_ms': percentil(valores, 50) * 1000,
+                        'p99_ms': percentil(valores, 99) * 1000,
+                        'max_ms': max(valores, default=0.0) * 1000
+                    }
+                    resultados.append(resultado)
+                    print(
+                        f"{ruta:<48} {registros:>9} {op:<24} {resultado['n']:>6} "
+                        f"{resultado['p50_ms']:>9.2f} {resultado['p99_ms']:>9.2f} {resultado['max_ms']:>9.2f}"
+                    )
+    finally:
+        if not args.directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    parametros = {k: v for k, v in vars(args).items() if k not in ('salida', 'comparar', 'directorio')}
+    parametros['impl'] = impls
+    ruta = guardar_resultados('expedientes', parametros, resultados, args.salida)
+    print(f"\n💾 Resultados guardados en {ruta}")
+
+    if args.comparar:
+        print()
+        print("\n".join(comparar(
+            resultados, args.comparar,
+            claves=['impl', 'registros', 'operacion'],
+            metricas={'p50_ms': False, 'p99_ms': False}
+        )))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# benchmarks/comun.py
+"""
+Utilidades compartidas por los benchmarks
+Carga de implementaciones, percentiles y persistencia/comparación de resultados
+"""
+
+import importlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
+
+
+def cargar_impl(ruta: str):
+    """
+    Carga una clase a partir de 'modulo:Clase'
+
+    Args:
+        ruta: Ruta de la implementación, por ejemplo 'concurrencia.buffer:BufferPacientes'
+
+    Returns:
+        La clase indicada
+    """
+    modulo, _, clase = ruta.partition(':')
+    if not clase:
+        raise ValueError(f"Implementación inválida '{ruta}' (formato: modulo:Clase)")
+    return getattr(importlib.import_module(modulo), clase)
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """
+    Calcula un percentil por el método del rango más cercano
+
+    Args:
+        valores: Muestras (no necesitan estar ordenadas)
+        p: Percentil entre 0 y 100
+
+    Returns:
+        Valor del percentil (0.0 si no hay muestras)
+    """
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def metadatos() -> Dict:
+    """Describe la máquina y la versión del código que generó los resultados"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(DIRECTORIO_RESULTADOS)
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+
+    return {
+        'fecha': datetime.now().isoformat(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'implementacion_python': platform.python_implementation(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def guardar_resultados(nombre: str, parametros: Dict, resultados: List[Dict],
+                       ruta: Optional[str] = None) -> str:
+    """
+    Guarda los resultados de un benchmark en JSON
+
+    Args:
+        nombre: Nombre del benchmark (prefijo del archivo)
+        parametros: Parámetros con los que se ejecutó
+        resultados: Una entrada por configuración medida
+        ruta: Archivo de destino (default: benchmarks/resultados/<nombre>_<fecha>.json)
+
+    Returns:
+        Ruta del archivo escrito
+    """
+    if ruta is None:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ruta = os.path.join(DIRECTORIO_RESULTADOS, f"{nombre}_{fecha}.json")
+
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump({
+            'benchmark': nombre,
+            'metadatos': metadatos(),
+            'parametros': parametros,
+            'resultados': resultados
+        }, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def comparar(actuales: List[Dict], ruta_base: str, claves: List[str],
+             metricas: Dict[str, bool], tolerancia: float = 0.10) -> List[str]:
+    """
+    Compara resultados contra un archivo anterior
+
+    Args:
+        actuales: Resultados de esta ejecución
+        ruta_base: Archivo JSON guardado por guardar_resultados
+        claves: Campos que identifican una configuración
+        metricas: {metrica: mayor_es_mejor}
+        tolerancia: Cambio relativo a partir del cual se marca regresión
+
+    Returns:
+        Líneas de texto con la comparación
+    """
+    with open(ruta_base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+
+    indice = {tuple(r.get(c) for c in claves): r for r in base['resultados']}
+    lineas = [f"Comparación contra {ruta_base} (commit {base['metadatos'].get('commit')})"]
+
+    for actual in actuales:
+        clave = tuple(actual.get(c) for c in claves)
+        anterior = indice.get(clave)
+        if anterior is None:
+            continue
+        partes = []
+        for metrica, mayor_es_mejor in metricas.items():
+            antes, ahora = anterior.get(metrica), actual.get(metrica)
+            if not antes or ahora is None:
+                continue
+            cambio = (ahora - antes) / antes
+            empeora = cambio < -tolerancia if mayor_es_mejor else cambio > tolerancia
+            marca = " ⚠️ REGRESIÓN" if empeora else ""
+            partes.append(f"{metrica} {cambio:+.1%}{marca}")
+        lineas.append(f"  {clave}: " + ", ".join(partes))
+
+    return lineas
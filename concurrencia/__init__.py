@@ -8,5 +8,6 @@ from .buffer import BufferPacientes
 from .productor import ProductorPacientes
 from .consumidor import Medico
 from .lector_escritor import SistemaExpedientes
+from .ingesta import IngestaPacientes
 
-__all__ = ['BufferPacientes', 'ProductorPacientes', 'Medico', 'SistemaExpedientes']
+__all__ = ['BufferPacientes', 'ProductorPacientes', 'Medico', 'SistemaExpedientes', 'IngestaPacientes']
@@ -8,6 +8,7 @@ import threading
 import logging
 from typing import Optional
 from core.paciente import Paciente
+from diagnostico.trazas import trazador
 
 class BufferPacientes:
     """
@@ -44,13 +45,39 @@ class BufferPacientes:
         
         Args:
             paciente: Paciente a agregar
-            
+        
         Returns:
             True si se agregó exitosamente
         """
-        # Esperar a que haya espacio disponible
-        self.empty.acquire()
+        with trazador.tramo('BufferPacientes.agregar', paciente.id):
+            # Esperar a que haya espacio disponible
+            self.empty.acquire()
+            self._insertar(paciente)
+        return True
+    
+    def intentar_agregar(self, paciente: Paciente, timeout: Optional[float] = None) -> bool:
+        """
+        Agrega un paciente solo si hay espacio, sin bloquear indefinidamente
         
+        Args:
+            paciente: Paciente a agregar
+            timeout: Segundos a esperar un espacio (None para no esperar)
+        
+        Returns:
+            True si se agregó, False si el buffer siguió lleno
+        """
+        with trazador.tramo('BufferPacientes.intentar_agregar', paciente.id):
+            if timeout is None:
+                obtenido = self.empty.acquire(blocking=False)
+            else:
+                obtenido = self.empty.acquire(timeout=timeout)
+            if not obtenido:
+                return False
+            self._insertar(paciente)
+        return True
+    
+    def _insertar(self, paciente: Paciente):
+        """Inserta un paciente con un espacio ya reservado en empty"""
         # Sección crítica
         with self.mutex:
             self.buffer.append(paciente)
@@ -60,8 +87,8 @@ class BufferPacientes:
             )
         
         # Señalar que hay un elemento disponible
+        trazador.iniciar_asincrono('en_cola', paciente.id)
         self.full.release()
-        return True
     
     def extraer(self) -> Optional[Paciente]:
         """
@@ -70,21 +97,26 @@ class BufferPacientes:
         Returns:
             Paciente extraído o None si el buffer está vacío
         """
-        # Esperar a que haya elementos disponibles
-        self.full.acquire()
-        
-        # Sección crítica
-        paciente = None
-        with self.mutex:
-            if self.buffer:
-                paciente = self.buffer.pop(0)
-                self.logger.info(
-                    f"📤 Paciente {paciente.id} extraído del buffer | "
-                    f"Buffer: {len(self.buffer)}/{self.capacidad}"
-                )
-        
-        # Señalar que hay un espacio disponible
-        self.empty.release()
+        with trazador.tramo('BufferPacientes.extraer') as tramo:
+            # Esperar a que haya elementos disponibles
+            self.full.acquire()
+            
+            # Sección crítica
+            paciente = None
+            with self.mutex:
+                if self.buffer:
+                    paciente = self.buffer.pop(0)
+                    self.logger.info(
+                        f"📤 Paciente {paciente.id} extraído del buffer | "
+                        f"Buffer: {len(self.buffer)}/{self.capacidad}"
+                    )
+            
+            # Señalar que hay un espacio disponible
+            self.empty.release()
+            
+            if paciente:
+                tramo.paciente_id = paciente.id
+                trazador.finalizar_asincrono('en_cola', paciente.id)
         return paciente
     
     def esta_vacio(self) -> bool:
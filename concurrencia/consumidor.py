@@ -7,9 +7,12 @@ import threading
 import time
 import random
 import logging
+from typing import Optional
 from concurrencia.buffer import BufferPacientes
 from concurrencia.lector_escritor import SistemaExpedientes
 from core.paciente import Paciente
+from core.bus_eventos import BusEventos
+from diagnostico.trazas import trazador
 
 class Medico(threading.Thread):
     """
@@ -18,7 +21,7 @@ class Medico(threading.Thread):
     """
     
     def __init__(self, nombre: str, buffer: BufferPacientes, 
-                 sistema_expedientes: SistemaExpedientes):
+                 sistema_expedientes: SistemaExpedientes, bus: Optional[BusEventos] = None):
         """
         Inicializa el médico
         
@@ -26,25 +29,38 @@ class Medico(threading.Thread):
             nombre: Nombre del médico
             buffer: Buffer compartido de donde extraer pacientes
             sistema_expedientes: Sistema para registrar expedientes
+            bus: Bus donde publicar los pacientes atendidos (opcional)
         """
         super().__init__(name=nombre, daemon=True)
         self.buffer = buffer
         self.sistema_expedientes = sistema_expedientes
+        self.bus = bus
         self._detener = threading.Event()
         self.pacientes_atendidos = 0
         self.logger = logging.getLogger(self.name)
+        
+        # Latido y bloqueo actual (los revisa el vigilante)
+        self.ultimo_latido = time.monotonic()
+        self.bloqueado_en: Optional[str] = None
+        self.bloqueado_desde: Optional[float] = None
     
     def run(self):
         """Ejecuta el thread del médico"""
         self.logger.info(f"🟢 {self.name} iniciado y listo para atender")
         
         while not self._detener.is_set():
+            self.ultimo_latido = time.monotonic()
             try:
                 # Extraer paciente del buffer (bloqueante si está vacío)
+                self.bloqueado_en = 'BufferPacientes.full'
+                self.bloqueado_desde = time.monotonic()
                 paciente = self.buffer.extraer()
+                self.bloqueado_desde = None
+                self.ultimo_latido = time.monotonic()
                 
                 if paciente:
-                    self._atender_paciente(paciente)
+                    with trazador.tramo('Medico._atender_paciente', paciente.id):
+                        self._atender_paciente(paciente)
                     self.pacientes_atendidos += 1
                 
             except Exception as e:
@@ -83,6 +99,9 @@ class Medico(threading.Thread):
             f"✅ {self.name} completó atención de {paciente.nombre} "
             f"en {tiempo_atencion:.1f}s"
         )
+        
+        if self.bus:
+            self.bus.publicar('paciente_atendido', paciente.to_dict())
     
     def _calcular_tiempo_atencion(self, prioridad: int) -> float:
         """
@@ -101,6 +120,18 @@ class Medico(threading.Thread):
         else:  # Baja
             return random.uniform(1, 3)
     
+    def reemplazo(self) -> 'Medico':
+        """
+        Crea un médico nuevo con la misma configuración
+        (un thread terminado no puede volver a iniciarse)
+        
+        Returns:
+            Médico sin iniciar que conserva el contador de pacientes
+        """
+        nuevo = Medico(self.name, self.buffer, self.sistema_expedientes, self.bus)
+        nuevo.pacientes_atendidos = self.pacientes_atendidos
+        return nuevo
+    
     def detener(self):
         """Solicita la detención del thread"""
         self.logger.info(f"⏸️ Solicitando detención de {self.name}")
@@ -0,0 +1,162 @@
+# concurrencia/ingesta.py
+"""
+Ingesta de pacientes registrados desde las interfaces
+Convierte los registros en Paciente y los lleva al buffer sin bloquear a
+quien los recibe (el bucle de red del servidor de eventos)
+"""
+
+import itertools
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional
+from core.paciente import Paciente
+from concurrencia.buffer import BufferPacientes
+
+class IngestaPacientes(threading.Thread):
+    """
+    Thread que mueve al buffer los pacientes registrados externamente
+    
+    ingresar() nunca espera al buffer: si hay espacio (y nadie antes en la
+    cola) el paciente entra directo; si no, queda en una cola acotada que
+    este thread vacía a medida que los médicos liberan espacio. Con la cola
+    llena el registro se rechaza para que el cliente reintente más tarde.
+    """
+    
+    # Diagnóstico cuando el registro no trae uno ni síntomas
+    DIAGNOSTICO_DEFAULT = "Sin diagnóstico"
+    
+    def __init__(self, buffer: BufferPacientes, medicos: List[threading.Thread],
+                 max_pendientes: int = 1000, segundos_por_paciente: float = 3.0):
+        """
+        Inicializa la ingesta
+        
+        Args:
+            buffer: Buffer compartido donde agregar pacientes
+            medicos: Lista de médicos del hospital (para estimar la espera)
+            max_pendientes: Pacientes que pueden esperar lugar en el buffer
+            segundos_por_paciente: Tiempo medio de atención de un médico
+        """
+        super().__init__(name="Ingesta", daemon=True)
+        self.buffer = buffer
+        self.medicos = medicos
+        self.max_pendientes = max_pendientes
+        self.segundos_por_paciente = segundos_por_paciente
+        self.pendientes = deque()  # Pacientes esperando lugar en el buffer
+        self.pacientes_ingresados = 0
+        self.rechazados = 0
+        self._condicion = threading.Condition()  # Protege pendientes
+        self._ids = itertools.count(1_000_000)  # Fuera del rango de los productores
+        self._detener = threading.Event()
+        self.logger = logging.getLogger(self.name)
+        
+        # Latido y bloqueo actual: el Vigilante la revisa como a productores y médicos
+        self.ultimo_latido = time.monotonic()
+        self.bloqueado_en: Optional[str] = None
+        self.bloqueado_desde: Optional[float] = None
+    
+    def ingresar(self, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Crea el paciente de un registro y lo encola sin bloquear
+        
+        Args:
+            datos: Datos del paciente ya validados (al menos 'nombre')
+        
+        Returns:
+            {'estado': 'ok', 'id': ..., 'eta_s': ...} si se aceptó, o
+            {'estado': 'cola_llena', 'reintentar_en_s': ...} si no hay lugar
+        """
+        paciente = self._crear_paciente(datos)
+        
+        with self._condicion:
+            adelante = self.buffer.obtener_tamano() + len(self.pendientes)
+            if not self.pendientes and self.buffer.intentar_agregar(paciente):
+                self.pacientes_ingresados += 1
+            elif len(self.pendientes) < self.max_pendientes:
+                self.pendientes.append(paciente)
+                self._condicion.notify()
+            else:
+                self.rechazados += 1
+                return {'estado': 'cola_llena', 'reintentar_en_s': round(self._segundos_por_lugar(), 1)}
+        
+        return {
+            'estado': 'ok',
+            'id': paciente.id,
+            'eta_s': round(adelante * self._segundos_por_lugar(), 1)
+        }
+    
+    def run(self):
+        """Ejecuta el thread de ingesta"""
+        self.logger.info(f"🟢 {self.name} iniciada (máximo {self.max_pendientes} pendientes)")
+        
+        while not self._detener.is_set():
+            self.ultimo_latido = time.monotonic()
+            with self._condicion:
+                if not self.pendientes:
+                    self._condicion.wait(0.5)
+                    continue
+                paciente = self.pendientes[0]
+            
+            # Solo este thread saca de pendientes: el primero sigue siendo el mismo
+            self.bloqueado_en = 'BufferPacientes.empty'
+            self.bloqueado_desde = time.monotonic()
+            agregado = self.buffer.intentar_agregar(paciente, timeout=0.5)
+            self.bloqueado_desde = None
+            if agregado:
+                with self._condicion:
+                    self.pendientes.popleft()
+                    self.pacientes_ingresados += 1
+        
+        self.logger.info(
+            f"🔴 {self.name} detenida. Ingresados: {self.pacientes_ingresados}, "
+            f"sin ingresar: {len(self.pendientes)}"
+        )
+    
+    def _crear_paciente(self, datos: Dict[str, Any]) -> Paciente:
+        """
+        Construye el Paciente a partir de los datos de un registro
+        
+        Args:
+            datos: Datos recibidos de la interfaz
+        
+        Returns:
+            Nuevo paciente (prioridad normal si no se indicó)
+        """
+        # El id lo asigna siempre la ingesta: uno enviado por el cliente
+        # podría repetir el de otro paciente (o el de un productor)
+        paciente_id = next(self._ids)
+        diagnostico = datos.get('diagnostico') or datos.get('sintomas') or self.DIAGNOSTICO_DEFAULT
+        return Paciente(paciente_id, datos['nombre'], datos.get('prioridad') or 2, diagnostico)
+    
+    def reemplazo(self) -> 'IngestaPacientes':
+        """
+        Crea una ingesta nueva que sigue con los pacientes de esta
+        (un thread terminado no puede volver a iniciarse)
+        
+        La cola de pendientes, su condición y el contador de ids se
+        comparten: los pacientes ya aceptados no se pierden, y un ingresar()
+        en curso sobre esta instancia los deja donde el reemplazo los ve.
+        
+        Returns:
+            Ingesta sin iniciar que conserva pendientes y contadores
+        """
+        nuevo = IngestaPacientes(self.buffer, self.medicos, self.max_pendientes, self.segundos_por_paciente)
+        nuevo.pendientes = self.pendientes
+        nuevo._condicion = self._condicion
+        nuevo._ids = self._ids
+        nuevo.pacientes_ingresados = self.pacientes_ingresados
+        nuevo.rechazados = self.rechazados
+        return nuevo
+    
+    def _segundos_por_lugar(self) -> float:
+        """Segundos estimados hasta que se libera un lugar en el buffer"""
+        activos = sum(1 for medico in self.medicos if medico.is_alive())
+        return self.segundos_por_paciente / max(1, activos)
+    
+    def detener(self):
+        """Solicita la detención del thread"""
+        self.logger.info(f"⏸️ Solicitando detención de {self.name}")
+        self._detener.set()
+        with self._condicion:
+            self._condicion.notify()
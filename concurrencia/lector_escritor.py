@@ -5,12 +5,16 @@ Permite múltiples lectores simultáneos pero un solo escritor a la vez
 """
 
 import threading
+import copy
 import json
 import os
+import time
 import logging
 from datetime import datetime
 from typing import Optional, Dict, List
 from core.paciente import Paciente
+from core.bus_eventos import BusEventos
+from diagnostico.trazas import trazador
 
 class SistemaExpedientes:
     """
@@ -22,20 +26,29 @@ class SistemaExpedientes:
     - Escritores tienen prioridad sobre lectores
     """
     
-    def __init__(self, archivo: str = "data/expedientes.json"):
+    def __init__(self, archivo: str = "data/expedientes.json", bus: Optional[BusEventos] = None):
         """
         Inicializa el sistema de expedientes
         
         Args:
             archivo: Ruta del archivo JSON para almacenar expedientes
+            bus: Bus donde publicar los expedientes guardados (opcional)
         """
         self.archivo = archivo
+        self.bus = bus
         self.lectores = 0  # Contador de lectores activos
         
         # Locks para sincronización Lectores-Escritores
         self.mutex = threading.Lock()  # Protege el contador de lectores
         self.escritor_lock = threading.Lock()  # Exclusión mutua para escritores
         
+        # Escritores esperando el lock {nombre_hilo: desde} (lo revisa el vigilante)
+        self.escritores_esperando: Dict[str, float] = {}
+        
+        # Versión de los datos: aumenta con cada escritura de este proceso
+        self.version = 0
+        self._cache_estadisticas = None  # (clave, estadísticas)
+        
         self.logger = logging.getLogger(__name__)
         
         # Crear archivo si no existe
@@ -58,32 +71,64 @@ class SistemaExpedientes:
         Args:
             paciente: Paciente cuyo expediente se va a escribir
         """
-        # Adquirir lock de escritor (exclusión mutua total)
-        self.escritor_lock.acquire()
+        with trazador.tramo('SistemaExpedientes.escribir_expediente', paciente.id):
+            # Adquirir lock de escritor (exclusión mutua total)
+            hilo = threading.current_thread().name
+            self.escritores_esperando[hilo] = time.monotonic()
+            with trazador.tramo('SistemaExpedientes.espera_escritor', paciente.id):
+                self.escritor_lock.acquire()
+            self.escritores_esperando.pop(hilo, None)
+            
+            try:
+                self.logger.info(f"📝 Escribiendo expediente de paciente {paciente.id}")
+            
+                # Leer datos existentes
+                with open(self.archivo, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            
+                # Agregar nuevo expediente
+                expediente = paciente.to_dict()
+                expediente['fecha_registro'] = datetime.now().isoformat()
+                data['expedientes'].append(expediente)
+            
+                # Escribir de vuelta
+                with open(self.archivo, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                self.version += 1
+            
+                self.logger.info(f"✅ Expediente de paciente {paciente.id} guardado")
+                if self.bus:
+                    self.bus.publicar('expediente_guardado', {'paciente_id': paciente.id, 'version': self.version})
+            
+            except Exception as e:
+                self.logger.error(f"❌ Error escribiendo expediente: {e}")
+            finally:
+                # Liberar lock de escritor
+                self.escritor_lock.release()
+    
+    def cargar_masivo(self, expedientes: List[Dict]) -> int:
+        """
+        Agrega muchos expedientes con una sola reescritura del archivo (ESCRITOR)
+        Pensado para importaciones y para poblar benchmarks
         
-        try:
-            self.logger.info(f"📝 Escribiendo expediente de paciente {paciente.id}")
+        Args:
+            expedientes: Expedientes ya serializados (mismo formato que to_dict)
             
-            # Leer datos existentes
+        Returns:
+            Número de expedientes agregados
+        """
+        with self.escritor_lock:
             with open(self.archivo, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             
-            # Agregar nuevo expediente
-            expediente = paciente.to_dict()
-            expediente['fecha_registro'] = datetime.now().isoformat()
-            data['expedientes'].append(expediente)
+            data['expedientes'].extend(expedientes)
             
-            # Escribir de vuelta
             with open(self.archivo, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            self.logger.info(f"✅ Expediente de paciente {paciente.id} guardado")
-            
-        except Exception as e:
-            self.logger.error(f"❌ Error escribiendo expediente: {e}")
-        finally:
-            # Liberar lock de escritor
-            self.escritor_lock.release()
+            self.version += 1
+        
+        self.logger.info(f"✅ {len(expedientes)} expedientes cargados")
+        return len(expedientes)
     
     def leer_expediente(self, paciente_id: int) -> Optional[Dict]:
         """
@@ -166,20 +211,42 @@ class SistemaExpedientes:
         """
         Obtiene estadísticas de los expedientes
         
+        Se recalculan solo si el archivo cambió desde la última llamada
+        (escrituras de este proceso o modificaciones externas).
+        
         Returns:
             Diccionario con estadísticas
         """
+        clave = self._clave_cache()
+        cache = self._cache_estadisticas
+        if clave is not None and cache is not None and cache[0] == clave:
+            return copy.deepcopy(cache[1])
+        
         expedientes = self.leer_todos_expedientes()
         
         if not expedientes:
-            return {"total": 0}
-        
-        return {
-            "total": len(expedientes),
-            "por_prioridad": {
-                "urgente": len([e for e in expedientes if e['prioridad'] == 1]),
-                "normal": len([e for e in expedientes if e['prioridad'] == 2]),
-                "baja": len([e for e in expedientes if e['prioridad'] == 3])
-            },
-            "atendidos": len([e for e in expedientes if e['estado'] == 'Atendido'])
-        }
+            estadisticas = {"total": 0}
+        else:
+            estadisticas = {
+                "total": len(expedientes),
+                "por_prioridad": {
+                    "urgente": len([e for e in expedientes if e['prioridad'] == 1]),
+                    "normal": len([e for e in expedientes if e['prioridad'] == 2]),
+                    "baja": len([e for e in expedientes if e['prioridad'] == 3])
+                },
+                "atendidos": len([e for e in expedientes if e['estado'] == 'Atendido'])
+            }
+        
+        # La clave se tomó antes de leer: si hubo una escritura en medio,
+        # la próxima llamada verá otra clave y recalculará
+        if clave is not None:
+            self._cache_estadisticas = (clave, copy.deepcopy(estadisticas))
+        return estadisticas
+    
+    def _clave_cache(self) -> Optional[tuple]:
+        """Identifica el contenido actual del archivo (None si no se puede)"""
+        try:
+            info = os.stat(self.archivo)
+        except OSError:
+            return None
+        return (self.version, info.st_mtime_ns, info.st_size)
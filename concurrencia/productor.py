@@ -7,8 +7,11 @@ import threading
 import time
 import random
 import logging
+from typing import Optional
 from core.paciente import Paciente
+from core.bus_eventos import BusEventos
 from concurrencia.buffer import BufferPacientes
+from diagnostico.trazas import trazador
 
 class ProductorPacientes(threading.Thread):
     """
@@ -32,7 +35,7 @@ class ProductorPacientes(threading.Thread):
     ]
     
     def __init__(self, nombre: str, buffer: BufferPacientes, 
-                 intervalo_min: int = 2, intervalo_max: int = 5):
+                 intervalo_min: int = 2, intervalo_max: int = 5, bus: Optional[BusEventos] = None):
         """
         Inicializa el productor
         
@@ -41,32 +44,45 @@ class ProductorPacientes(threading.Thread):
             buffer: Buffer compartido donde agregar pacientes
             intervalo_min: Tiempo mínimo entre generaciones (segundos)
             intervalo_max: Tiempo máximo entre generaciones (segundos)
+            bus: Bus donde publicar los pacientes generados (opcional)
         """
         super().__init__(name=nombre, daemon=True)
         self.buffer = buffer
         self.intervalo_min = intervalo_min
         self.intervalo_max = intervalo_max
+        self.bus = bus
         self._detener = threading.Event()
         self.pacientes_generados = 0
         self.logger = logging.getLogger(self.name)
+        
+        # Latido y bloqueo actual (los revisa el vigilante)
+        self.ultimo_latido = time.monotonic()
+        self.bloqueado_en: Optional[str] = None
+        self.bloqueado_desde: Optional[float] = None
     
     def run(self):
         """Ejecuta el thread productor"""
         self.logger.info(f"🟢 {self.name} iniciado")
         
         while not self._detener.is_set():
+            self.ultimo_latido = time.monotonic()
             try:
                 # Generar un paciente aleatorio
                 paciente = self._generar_paciente()
                 
                 # Agregar al buffer (bloqueante si está lleno)
+                self.bloqueado_en = 'BufferPacientes.empty'
+                self.bloqueado_desde = time.monotonic()
                 self.buffer.agregar(paciente)
+                self.bloqueado_desde = None
                 self.pacientes_generados += 1
                 
                 self.logger.info(
                     f"👤 {self.name} generó: {paciente.nombre} "
                     f"(Prioridad: {paciente.prioridad}, ID: {paciente.id})"
                 )
+                if self.bus:
+                    self.bus.publicar('paciente_generado', paciente.to_dict())
                 
                 # Esperar un tiempo aleatorio antes de generar el siguiente
                 tiempo_espera = random.uniform(self.intervalo_min, self.intervalo_max)
@@ -85,13 +101,27 @@ class ProductorPacientes(threading.Thread):
         Returns:
             Nuevo paciente generado
         """
-        paciente_id = int(time.time() * 1000) % 1000000  # ID basado en timestamp
-        nombre = random.choice(self.NOMBRES)
-        prioridad = random.choices([1, 2, 3], weights=[20, 50, 30])[0]  # 20% urgente, 50% normal, 30% baja
-        diagnostico = random.choice(self.DIAGNOSTICOS)
+        with trazador.tramo('ProductorPacientes._generar_paciente') as tramo:
+            paciente_id = int(time.time() * 1000) % 1000000  # ID basado en timestamp
+            nombre = random.choice(self.NOMBRES)
+            prioridad = random.choices([1, 2, 3], weights=[20, 50, 30])[0]  # 20% urgente, 50% normal, 30% baja
+            diagnostico = random.choice(self.DIAGNOSTICOS)
+            tramo.paciente_id = paciente_id
         
         return Paciente(paciente_id, nombre, prioridad, diagnostico)
     
+    def reemplazo(self) -> 'ProductorPacientes':
+        """
+        Crea un productor nuevo con la misma configuración
+        (un thread terminado no puede volver a iniciarse)
+        
+        Returns:
+            Productor sin iniciar que conserva el contador de pacientes
+        """
+        nuevo = ProductorPacientes(self.name, self.buffer, self.intervalo_min, self.intervalo_max, self.bus)
+        nuevo.pacientes_generados = self.pacientes_generados
+        return nuevo
+    
     def detener(self):
         """Solicita la detención del thread"""
         self.logger.info(f"⏸️ Solicitando detención de {self.name}")
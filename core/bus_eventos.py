@@ -0,0 +1,187 @@
+# core/bus_eventos.py
+"""
+Bus de eventos interno del hospital
+Productores, médicos y expedientes publican lo que ocurre; el servidor de
+eventos (y cualquier otra vista) se suscribe en lugar de consultar el estado
+"""
+
+import threading
+import time
+import logging
+from collections import deque, namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Eventos del ciclo de vida que se publican en el bus
+TIPOS_BUS = {'paciente_generado', 'paciente_atendido', 'expediente_guardado'}
+
+# Evento publicado: tipo, datos (dict) y momento (time.monotonic())
+EventoBus = namedtuple('EventoBus', 'tipo datos momento')
+
+# Suscripción: callback que recibe listas de EventoBus, y tipos que le interesan (None: todos)
+_Suscripcion = namedtuple('_Suscripcion', 'callback tipos')
+
+class BusEventos(threading.Thread):
+    """
+    Bus publicar/suscribir en proceso
+    
+    publicar() nunca bloquea a quien publica (un médico o un productor): solo
+    agrega el evento a una cola. Un thread despachador vacía la cola en lotes
+    y entrega cada lote a los suscriptores con una sola llamada, así que el
+    costo de notificar no recae en los threads del hospital y una ráfaga de
+    eventos se entrega de una vez.
+    """
+    
+    def __init__(self, max_pendientes: int = 10000, max_lote: int = 256):
+        """
+        Inicializa el bus
+        
+        Args:
+            max_pendientes: Eventos sin despachar como máximo; con la cola
+                llena los eventos nuevos se descartan (y se cuentan)
+            max_lote: Eventos entregados como máximo en cada llamada
+        """
+        super().__init__(name="BusEventos", daemon=True)
+        self.max_pendientes = max_pendientes
+        self.max_lote = max_lote
+        self.pendientes = deque()  # EventoBus sin despachar (append/popleft son atómicos)
+        self.publicados = 0
+        self.descartados = 0
+        self.lotes = 0
+        self._suscripciones: List[_Suscripcion] = []  # Se reemplaza entera al cambiar
+        self._lock = threading.Lock()  # Protege las altas y bajas de suscripciones
+        self._hay_eventos = threading.Event()
+        self._detener = threading.Event()
+        self.logger = logging.getLogger(self.name)
+        
+        # Latido y bloqueo actual: el Vigilante lo revisa como a productores y
+        # médicos (un suscriptor que no vuelve deja al bus bloqueado)
+        self.ultimo_latido = time.monotonic()
+        self.bloqueado_en: Optional[str] = None
+        self.bloqueado_desde: Optional[float] = None
+    
+    def publicar(self, tipo: str, datos: Dict[str, Any]) -> bool:
+        """
+        Publica un evento sin bloquear
+        
+        Args:
+            tipo: Tipo del evento (uno de TIPOS_BUS)
+            datos: Datos del evento; no deben modificarse después de publicarlos
+        
+        Returns:
+            False si la cola estaba llena y el evento se descartó
+        """
+        if len(self.pendientes) >= self.max_pendientes:
+            self.descartados += 1
+            return False
+        self.pendientes.append(EventoBus(tipo, datos, time.monotonic()))
+        self.publicados += 1
+        self._hay_eventos.set()
+        return True
+    
+    def suscribir(self, callback: Callable[[List[EventoBus]], None],
+                  tipos: Optional[Iterable[str]] = None):
+        """
+        Agrega un suscriptor
+        
+        El callback corre en el thread del bus: debe ser rápido y no
+        bloquear (si tiene trabajo pesado, que lo pase a su propio thread).
+        
+        Args:
+            callback: Recibe una lista no vacía de EventoBus, en orden de publicación
+            tipos: Tipos que le interesan (None: todos)
+        
+        Raises:
+            ValueError: Si algún tipo no es de TIPOS_BUS
+        """
+        if tipos is not None:
+            tipos = frozenset(tipos)
+            desconocidos = tipos - TIPOS_BUS
+            if desconocidos:
+                raise ValueError(f"Tipos de evento desconocidos: {', '.join(sorted(desconocidos))}")
+        with self._lock:
+            self._suscripciones = self._suscripciones + [_Suscripcion(callback, tipos)]
+    
+    def desuscribir(self, callback: Callable[[List[EventoBus]], None]):
+        """Quita un suscriptor (todas sus suscripciones)"""
+        with self._lock:
+            self._suscripciones = [s for s in self._suscripciones if s.callback != callback]
+    
+    def run(self):
+        """Ejecuta el thread despachador"""
+        self.logger.info(f"🟢 {self.name} iniciado")
+        
+        while not self._detener.is_set():
+            self.ultimo_latido = time.monotonic()
+            if not self.pendientes:
+                self._hay_eventos.wait(0.5)
+                self._hay_eventos.clear()
+                continue
+            self._despachar()
+        
+        # Entregar lo que quedó publicado antes de detenerse
+        while self.pendientes:
+            self._despachar()
+        
+        self.logger.info(f"🔴 {self.name} detenido. Eventos publicados: {self.publicados}, descartados: {self.descartados}")
+    
+    def _despachar(self):
+        """Saca un lote de la cola y lo entrega a cada suscriptor interesado"""
+        lote = []
+        while self.pendientes and len(lote) < self.max_lote:
+            lote.append(self.pendientes.popleft())
+        self.lotes += 1
+        
+        for suscripcion in self._suscripciones:
+            eventos = lote if suscripcion.tipos is None else [e for e in lote if e.tipo in suscripcion.tipos]
+            if not eventos:
+                continue
+            self.bloqueado_en = 'BusEventos.suscriptor'
+            self.bloqueado_desde = time.monotonic()
+            try:
+                suscripcion.callback(eventos)
+            except Exception as e:
+                self.logger.error(f"❌ Error en suscriptor del bus: {e}")
+            finally:
+                self.bloqueado_desde = None
+    
+    def reemplazo(self) -> 'BusEventos':
+        """
+        Crea un bus nuevo que sigue despachando los eventos de este
+        (un thread terminado no puede volver a iniciarse)
+        
+        La cola, el aviso de eventos nuevos y las suscripciones se
+        comparten: lo que se siga publicando en esta instancia lo despacha
+        el reemplazo.
+        
+        Returns:
+            Bus sin iniciar que conserva cola, suscripciones y contadores
+        """
+        nuevo = BusEventos(self.max_pendientes, self.max_lote)
+        nuevo.pendientes = self.pendientes
+        nuevo._hay_eventos = self._hay_eventos
+        nuevo._lock = self._lock
+        nuevo._suscripciones = self._suscripciones
+        nuevo.publicados = self.publicados
+        nuevo.descartados = self.descartados
+        nuevo.lotes = self.lotes
+        return nuevo
+    
+    def obtener_estadisticas(self) -> Dict[str, int]:
+        """
+        Contadores del bus
+        
+        Returns:
+            Eventos publicados, descartados, pendientes y lotes despachados
+        """
+        return {
+            'publicados': self.publicados,
+            'descartados': self.descartados,
+            'pendientes': len(self.pendientes),
+            'lotes': self.lotes
+        }
+    
+    def detener(self):
+        """Solicita la detención del thread (entrega antes lo pendiente)"""
+        self.logger.info(f"⏸️ Solicitando detención de {self.name}")
+        self._detener.set()
+        self._hay_eventos.set()
@@ -4,19 +4,85 @@ Servidor de eventos para comunicación con interfaces
 Permite que múltiples ventanas se conecten y reciban actualizaciones
 """
 
+import os
+import json
+import math
 import socket
+import selectors
+import stat
 import threading
-import json
+import itertools
 import logging
-from typing import List, Dict, Any
+import time
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from concurrent import futures
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
+from core.bus_eventos import EventoBus
+from core.protocolo import (
+    DecodificadorLineas, ErrorProtocolo, FORMATOS, Latido, RuedaTemporizadores, cambiar_formato,
+    comprimir_trama, ruta_unix as ruta_unix_default
+)
+from diagnostico.muestreo import PerfiladorMuestreo
+from diagnostico.perfil_locks import PerfiladorLocks
+
+# Envío de varios buffers en una llamada (no disponible en Windows)
+_SENDMSG = hasattr(socket.socket, 'sendmsg')
+_MAX_BUFFERS_ENVIO = 64
+
+# Políticas para clientes que no leen al ritmo de los eventos
+POLITICAS_LENTOS = ('descartar_antiguos', 'coalescer', 'desconectar')
+
+# Mensajes que son instantáneas de estado: solo importa el más reciente
+TIPOS_COALESCIBLES = {'actualizacion_estado'}
+
+# Eventos que se difunden y a los que se puede suscribir
+TIPOS_EVENTO = {'paciente_registrado', 'pacientes_registrados', 'paciente_atendido', 'actualizacion_estado'}
+
+# Eventos con una lista de pacientes: los filtros por médico o prioridad se
+# aplican a cada paciente de la lista
+TIPOS_LOTE = {'pacientes_registrados'}
+
+# Pacientes como máximo en un comando registrar_pacientes (el comando entero
+# debe caber además en una trama de MAX_TRAMA bytes)
+MAX_LOTE_REGISTRO = 1000
+
+# Bytes (JSON) como máximo de los datos de un paciente registrado
+MAX_BYTES_PACIENTE = 4096
+
+# Bytes (JSON) de pacientes por evento pacientes_registrados: un lote grande se
+# difunde en varios eventos, muy por debajo de MAX_TRAMA y del límite de salida
+MAX_BYTES_EVENTO_LOTE = 64 * 1024
+
+# Segundos que un registro espera a otro en curso con la misma clave_idempotencia
+ESPERA_IDEMPOTENCIA = 5.0
+
+# Segundos entre revisiones de la firma del estado si no llegan eventos del bus
+REVISION_SIN_EVENTOS = 1.0
+
+# Evento guardado en el historial, con los campos que usan los filtros.
+# tramas guarda la codificación en cada variante pedida ({(formato, comprimida): bytes})
+_EventoDifundido = namedtuple('_EventoDifundido', 'seq mensaje tramas clave tipo medico prioridad')
 
 class EventServer:
     """
     Servidor que permite a las interfaces conectarse y recibir eventos
     del sistema hospitalario en tiempo real
+    
+    Un solo thread atiende a todos los clientes con E/S no bloqueante
+    (selectors), en lugar de un thread por cliente.
     """
     
-    def __init__(self, hospital, host='localhost', port=5555):
+    # Marcadores de los sockets internos en el selector
+    _ACEPTAR = object()
+    _DESPERTAR = object()
+    
+    def __init__(self, hospital, host='localhost', port=5555,
+                 limite_salida: int = 256 * 1024, politica_lentos: str = 'descartar_antiguos',
+                 max_actualizaciones: float = 4, historial: int = 1000,
+                 umbral_compresion: int = 1024, ventana_idempotencia: float = 300,
+                 max_idempotencia: int = 10000, unix: bool = True, ruta_unix: Optional[str] = None,
+                 intervalo_ping: float = 15, timeout_ping: float = 10):
         """
         Inicializa el servidor de eventos
         
@@ -24,165 +90,965 @@ class EventServer:
             hospital: Instancia del hospital
             host: Host del servidor
             port: Puerto del servidor
+            limite_salida: Bytes pendientes por cliente a partir de los cuales
+                se aplica la política de clientes lentos
+            politica_lentos: 'descartar_antiguos' (descarta los eventos difundidos más viejos;
+                las respuestas a comandos nunca se descartan),
+                'coalescer' (conserva solo la última actualización de estado y
+                desconecta si aun así no alcanza) o 'desconectar'
+            max_actualizaciones: Instantáneas de estado por segundo como máximo
+            historial: Eventos recientes conservados para obtener_cambios
+            umbral_compresion: Bytes a partir de los cuales se comprime un
+                mensaje para los clientes que negociaron compresión
+            ventana_idempotencia: Segundos durante los que un registro repetido
+                con la misma clave_idempotencia devuelve la respuesta original
+            max_idempotencia: Claves de idempotencia recordadas como máximo
+            unix: Si es True, escucha también en un socket Unix (si la
+                plataforma lo permite) para los clientes de esta máquina
+            ruta_unix: Ruta del socket Unix (default: protocolo.ruta_unix(port))
+            intervalo_ping: Segundos de silencio de un cliente antes de enviarle
+                un ping (0 desactiva los latidos)
+            timeout_ping: Segundos sin respuesta al ping tras los que la
+                conexión se da por caída y se cierra
+        
+        Raises:
+            ValueError: Si la política es desconocida, max_actualizaciones o
+                timeout_ping no son mayores que 0, o intervalo_ping es negativo
         """
+        if politica_lentos not in POLITICAS_LENTOS:
+            raise ValueError(f"Política desconocida '{politica_lentos}' (opciones: {', '.join(POLITICAS_LENTOS)})")
+        if not max_actualizaciones > 0:
+            raise ValueError(f"max_actualizaciones debe ser mayor que 0 (se recibió {max_actualizaciones})")
+        if not intervalo_ping >= 0:
+            raise ValueError(f"intervalo_ping no puede ser negativo (se recibió {intervalo_ping})")
+        if not timeout_ping > 0:
+            raise ValueError(f"timeout_ping debe ser mayor que 0 (se recibió {timeout_ping})")
+        
         self.hospital = hospital
         self.host = host
         self.port = port
+        self.limite_salida = limite_salida
+        self.politica_lentos = politica_lentos
+        self.intervalo_actualizaciones = 1.0 / max_actualizaciones
+        self.umbral_compresion = umbral_compresion
+        self.idempotencia = _CacheIdempotencia(ventana_idempotencia, max_idempotencia)
         self.server_socket = None
+        self.unix_socket = None
+        self.ruta_unix = None  # Sin socket Unix
+        if unix and hasattr(socket, 'AF_UNIX'):
+            self.ruta_unix = ruta_unix or ruta_unix_default(port)
         self.activo = False
-        self.clientes = []
-        self.lock = threading.Lock()
+        self.clientes: Set[_Conexion] = set()
+        
+        # Índice de suscripciones: quién recibe cada tipo de evento
+        self._todos_tipos: Set[_Conexion] = set()  # Sin filtro de tipo
+        self._indice_tipos: Dict[str, Set[_Conexion]] = {tipo: set() for tipo in TIPOS_EVENTO}
+        self.lock = threading.Lock()  # Protege clientes y buffers de salida
+        
+        # Bucle de eventos
+        self._selector = selectors.DefaultSelector()
+        self._hilo_loop: Optional[threading.Thread] = None
+        self._por_activar: List[_Conexion] = []  # Conexiones con salida nueva
+        self._por_cerrar: List[_Conexion] = []  # Clientes lentos a desconectar
+        self._por_reanudar: List[_Conexion] = []  # Con su instantánea ya encolada
+        
+        # Las instantáneas se construyen fuera del bucle: leer las estadísticas
+        # puede ir al archivo de expedientes o esperar a un escritor
+        self._instantaneas: Optional[futures.ThreadPoolExecutor] = None
+        
+        # Par de sockets para interrumpir select() desde otros threads
+        self._despertador_r, self._despertador_w = socket.socketpair()
+        self._despertador_r.setblocking(False)
+        self._despertador_w.setblocking(False)
         self.logger = logging.getLogger(__name__)
         
-        # Callbacks para eventos
-        self.callbacks = {
-            'paciente_registrado': [],
-            'paciente_atendido': [],
-            'estado_actualizado': []
-        }
+        # Latidos: una rueda de temporizadores vigila todas las conexiones
+        self.intervalo_ping = intervalo_ping
+        self.timeout_ping = timeout_ping
+        self._rueda: Optional[RuedaTemporizadores] = None
+        if intervalo_ping > 0:
+            resolucion = min(1.0, intervalo_ping / 4, timeout_ping / 4)
+            ranuras = int(max(intervalo_ping, timeout_ping) / resolucion) + 2
+            self._rueda = RuedaTemporizadores(resolucion, ranuras)
+        
+        # Eventos versionados: cada difusión lleva un número de secuencia
+        self.seq = 0
+        self.sesion = uuid.uuid4().hex  # Cambia si el servidor se reinicia
+        self.historial = deque(maxlen=historial)  # _EventoDifundido
+        self._lock_difusion = threading.RLock()  # Ordena seq, historial y colas
+        
+        # Flujo de actualizaciones de estado agrupadas
+        self._cambios = threading.Event()  # Hay cambios sin difundir
+        self._detenido = threading.Event()
+        self._hilo_actualizaciones: Optional[threading.Thread] = None
+        self._firma_estado = None  # Última firma difundida
+        
+        # Oyentes en proceso (por ejemplo la API HTTP): reciben cada evento difundido
+        self._oyentes: List[Callable[[_EventoDifundido], None]] = []
+        
+        # Perfilador por muestreo (se crea bajo demanda) y la conexión que lo
+        # pidió: si se cierra sin detenerlo, el perfilador se detiene
+        self.perfilador_muestreo: Optional[PerfiladorMuestreo] = None
+        self._dueno_perfilado: Optional[_Conexion] = None
     
     def iniciar(self):
         """Inicia el servidor de eventos"""
         self.activo = True
-        thread = threading.Thread(target=self._run_server, daemon=True)
-        thread.start()
+        self._detenido.clear()
+        self._instantaneas = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="EventServer-instantaneas")
+        self._hilo_loop = threading.Thread(target=self._run_server, name="EventServer", daemon=True)
+        self._hilo_loop.start()
+        self._hilo_actualizaciones = threading.Thread(
+            target=self._run_actualizaciones, name="EventServer-estado", daemon=True
+        )
+        self._hilo_actualizaciones.start()
+        
+        # Lo que ocurre en el hospital llega por el bus, sin consultar el estado
+        self.hospital.bus.suscribir(self._al_publicar_bus)
         self.logger.info(f"🌐 Servidor de eventos iniciado en {self.host}:{self.port}")
     
     def detener(self):
         """Detiene el servidor de eventos"""
+        self.hospital.bus.desuscribir(self._al_publicar_bus)
         self.activo = False
-        with self.lock:
-            for cliente in self.clientes:
-                try:
-                    cliente.close()
-                except:
-                    pass
-            self.clientes.clear()
+        self._despertar()
+        self._detenido.set()
         
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except:
-                pass
+        for hilo in (self._hilo_loop, self._hilo_actualizaciones):
+            if hilo and hilo is not threading.current_thread():
+                hilo.join(timeout=2)
+        if self._instantaneas:
+            self._instantaneas.shutdown(wait=False)
         
         self.logger.info("🔴 Servidor de eventos detenido")
     
     def _run_server(self):
-        """Ejecuta el servidor en un thread"""
+        """
+        Ejecuta el bucle de eventos en un único thread
+        
+        Un selector (epoll/kqueue/select según la plataforma) vigila el socket
+        de escucha, el socket despertador y todas las conexiones. Ninguna
+        operación de red bloquea: cada conexión acumula lo que falta enviar
+        en su buffer de salida y se escribe cuando el socket lo admite.
+        """
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            self.server_socket.settimeout(1.0)
+            self.server_socket.listen(128)
+            self.server_socket.setblocking(False)
             
+            self._selector.register(self.server_socket, selectors.EVENT_READ, self._ACEPTAR)
+            self._selector.register(self._despertador_r, selectors.EVENT_READ, self._DESPERTAR)
+        except Exception as e:
+            self.logger.error(f"Error al iniciar servidor: {e}")
+            return
+        
+        if self.ruta_unix:
+            self._escuchar_unix()
+        
+        try:
             while self.activo:
+                espera = min(1.0, self._rueda.espera()) if self._rueda is not None else 1.0
+                for clave, eventos in self._selector.select(timeout=espera):
+                    if clave.data is self._ACEPTAR:
+                        self._aceptar(clave.fileobj)
+                    elif clave.data is self._DESPERTAR:
+                        self._vaciar_despertador()
+                    else:
+                        conexion = clave.data
+                        try:
+                            if eventos & selectors.EVENT_READ:
+                                self._leer(conexion)
+                            if eventos & selectors.EVENT_WRITE and not conexion.cerrada:
+                                self._escribir(conexion)
+                        except Exception as e:
+                            # Un error con un cliente cierra solo esa conexión, no el bucle
+                            self.logger.error(f"❌ Error en la conexión {conexion.direccion}: {e!r}")
+                            self._cerrar_conexion(conexion)
+                
+                if self._rueda is not None:
+                    self._revisar_latidos()
+                self._reanudar_lecturas()
+                self._activar_escrituras()
+                self._cerrar_saturadas()
+        
+        except Exception as e:
+            self.logger.error(f"Error en servidor: {e}")
+        finally:
+            self._cerrar_todo()
+    
+    def _escuchar_unix(self):
+        """
+        Abre el socket Unix para los clientes de esta máquina
+        
+        Si la ruta quedó de un servidor anterior que ya no corre, se
+        reemplaza; si otro servidor la está usando, se sigue solo con TCP.
+        """
+        ruta = self.ruta_unix
+        try:
+            if stat.S_ISSOCK(os.stat(ruta).st_mode):
+                prueba = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
                 try:
-                    cliente_socket, addr = self.server_socket.accept()
-                    self.logger.info(f"📱 Nueva conexión desde {addr}")
-                    
-                    with self.lock:
-                        self.clientes.append(cliente_socket)
-                    
-                    # Enviar estado inicial
-                    self._enviar_estado_inicial(cliente_socket)
+                    prueba.connect(ruta)
+                except OSError:
+                    os.unlink(ruta)  # Huérfano
+                else:
+                    self.logger.warning(f"⚠️ Otro servidor usa {ruta}, se escucha solo por TCP")
+                    self.ruta_unix = None
+                    return
+                finally:
+                    prueba.close()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"⚠️ No se pudo revisar {ruta}: {e}")
+        
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(ruta)
+            sock.listen(128)
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ, self._ACEPTAR)
+        except OSError as e:
+            self.logger.warning(f"⚠️ No se pudo escuchar en {ruta}: {e}")
+            self.ruta_unix = None
+            return
+        self.unix_socket = sock
+        self.logger.info(f"🔌 Escuchando también en {ruta}")
+    
+    def _aceptar(self, escucha: socket.socket):
+        """Acepta todas las conexiones pendientes de un socket de escucha"""
+        while True:
+            try:
+                cliente_socket, addr = escucha.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            if escucha is self.unix_socket:
+                addr = f"unix:{self.ruta_unix}"
+            
+            self.logger.info(f"📱 Nueva conexión desde {addr}")
+            cliente_socket.setblocking(False)
+            conexion = _Conexion(cliente_socket, addr)
+            
+            self._selector.register(cliente_socket, selectors.EVENT_READ, conexion)
+            if self._rueda is not None:
+                conexion.latido = Latido(self.intervalo_ping, self.timeout_ping)
+                self._rueda.programar(conexion, self.intervalo_ping)
+            
+            # Recibe eventos recién con el estado inicial: ninguno queda entre ambos
+            with self.lock:
+                self.clientes.add(conexion)
+            self._enviar_estado_inicial(conexion, alta=True)
+    
+    def _leer(self, conexion: '_Conexion'):
+        """
+        Lee los datos disponibles de una conexión y procesa todas las tramas completas
+        
+        Los comandos encadenados (pipelining) de un mismo lote se procesan
+        seguidos y sus respuestas salen juntas en el siguiente envío.
+        """
+        try:
+            data = conexion.socket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._cerrar_conexion(conexion)
+            return
+        
+        if not data:
+            self._cerrar_conexion(conexion)
+            return
+        
+        # Cualquier dato prueba que el cliente sigue ahí (el temporizador se revisa al vencer)
+        if conexion.latido:
+            conexion.latido.recibido()
+        conexion.decodificador.agregar(data)
+        self._procesar_tramas(conexion)
+    
+    def _procesar_tramas(self, conexion: '_Conexion'):
+        """
+        Procesa los comandos completos recibidos de una conexión
+        
+        Se detiene mientras se construye una instantánea para la conexión:
+        los comandos siguientes esperan en el decodificador, así sus
+        respuestas no se adelantan al estado inicial.
+        """
+        while not conexion.cerrada and not conexion.esperando:
+            # De a una trama: un 'negociar' cambia el formato de las siguientes
+            try:
+                trama = conexion.decodificador.siguiente()
+            except Exception as e:
+                # ErrorProtocolo (o cualquier falla del framing): el flujo ya no es confiable
+                self.logger.warning(f"⚠️ {conexion.direccion}: {e!r}")
+                self._cerrar_conexion(conexion)
+                return
+            if trama is None:
+                return
+            
+            try:
+                mensaje = FORMATOS[conexion.formato].decodificar(trama)
+            except Exception:
+                # Una trama corrupta (o anidada sin límite: RecursionError) no invalida las siguientes
+                mensaje = None
+            if not isinstance(mensaje, dict):
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': 'Comando con formato inválido'})
+                continue
+            # Las respuestas a este comando repiten su id_solicitud
+            conexion.solicitud = mensaje.get('id_solicitud')
+            try:
+                self._procesar_comando(conexion, mensaje)
+            except Exception as e:
+                self.logger.error(f"Error procesando comando: {e}")
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': 'Error interno procesando el comando'})
+            finally:
+                conexion.solicitud = None
+    
+    def _escribir(self, conexion: '_Conexion'):
+        """
+        Envía lo que el socket admita del buffer de salida de una conexión
+        
+        Varias tramas pendientes se envían en una sola llamada al sistema
+        (sendmsg con varios buffers) cuando la plataforma lo permite. Las
+        tramas pueden estar compartidas con otros clientes, así que un envío
+        parcial no las recorta: se avanza un desplazamiento sobre un memoryview.
+        """
+        with self.lock:
+            try:
+                while conexion.salida:
+                    cabeza = memoryview(conexion.salida[0][0])[conexion.enviado:]
+                    if _SENDMSG and len(conexion.salida) > 1:
+                        lote = [cabeza]
+                        lote.extend(trama[0] for trama in itertools.islice(conexion.salida, 1, _MAX_BUFFERS_ENVIO))
+                        enviados = conexion.socket.sendmsg(lote)
+                    else:
+                        lote = [cabeza]
+                        enviados = conexion.socket.send(cabeza)
+                    conexion.pendientes -= enviados
                     
-                    # Manejar cliente en un thread
-                    thread = threading.Thread(
-                        target=self._manejar_cliente,
-                        args=(cliente_socket,),
-                        daemon=True
+                    # Quitar las tramas enviadas completas y avanzar en la parcial
+                    for datos in lote:
+                        if enviados >= len(datos):
+                            enviados -= len(datos)
+                            conexion.salida.popleft()
+                            conexion.enviado = 0
+                        else:
+                            conexion.enviado += enviados
+                            return
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                pass
+            else:
+                # Buffer vacío: dejar de vigilar escritura
+                conexion.escribiendo = False
+                conexion.saturada = False
+                self._selector.modify(conexion.socket, selectors.EVENT_READ, conexion)
+                return
+        
+        self._cerrar_conexion(conexion)
+    
+    def _revisar_latidos(self):
+        """
+        Envía pings a los clientes en silencio y cierra los que no respondieron
+        
+        Solo se revisan las conexiones cuyo temporizador venció; recibir
+        datos no toca la rueda, así que cada conexión cuesta O(1) por
+        intervalo aunque haya miles.
+        """
+        ahora = time.monotonic()
+        for conexion in self._rueda.avanzar(ahora):
+            if conexion.cerrada:
+                continue
+            accion = conexion.latido.revisar(ahora)
+            if accion == 'caido':
+                self.logger.warning(f"💔 {conexion.direccion} no respondió al ping: conexión cerrada")
+                self._cerrar_conexion(conexion)
+                continue
+            if accion == 'ping':
+                self._enviar_mensaje(conexion, {'tipo': 'ping'})
+            self._rueda.programar(conexion, conexion.latido.vence_en(ahora))
+    
+    def _activar_escrituras(self):
+        """Vigila escritura en las conexiones que recibieron datos nuevos"""
+        with self.lock:
+            pendientes, self._por_activar = self._por_activar, []
+            for conexion in pendientes:
+                if not conexion.cerrada:
+                    self._selector.modify(
+                        conexion.socket, selectors.EVENT_READ | selectors.EVENT_WRITE, conexion
                     )
-                    thread.start()
-                    
-                except socket.timeout:
+    
+    def _cerrar_saturadas(self):
+        """Desconecta los clientes lentos marcados por la política 'desconectar'"""
+        with self.lock:
+            saturadas, self._por_cerrar = self._por_cerrar, []
+        for conexion in saturadas:
+            self._cerrar_conexion(conexion)
+    
+    def _encolar(self, conexion: '_Conexion', datos: bytes, clave: Optional[str] = None,
+                 descartable: bool = False):
+        """
+        Agrega datos al buffer de salida de una conexión (seguro desde cualquier thread)
+        
+        El envío real lo hace el bucle de eventos cuando el socket admite escritura.
+        Nunca bloquea: si el cliente acumula más de limite_salida bytes sin leer,
+        se aplica la política de clientes lentos.
+        
+        Args:
+            conexion: Conexión destino
+            datos: Trama codificada
+            clave: Tipo de mensaje coalescible (None si cada mensaje cuenta)
+            descartable: Si es un evento difundido que la política puede
+                descartar (las respuestas directas a un comando nunca se descartan)
+        """
+        despertar = False
+        with self.lock:
+            if conexion.cerrada or conexion.por_cerrar:
+                return
+            
+            if conexion.salida and conexion.pendientes + len(datos) > self.limite_salida:
+                if not self._aplicar_politica(conexion, len(datos), clave):
+                    conexion.por_cerrar = True
+                    self._por_cerrar.append(conexion)
+                    datos = None
+                    despertar = True
+                elif descartable and conexion.pendientes + len(datos) > self.limite_salida:
+                    # Lo pendiente son respuestas directas: el evento nuevo es el que sobra
+                    conexion.descartadas += 1
+                    datos = None
+            
+            if datos is not None:
+                conexion.salida.append((datos, clave, descartable))
+                conexion.pendientes += len(datos)
+                if not conexion.escribiendo:
+                    conexion.escribiendo = True
+                    self._por_activar.append(conexion)
+                    despertar = True
+        
+        # Si el socket ya estaba vigilado para escritura, el bucle lo enviará solo
+        if despertar and threading.current_thread() is not self._hilo_loop:
+            self._despertar()
+    
+    def _aplicar_politica(self, conexion: '_Conexion', tamano: int, clave: Optional[str]) -> bool:
+        """
+        Libera espacio en la salida de un cliente lento (llamar con self.lock tomado)
+        
+        La trama que ya empezó a enviarse nunca se descarta, y solo se
+        descartan eventos difundidos: las respuestas directas (confirmaciones,
+        'cambios', estado inicial) llegan siempre.
+        
+        Args:
+            conexion: Conexión saturada
+            tamano: Bytes de la trama que se quiere encolar
+            clave: Tipo coalescible de esa trama
+        
+        Returns:
+            False si el cliente debe desconectarse
+        """
+        if self.politica_lentos == 'desconectar':
+            self.logger.warning(f"🐢 Cliente lento {conexion.direccion}: desconectado")
+            return False
+        
+        inicio = 1 if conexion.enviado else 0
+        antes = len(conexion.salida)
+        
+        if self.politica_lentos == 'descartar_antiguos':
+            # Los eventos más viejos primero, hasta que alcance el espacio
+            conservadas = []
+            for trama in itertools.islice(conexion.salida, inicio, None):
+                if trama[2] and conexion.pendientes + tamano > self.limite_salida:
+                    conexion.pendientes -= len(trama[0])
                     continue
-                except Exception as e:
-                    if self.activo:
-                        self.logger.error(f"Error en servidor: {e}")
+                conservadas.append(trama)
+            
+            cabeza = [conexion.salida[0]] if inicio else []
+            conexion.salida = deque(cabeza + conservadas)
+        else:
+            # Conservar solo la instantánea más reciente de cada tipo
+            vistas = set() if clave is None else {clave}
+            conservadas = []
+            for trama in reversed(list(itertools.islice(conexion.salida, inicio, None))):
+                if trama[1] is not None and trama[2]:
+                    if trama[1] in vistas:
+                        conexion.pendientes -= len(trama[0])
+                        continue
+                    vistas.add(trama[1])
+                conservadas.append(trama)
+            
+            cabeza = [conexion.salida[0]] if inicio else []
+            conexion.salida = deque(cabeza + conservadas[::-1])
+            
+            if conexion.pendientes + tamano > self.limite_salida:
+                self.logger.warning(f"🐢 Cliente lento {conexion.direccion}: desconectado (no alcanzó con coalescer)")
+                return False
         
-        except Exception as e:
-            self.logger.error(f"Error al iniciar servidor: {e}")
+        descartadas = antes - len(conexion.salida)
+        conexion.descartadas += descartadas
+        if descartadas and not conexion.saturada:
+            conexion.saturada = True
+            self.logger.warning(
+                f"🐢 Cliente lento {conexion.direccion}: descartando mensajes ({self.politica_lentos})"
+            )
+        return True
     
-    def _enviar_estado_inicial(self, cliente_socket):
-        """Envía el estado inicial del hospital al cliente"""
+    def _despertar(self):
+        """Interrumpe el select() del bucle de eventos"""
         try:
-            estado = {
-                'tipo': 'estado_inicial',
-                'medicos': [
-                    {
-                        'nombre': m.name,
-                        'pacientes_atendidos': m.pacientes_atendidos
-                    }
-                    for m in self.hospital.medicos
-                ],
-                'estadisticas': self.hospital.get_estadisticas()
-            }
-            self._enviar_mensaje(cliente_socket, estado)
-        except Exception as e:
-            self.logger.error(f"Error al enviar estado inicial: {e}")
+            self._despertador_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Ya hay un despertar pendiente o el servidor se cerró
     
-    def _manejar_cliente(self, cliente_socket):
-        """Maneja las peticiones de un cliente"""
+    def _vaciar_despertador(self):
+        """Descarta los bytes de despertar acumulados"""
         try:
-            while self.activo:
+            while self._despertador_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+    
+    def _cerrar_conexion(self, conexion: '_Conexion'):
+        """Cierra una conexión y la quita del selector"""
+        with self.lock:
+            if conexion.cerrada:
+                return
+            conexion.cerrada = True
+            self.clientes.discard(conexion)
+            self._desindexar(conexion)
+            conexion.salida.clear()
+            huerfano = conexion is self._dueno_perfilado
+        if huerfano and self.detener_perfilado():
+            self.logger.warning(f"🔥 Perfilado detenido: se cerró la conexión que lo inició ({conexion.direccion})")
+        if self._rueda is not None:
+            self._rueda.cancelar(conexion)
+        try:
+            self._selector.unregister(conexion.socket)
+        except (KeyError, ValueError):
+            pass
+        try:
+            conexion.socket.close()
+        except OSError:
+            pass
+        self.logger.info(f"📴 Conexión cerrada {conexion.direccion}")
+    
+    def _reanudar_lecturas(self):
+        """Procesa los comandos que esperaban la instantánea de su conexión"""
+        with self.lock:
+            conexiones, self._por_reanudar = self._por_reanudar, []
+        for conexion in conexiones:
+            try:
+                self._procesar_tramas(conexion)
+            except Exception as e:
+                self.logger.error(f"❌ Error en la conexión {conexion.direccion}: {e!r}")
+                self._cerrar_conexion(conexion)
+    
+    def _cerrar_todo(self):
+        """Cierra todas las conexiones y los sockets del servidor"""
+        with self.lock:
+            conexiones = list(self.clientes)
+        for conexion in conexiones:
+            self._cerrar_conexion(conexion)
+        
+        for sock in (self.server_socket, self.unix_socket, self._despertador_r, self._despertador_w):
+            if sock:
                 try:
-                    data = cliente_socket.recv(4096)
-                    if not data:
-                        break
-                    
-                    # Procesar comando del cliente
-                    mensaje = json.loads(data.decode('utf-8'))
-                    self._procesar_comando(cliente_socket, mensaje)
-                    
-                except socket.timeout:
-                    continue
-                except Exception as e:
-                    break
+                    sock.close()
+                except OSError:
+                    pass
+        if self.unix_socket:
+            try:
+                os.unlink(self.ruta_unix)
+            except OSError:
+                pass
+        self._selector.close()
+    
+    def _enviar_estado_inicial(self, conexion, alta: bool = False, cambios: Optional[Dict[str, Any]] = None):
+        """
+        Envía el estado inicial del hospital al cliente
         
+        La instantánea se construye en otro thread, no en el bucle de eventos;
+        hasta que se encola, la conexión no procesa más comandos. Se
+        construye sin tomar _lock_difusion y lleva el seq
+        tomado antes de construirla. Los eventos difundidos mientras tanto
+        se envían a continuación desde el historial: el cliente descarta
+        los de seq menor o igual, y los posteriores ya pueden estar
+        reflejados en la instantánea.
+        
+        Args:
+            conexion: Conexión del cliente
+            alta: Si se agrega el cliente a los destinatarios de los eventos
+                (al conectarse) junto con el envío
+            cambios: Respuesta 'cambios' que va antes de la instantánea (sin
+                su seq, que se completa al enviar)
+        """
+        conexion.esperando = True
+        try:
+            self._instantaneas.submit(self._completar_estado_inicial, conexion, alta, cambios, conexion.solicitud)
+        except RuntimeError:
+            conexion.esperando = False  # Servidor deteniéndose
+    
+    def _completar_estado_inicial(self, conexion, alta: bool, cambios: Optional[Dict[str, Any]],
+                                  solicitud):
+        """Construye y encola el estado inicial (en el thread de instantáneas)"""
+        try:
+            while True:
+                mensaje = self.estado_actual()
+                with self._lock_difusion:
+                    completo, eventos, seq = self.cambios_desde(mensaje['seq'], filtro=conexion.filtro)
+                    if completo:
+                        continue  # El historial ya no alcanza: otra instantánea
+                    if alta:
+                        with self.lock:
+                            if conexion.cerrada:
+                                return
+                            self._todos_tipos.add(conexion)
+                    if cambios is not None:
+                        self._enviar_mensaje(conexion, dict(cambios, seq=seq), solicitud)
+                    self._enviar_mensaje(conexion, mensaje, solicitud)
+                    for evento in eventos:
+                        self._encolar(conexion, self._trama(evento, conexion.formato, conexion.compresion), evento.clave)
+                    break
         except Exception as e:
-            self.logger.error(f"Error manejando cliente: {e}")
+            self.logger.error(f"Error al enviar estado inicial: {e}")
         finally:
+            # El bucle sigue con los comandos que quedaron esperando
             with self.lock:
-                if cliente_socket in self.clientes:
-                    self.clientes.remove(cliente_socket)
+                conexion.esperando = False
+                self._por_reanudar.append(conexion)
+            self._despertar()
+    
+    def estado_actual(self) -> Dict[str, Any]:
+        """
+        Instantánea 'estado_inicial' con el seq y la sesión que refleja
+        
+        El seq se toma antes de construir la instantánea, fuera de
+        _lock_difusion (leer las estadísticas puede ir al archivo de
+        expedientes): la instantánea refleja al menos todos los eventos
+        hasta ese seq.
+        
+        Returns:
+            Mensaje listo para enviar a un cliente
+        """
+        with self._lock_difusion:
+            seq, sesion = self.seq, self.sesion
+        mensaje = self._instantanea_estado('estado_inicial')
+        mensaje['seq'] = seq
+        mensaje['sesion'] = sesion
+        return mensaje
+    
+    def _enviar_cambios(self, conexion, desde_seq: int, sesion: Optional[str] = None):
+        """
+        Envía los eventos posteriores a desde_seq
+        
+        Responde con un mensaje 'cambios' seguido de las tramas originales del
+        historial que pasan su filtro (de las instantáneas de estado solo la
+        última). Si el cliente
+        quedó más atrás que el historial, o viene de otra sesión del servidor,
+        recibe en su lugar una instantánea completa.
+        
+        Args:
+            conexion: Conexión del cliente
+            desde_seq: Último seq que el cliente ya aplicó
+            sesion: Sesión del servidor en la que se obtuvo desde_seq
+        """
+        with self._lock_difusion:
+            completo, historicos, _ = self.cambios_desde(desde_seq, sesion, conexion.filtro)
+            respuesta = {
+                'tipo': 'cambios',
+                'desde_seq': desde_seq,
+                'seq': self.seq,
+                'sesion': self.sesion,
+                'completo': completo,
+                'eventos': len(historicos)
+            }
+            if not completo:
+                self._enviar_mensaje(conexion, respuesta)
+                for evento in historicos:
+                    self._encolar(conexion, self._trama(evento, conexion.formato, conexion.compresion), evento.clave)
+                return
+        
+        # La instantánea se construye fuera del lock; la respuesta sale con ella
+        self._enviar_estado_inicial(conexion, cambios=respuesta)
+    
+    def cambios_desde(self, desde_seq: int, sesion: Optional[str] = None,
+                      filtro: Optional['_Filtro'] = None) -> Tuple[bool, List[_EventoDifundido], int]:
+        """
+        Selecciona del historial los eventos posteriores a desde_seq
+        
+        De cada tipo coalescible se devuelve solo la instantánea más reciente.
+        
+        Args:
+            desde_seq: Último seq que el cliente ya aplicó
+            sesion: Sesión del servidor en la que se obtuvo desde_seq
+            filtro: Suscripción del cliente (None para todos los eventos)
+        
+        Returns:
+            (completo, eventos, seq): completo es True si el historial no
+            alcanza (o la sesión cambió) y hace falta una instantánea
+            completa, y en ese caso la lista va vacía; seq es el último
+            número de secuencia considerado
+        """
+        filtro = filtro or _FILTRO_TODOS
+        with self._lock_difusion:
+            primero = self.historial[0].seq if self.historial else self.seq + 1
+            completo = (
+                (sesion is not None and sesion != self.sesion)
+                or desde_seq > self.seq
+                or desde_seq + 1 < primero
+            )
+            
+            eventos = []
+            if not completo:
+                vistas = set()
+                for evento in reversed(self.historial):
+                    if evento.seq <= desde_seq:
+                        break
+                    evento = filtro.evento_para(evento)
+                    if evento is None:
+                        continue
+                    if evento.clave is not None:
+                        if evento.clave in vistas:
+                            continue
+                        vistas.add(evento.clave)
+                    eventos.append(evento)
+                eventos.reverse()
+            return completo, eventos, self.seq
+    
+    def _instantanea_estado(self, tipo: str) -> Dict[str, Any]:
+        """
+        Construye una instantánea del estado del hospital
+        
+        Args:
+            tipo: Tipo del mensaje ('estado_inicial' o 'actualizacion_estado')
+        """
+        return {
+            'tipo': tipo,
+            'medicos': [
+                {
+                    'nombre': m.name,
+                    'pacientes_atendidos': m.pacientes_atendidos
+                }
+                for m in self.hospital.medicos
+            ],
+            'estadisticas': self.hospital.get_estadisticas()
+        }
+    
+    def _firma(self) -> tuple:
+        """
+        Resume el estado con contadores baratos de leer
+        
+        Si la firma no cambia, no hace falta calcular una instantánea nueva.
+        """
+        hospital = self.hospital
+        return (
+            hospital.buffer.obtener_tamano(),
+            sum(p.pacientes_generados for p in hospital.productores),
+            tuple(m.pacientes_atendidos for m in hospital.medicos),
+            sum(1 for h in hospital.productores + hospital.medicos if h.is_alive()),
+            hospital.sistema_expedientes.version,
+            len(hospital.ingesta.pendientes)
+        )
+    
+    def _run_actualizaciones(self):
+        """
+        Difunde instantáneas de estado agrupando los cambios
+        
+        Los cambios llegan por notificar_actualizacion() (eventos del bus);
+        la firma del estado se revisa además cada REVISION_SIN_EVENTOS para
+        lo que no pasa por el bus (por ejemplo, un médico que toma un
+        paciente). Por muchos cambios que ocurran, se difunde como máximo
+        una instantánea por intervalo, calculada una sola vez para todos los
+        clientes.
+        """
+        while not self._detenido.is_set():
+            self._cambios.wait(REVISION_SIN_EVENTOS)
+            # Esperar un intervalo agrupa los cambios y limita la frecuencia aunque no paren
+            if self._detenido.wait(self.intervalo_actualizaciones):
+                break
             try:
-                cliente_socket.close()
-            except:
-                pass
+                firma = self._firma()
+                if self._firma_estado is None:
+                    self._firma_estado = firma  # Los clientes ya recibieron estado_inicial
+                elif self._cambios.is_set() or firma != self._firma_estado:
+                    self._cambios.clear()
+                    self._firma_estado = firma
+                    if self.clientes or self._oyentes:
+                        self._broadcast(self._instantanea_estado('actualizacion_estado'))
+            except Exception as e:
+                self.logger.error(f"Error difundiendo estado: {e}")
     
-    def _procesar_comando(self, cliente_socket, mensaje):
+    def _procesar_comando(self, conexion, mensaje):
         """Procesa un comando del cliente"""
         comando = mensaje.get('comando')
         
         if comando == 'registrar_paciente':
-            # Registrar paciente desde la UI
-            paciente_data = mensaje.get('datos')
-            self.notificar_paciente_registrado(paciente_data)
-            
-            # Confirmar al cliente
-            respuesta = {
-                'tipo': 'confirmacion',
-                'estado': 'ok',
-                'mensaje': 'Paciente registrado correctamente'
-            }
-            self._enviar_mensaje(cliente_socket, respuesta)
+            # Registrar paciente desde la UI: pasa al buffer sin bloquear este thread
+            self._enviar_mensaje(conexion, self.registrar_paciente(
+                mensaje.get('datos'), mensaje.get('clave_idempotencia')
+            ))
+        
+        elif comando == 'registrar_pacientes':
+            # Registrar un lote con una sola confirmación y un solo evento
+            pacientes = mensaje.get('pacientes')
+            if not isinstance(pacientes, list) or not pacientes:
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': 'pacientes debe ser una lista no vacía'})
+            elif len(pacientes) > MAX_LOTE_REGISTRO:
+                self._enviar_mensaje(conexion, {
+                    'tipo': 'error',
+                    'mensaje': f"Lote de {len(pacientes)} pacientes (máximo {MAX_LOTE_REGISTRO})"
+                })
+            else:
+                self._enviar_mensaje(conexion, self.registrar_lote(pacientes))
         
         elif comando == 'obtener_estado':
             # Enviar estado actual
-            self._enviar_estado_inicial(cliente_socket)
+            self._enviar_estado_inicial(conexion)
+        
+        elif comando == 'obtener_cambios':
+            # Enviar solo los eventos posteriores a desde_seq
+            desde_seq = mensaje.get('desde_seq')
+            if not isinstance(desde_seq, int) or desde_seq < 0:
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': 'desde_seq debe ser un entero >= 0'})
+            else:
+                self._enviar_cambios(conexion, desde_seq, mensaje.get('sesion'))
+        
+        elif comando == 'negociar':
+            # Cambiar el formato de trama (y la compresión) de esta conexión
+            formato = mensaje.get('formato', conexion.formato)
+            compresion = mensaje.get('compresion', False)
+            if formato not in FORMATOS:
+                self._enviar_mensaje(conexion, {
+                    'tipo': 'error',
+                    'mensaje': f"Formato desconocido (opciones: {', '.join(FORMATOS)})"
+                })
+            elif not isinstance(compresion, bool):
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': 'compresion debe ser true o false'})
+            else:
+                self.negociar_formato(conexion, formato, compresion)
+        
+        elif comando == 'suscribir':
+            # Recibir solo los eventos que pasan el filtro (sin campos: todos)
+            try:
+                filtro = _Filtro.desde_mensaje(mensaje)
+            except ValueError as e:
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': str(e)})
+            else:
+                self.suscribir(conexion, filtro)
+                self._enviar_mensaje(conexion, dict(filtro.describir(), tipo='suscripcion'))
+        
+        elif comando == 'ping':
+            # Latido iniciado por el cliente
+            self._enviar_mensaje(conexion, {'tipo': 'pong'})
+        
+        elif comando == 'pong':
+            # Respuesta a nuestro ping: ya se registró al leer los datos
+            pass
         
         elif comando == 'obtener_medicos':
             # Enviar lista de médicos
             medicos = [{'nombre': m.name} for m in self.hospital.medicos]
             respuesta = {'tipo': 'medicos', 'medicos': medicos}
-            self._enviar_mensaje(cliente_socket, respuesta)
+            self._enviar_mensaje(conexion, respuesta)
+        
+        elif comando == 'reporte_locks':
+            # Enviar ranking de contención de locks (si el perfilado está activo)
+            perfilador = self.hospital.perfilador_locks
+            criterio = mensaje.get('criterio', 'espera_total')
+            if criterio not in PerfiladorLocks.CAMPOS:
+                self._enviar_mensaje(conexion, {
+                    'tipo': 'error',
+                    'mensaje': f"criterio desconocido: {criterio!r} (válidos: {', '.join(PerfiladorLocks.CAMPOS)})"
+                })
+            else:
+                respuesta = {
+                    'tipo': 'reporte_locks',
+                    'activo': perfilador is not None,
+                    'locks': perfilador.ranking(criterio) if perfilador else []
+                }
+                self._enviar_mensaje(conexion, respuesta)
+        
+        elif comando == 'iniciar_perfilado':
+            # Iniciar perfilado por muestreo de todos los hilos
+            frecuencia = mensaje.get('frecuencia', 100)
+            if (not isinstance(frecuencia, (int, float)) or isinstance(frecuencia, bool)
+                    or not math.isfinite(frecuencia)):
+                self._enviar_mensaje(conexion, {'tipo': 'error', 'mensaje': 'frecuencia debe ser un número'})
+            else:
+                iniciado = self.iniciar_perfilado(frecuencia, conexion)
+                perfilador = self.perfilador_muestreo
+                respuesta = {
+                    'tipo': 'perfilado',
+                    'estado': 'iniciado' if iniciado else 'ya_activo',
+                    'frecuencia': perfilador.frecuencia if perfilador else None
+                }
+                self._enviar_mensaje(conexion, respuesta)
+        
+        elif comando == 'detener_perfilado':
+            # Detener perfilado y enviar pilas en formato collapsed
+            perfilador = self.detener_perfilado()
+            respuesta = {'tipo': 'perfilado', 'estado': 'inactivo'}
+            if perfilador:
+                respuesta['estado'] = 'detenido'
+                respuesta['muestras'] = perfilador.muestras
+                respuesta['colapsado'] = perfilador.colapsado()
+            self._enviar_mensaje(conexion, respuesta)
+    
+    def iniciar_perfilado(self, frecuencia: float = 100, dueno: Optional['_Conexion'] = None) -> bool:
+        """
+        Inicia el perfilador por muestreo
+        
+        Args:
+            frecuencia: Muestras por segundo (se ajusta al rango de 1 a 1000)
+            dueno: Conexión que lo pidió; al cerrarse se detiene el perfilado
+                (None: dura hasta detener_perfilado o hasta detener el servidor)
+        
+        Returns:
+            False si ya había un perfilado en curso
+        """
+        with self.lock:
+            if self.perfilador_muestreo and self.perfilador_muestreo.is_alive():
+                return False
+            self.perfilador_muestreo = PerfiladorMuestreo(frecuencia)
+            self._dueno_perfilado = dueno
+            self.perfilador_muestreo.start()
+        return True
+    
+    def detener_perfilado(self) -> Optional[PerfiladorMuestreo]:
+        """
+        Detiene el perfilador por muestreo
+        
+        Returns:
+            Perfilador detenido con sus muestras, o None si no había uno activo
+        """
+        with self.lock:
+            perfilador = self.perfilador_muestreo
+            self.perfilador_muestreo = None
+            self._dueno_perfilado = None
+        if perfilador:
+            perfilador.detener()
+        return perfilador
     
-    def _enviar_mensaje(self, cliente_socket, mensaje):
-        """Envía un mensaje a un cliente"""
+    def _enviar_mensaje(self, conexion, mensaje, solicitud=None):
+        """
+        Encola un mensaje para un cliente
+        
+        Si se está respondiendo un comando con id_solicitud, el mensaje lo
+        lleva para que el cliente lo asocie a su pedido.
+        
+        Args:
+            conexion: Conexión destino
+            mensaje: Mensaje a enviar
+            solicitud: id_solicitud a repetir si no es el del comando en
+                curso (respuestas que se completan fuera del bucle)
+        """
+        solicitud = solicitud if solicitud is not None else conexion.solicitud
+        if solicitud is not None:
+            mensaje = dict(mensaje, id_solicitud=solicitud)
         try:
-            data = json.dumps(mensaje).encode('utf-8')
-            cliente_socket.sendall(data + b'\n')
+            trama = FORMATOS[conexion.formato].codificar(mensaje)
+            if conexion.compresion:
+                trama = comprimir_trama(trama, conexion.formato, self.umbral_compresion)
+            self._encolar(conexion, trama, _clave_coalescible(mensaje))
         except Exception as e:
             self.logger.error(f"Error al enviar mensaje: {e}")
     
@@ -194,6 +1060,149 @@ class EventServer:
         }
         self._broadcast(mensaje)
     
+    def notificar_pacientes_registrados(self, pacientes: List[Dict]):
+        """
+        Notifica que se registró un lote de pacientes
+        
+        Normalmente en un solo evento; si los pacientes ocupan más de
+        MAX_BYTES_EVENTO_LOTE, en varios eventos consecutivos.
+        """
+        parte, tamano = [], 0
+        for paciente in pacientes:
+            bytes_paciente = len(json.dumps(paciente, ensure_ascii=False).encode('utf-8'))
+            if parte and tamano + bytes_paciente > MAX_BYTES_EVENTO_LOTE:
+                self._broadcast({'tipo': 'pacientes_registrados', 'pacientes': parte})
+                parte, tamano = [], 0
+            parte.append(paciente)
+            tamano += bytes_paciente
+        if parte:
+            self._broadcast({'tipo': 'pacientes_registrados', 'pacientes': parte})
+    
+    def registrar_paciente(self, paciente_data: Any, clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Valida y registra un paciente
+        
+        Con clave_idempotencia, un reintento dentro de la ventana devuelve la
+        respuesta original (marcada como duplicado) sin volver a encolar ni a
+        difundir el paciente. Solo se recuerdan los registros aceptados: tras
+        un rechazo, el reintento se procesa de nuevo. Los reintentos que
+        llegan mientras el primero está en curso (desde otro thread) esperan
+        su respuesta en lugar de procesarse; en el bucle de eventos no se
+        espera: se responde al momento que reintente.
+        
+        Args:
+            paciente_data: Datos del paciente
+            clave_idempotencia: Identificador del registro elegido por el cliente
+        
+        Returns:
+            Respuesta 'confirmacion' con estado 'ok', 'cola_llena' o 'error'
+            ('reintentar': True si el mismo registro sigue en curso)
+        """
+        if clave_idempotencia is not None:
+            if not isinstance(clave_idempotencia, str) or not 0 < len(clave_idempotencia) <= 128:
+                return {'tipo': 'confirmacion', 'estado': 'error',
+                        'mensaje': 'clave_idempotencia debe ser un texto de 1 a 128 caracteres'}
+            # El bucle de eventos atiende a todos los clientes: no puede esperar
+            espera = 0 if threading.current_thread() is self._hilo_loop else ESPERA_IDEMPOTENCIA
+            while True:
+                reserva, propia = self.idempotencia.reservar(clave_idempotencia)
+                if propia:
+                    break
+                try:
+                    original = reserva.result(espera)
+                except futures.TimeoutError:
+                    return {'tipo': 'confirmacion', 'estado': 'error', 'reintentar': True,
+                            'mensaje': 'Hay un registro en curso con la misma clave, reintente'}
+                if original is not None:
+                    return dict(original, duplicado=True)
+                # El primero no fue aceptado: este reintento se procesa
+        
+        respuesta = None
+        try:
+            respuesta = self._registrar_paciente(paciente_data)
+        finally:
+            if clave_idempotencia is not None:
+                aceptada = respuesta is not None and respuesta['estado'] == 'ok'
+                self.idempotencia.completar(clave_idempotencia, reserva, respuesta if aceptada else None)
+        return respuesta
+    
+    def _registrar_paciente(self, paciente_data: Any) -> Dict[str, Any]:
+        """Valida, ingresa y difunde un paciente (registrar_paciente sin idempotencia)"""
+        error = _validar_paciente(paciente_data)
+        if error:
+            return {'tipo': 'confirmacion', 'estado': 'error', 'mensaje': error}
+        
+        resultado = self._ingresar(paciente_data)
+        if resultado['estado'] != 'ok':
+            resultado['mensaje'] = 'Sala de espera llena, reintente más tarde'
+            return dict(resultado, tipo='confirmacion')
+        
+        self.notificar_paciente_registrado(paciente_data)
+        return dict(resultado, tipo='confirmacion', mensaje='Paciente registrado correctamente')
+    
+    def registrar_lote(self, pacientes: List[Any]) -> Dict[str, Any]:
+        """
+        Valida y registra un lote de pacientes
+        
+        Cada paciente válido pasa a la ingesta del hospital; los aceptados se
+        difunden en eventos pacientes_registrados (uno solo salvo lotes muy
+        grandes). Los inválidos o rechazados por cola llena no impiden
+        registrar el resto.
+        
+        Lo que difunde un lote no pasa de la mitad de limite_salida: así un
+        solo comando no deja atrasado a un cliente que lee al día. Los
+        pacientes que no entran se rechazan para enviarlos en otro lote.
+        
+        Args:
+            pacientes: Datos de cada paciente, como en registrar_paciente
+        
+        Returns:
+            Respuesta 'confirmacion_lote' con el resultado de cada paciente
+            en el mismo orden del lote
+        """
+        resultados = []
+        aceptados = []
+        disponible = self.limite_salida // 2  # Bytes que el lote aún puede difundir
+        for indice, datos in enumerate(pacientes):
+            error = _validar_paciente(datos)
+            if not error:
+                tamano = len(json.dumps(datos, ensure_ascii=False).encode('utf-8'))
+                if tamano > disponible:
+                    error = f'el lote supera {self.limite_salida // 2} bytes: envíe este paciente en otro lote'
+            if error:
+                resultados.append({'indice': indice, 'estado': 'error', 'mensaje': error})
+                continue
+            resultado = self._ingresar(datos)
+            resultados.append(dict(resultado, indice=indice))
+            if resultado['estado'] == 'ok':
+                aceptados.append(datos)
+                disponible -= tamano
+        
+        if aceptados:
+            self.notificar_pacientes_registrados(aceptados)
+        
+        return {
+            'tipo': 'confirmacion_lote',
+            'aceptados': len(aceptados),
+            'rechazados': len(pacientes) - len(aceptados),
+            'resultados': resultados
+        }
+    
+    def _ingresar(self, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Lleva un paciente validado a la ingesta del hospital
+        
+        El id asignado se guarda en los datos para que el evento lo difunda.
+        
+        Returns:
+            Resultado de IngestaPacientes.ingresar
+        """
+        resultado = self.hospital.ingesta.ingresar(datos)
+        if resultado['estado'] == 'ok':
+            datos['id'] = resultado['id']
+            self.notificar_actualizacion()
+        return resultado
+    
     def notificar_paciente_atendido(self, paciente_data):
         """Notifica que un paciente fue atendido"""
         mensaje = {
@@ -202,28 +1211,441 @@ class EventServer:
         }
         self._broadcast(mensaje)
     
+    def _al_publicar_bus(self, eventos: List[EventoBus]):
+        """
+        Suscriptor del bus del hospital (thread del bus)
+        
+        Cada paciente atendido se difunde como paciente_atendido; cualquier
+        evento del lote marca el estado como cambiado, y el thread de
+        actualizaciones lo difunde en una sola instantánea.
+        """
+        for evento in eventos:
+            if evento.tipo == 'paciente_atendido':
+                self.notificar_paciente_atendido(evento.datos)
+        self.notificar_actualizacion()
+    
     def notificar_actualizacion(self):
-        """Notifica una actualización general del estado"""
-        mensaje = {
-            'tipo': 'actualizacion_estado',
-            'estadisticas': self.hospital.get_estadisticas()
-        }
-        self._broadcast(mensaje)
+        """
+        Marca que el estado cambió
+        
+        No envía nada inmediatamente: el thread de actualizaciones agrupa los
+        cambios y difunde una sola instantánea por intervalo.
+        """
+        self._cambios.set()
     
-    def _broadcast(self, mensaje):
-        """Envía un mensaje a todos los clientes conectados"""
+    def agregar_oyente(self, oyente: Callable[[_EventoDifundido], None]):
+        """
+        Registra una función que recibe cada evento difundido
+        
+        Se llama desde el thread que difunde, con el lock de difusión tomado
+        (en orden de seq): debe ser rápida y no bloquear, por ejemplo pasar
+        el evento a otro bucle o cola.
+        
+        Args:
+            oyente: Función que recibe el _EventoDifundido (seq, mensaje,
+                tramas, clave, tipo, medico, prioridad)
+        """
+        with self._lock_difusion:
+            self._oyentes = self._oyentes + [oyente]
+    
+    def quitar_oyente(self, oyente: Callable[[_EventoDifundido], None]):
+        """Deja de avisar a un oyente registrado con agregar_oyente"""
+        with self._lock_difusion:
+            self._oyentes = [o for o in self._oyentes if o != oyente]
+    
+    @staticmethod
+    def compilar_filtro(criterios: Dict[str, Any]) -> '_Filtro':
+        """
+        Compila criterios de suscripción (como los del comando suscribir)
+        
+        Args:
+            criterios: {'tipos': [...], 'medicos': [...], 'prioridades': [...]}
+        
+        Raises:
+            ValueError: Si algún criterio no es válido
+        """
+        return _Filtro.desde_mensaje(criterios)
+    
+    def negociar_formato(self, conexion: '_Conexion', formato: str, compresion: bool = False):
+        """
+        Cambia el formato de trama y la compresión de una conexión
+        
+        La confirmación sale todavía en el formato anterior y sin comprimir;
+        todo lo que se encole después (respuestas y eventos) ya usa el nuevo.
+        Los bytes que el cliente haya enviado a continuación se decodifican
+        con el nuevo.
+        
+        Args:
+            conexion: Conexión del cliente
+            formato: Nombre del formato (clave de FORMATOS)
+            compresion: Si es True, los mensajes que superen umbral_compresion
+                se envían comprimidos
+        """
+        with self._lock_difusion:
+            conexion.compresion = False
+            self._enviar_mensaje(conexion, {
+                'tipo': 'negociacion',
+                'formato': formato,
+                'compresion': compresion,
+                'umbral': self.umbral_compresion
+            })
+            _, conexion.decodificador = cambiar_formato(conexion.decodificador, formato)
+            conexion.formato = formato
+            conexion.compresion = compresion
+    
+    def suscribir(self, conexion: '_Conexion', filtro: '_Filtro'):
+        """
+        Reemplaza la suscripción de un cliente y actualiza el índice
+        
+        Args:
+            conexion: Conexión del cliente
+            filtro: Filtro compilado
+        """
         with self.lock:
-            clientes_muertos = []
-            for cliente in self.clientes:
-                try:
-                    self._enviar_mensaje(cliente, mensaje)
-                except:
-                    clientes_muertos.append(cliente)
+            if conexion.cerrada:
+                return
+            self._desindexar(conexion)
+            conexion.filtro = filtro
+            if filtro.tipos is None:
+                self._todos_tipos.add(conexion)
+            else:
+                for tipo in filtro.tipos:
+                    self._indice_tipos[tipo].add(conexion)
+    
+    def _desindexar(self, conexion: '_Conexion'):
+        """Quita una conexión del índice de suscripciones (llamar con self.lock tomado)"""
+        self._todos_tipos.discard(conexion)
+        for tipo in conexion.filtro.tipos or ():
+            self._indice_tipos[tipo].discard(conexion)
+    
+    def _broadcast(self, mensaje):
+        """
+        Encola un mensaje para los clientes suscritos a él
+        
+        El mensaje recibe el siguiente número de secuencia y se guarda en el
+        historial. Se codifica una sola vez por formato (y compresión) y todas las colas
+        comparten la misma trama inmutable, así que el costo por cliente no
+        depende del tamaño del mensaje. Los destinatarios salen del índice por tipo; los
+        filtros por médico o prioridad solo se evalúan para quienes los tienen;
+        los eventos de lote se recortan a los pacientes que cada filtro acepta.
+        """
+        clave = _clave_coalescible(mensaje)
+        tipo = mensaje.get('tipo')
+        medico, prioridad = _campos_filtro(mensaje)
+        
+        # Todo bajo el mismo lock: cada cliente recibe los eventos en orden de seq
+        with self._lock_difusion:
+            mensaje = dict(mensaje, seq=self.seq + 1)
+            try:
+                tramas = {('json', False): FORMATOS['json'].codificar(mensaje)}
+            except Exception as e:
+                self.logger.error(f"Error al codificar mensaje: {e}")
+                return
+            self.seq += 1
+            evento = _EventoDifundido(self.seq, mensaje, tramas, clave, tipo, medico, prioridad)
+            self.historial.append(evento)
+            
+            with self.lock:
+                destinatarios = list(self._todos_tipos)
+                destinatarios.extend(self._indice_tipos.get(tipo, ()))
             
-            # Remover clientes desconectados
-            for cliente in clientes_muertos:
-                self.clientes.remove(cliente)
+            # Los clientes desconectados los detecta el bucle de eventos
+            recortes = {}  # Evento según los criterios de cada filtro (se codifica una vez)
+            for cliente in destinatarios:
+                filtro = cliente.filtro
+                propio = evento
+                if filtro.por_campos:
+                    criterios = (filtro.tipos, filtro.medicos, filtro.prioridades)
+                    if criterios not in recortes:
+                        recortes[criterios] = filtro.evento_para(evento)
+                    propio = recortes[criterios]
+                    if propio is None:
+                        continue
+                self._encolar(cliente, self._trama(propio, cliente.formato, cliente.compresion), clave, descartable=True)
+            
+            for oyente in self._oyentes:
                 try:
-                    cliente.close()
-                except:
-                    pass
+                    oyente(evento)
+                except Exception as e:
+                    self.logger.error(f"Error en oyente de eventos: {e}")
+    
+    def _trama(self, evento: _EventoDifundido, formato: str, compresion: bool = False) -> bytes:
+        """
+        Devuelve la trama de un evento en un formato, codificándola una sola vez
+        
+        Llamar con self._lock_difusion tomado.
+        """
+        variante = (formato, compresion)
+        trama = evento.tramas.get(variante)
+        if trama is None:
+            if compresion:
+                trama = comprimir_trama(self._trama(evento, formato), formato, self.umbral_compresion)
+            else:
+                trama = FORMATOS[formato].codificar(evento.mensaje)
+            evento.tramas[variante] = trama
+        return trama
+
+
+def _campos_filtro(mensaje: dict) -> tuple:
+    """
+    Extrae médico y prioridad de un evento (None si no los tiene)
+    
+    Returns:
+        (medico, prioridad)
+    """
+    return _campos_paciente(mensaje.get('paciente'))
+
+
+def _campos_paciente(paciente) -> tuple:
+    """
+    Extrae médico y prioridad de los datos de un paciente (None si no los tiene)
+    
+    Returns:
+        (medico, prioridad)
+    """
+    if not isinstance(paciente, dict):
+        return None, None
+    medico = paciente.get('doctor_asignado') or paciente.get('medico_asignado')
+    return medico, paciente.get('prioridad')
+
+
+class _CacheIdempotencia:
+    """
+    Respuestas recientes por clave de idempotencia
+    
+    Cada clave guarda un Future: quien la reserva primero procesa el
+    registro y los reintentos concurrentes esperan su respuesta, así un
+    mismo registro no se procesa dos veces aunque lleguen a la vez (por
+    el socket y por la API HTTP, por ejemplo).
+    
+    Acotada en tiempo (ventana) y en cantidad (maximo): las claves más
+    viejas se descartan primero. Segura entre threads.
+    """
+    
+    def __init__(self, ventana: float, maximo: int):
+        """
+        Inicializa la caché
+        
+        Args:
+            ventana: Segundos que se recuerda cada clave
+            maximo: Claves recordadas como máximo
+        """
+        self.ventana = ventana
+        self.maximo = maximo
+        self._entradas: 'OrderedDict[str, tuple]' = OrderedDict()  # {clave: (vence, Future)}, por antigüedad
+        self._lock = threading.Lock()
+    
+    def reservar(self, clave: str) -> Tuple[futures.Future, bool]:
+        """
+        Reserva una clave, o devuelve la reserva existente
+        
+        Returns:
+            (futuro, propia): si propia es True, el llamador procesa el
+            registro y debe llamar a completar(); si no, futuro se resuelve
+            con la respuesta original (None si el primero no fue aceptado)
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self._purgar(ahora)
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                return entrada[1], False
+            futuro = futures.Future()
+            self._entradas[clave] = (ahora + self.ventana, futuro)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+            return futuro, True
+    
+    def completar(self, clave: str, futuro: futures.Future, respuesta: Optional[Dict[str, Any]]):
+        """
+        Resuelve una reserva propia
+        
+        Args:
+            clave: Clave reservada
+            futuro: Futuro devuelto por reservar()
+            respuesta: Respuesta a recordar durante la ventana, o None para
+                liberar la clave (registro no aceptado: se puede reintentar)
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if respuesta is None and entrada is not None and entrada[1] is futuro:
+                del self._entradas[clave]
+        futuro.set_result(respuesta)
+    
+    def _purgar(self, ahora: float):
+        """Descarta las claves vencidas (las más viejas están primero)"""
+        while self._entradas:
+            clave, (vence, _) = next(iter(self._entradas.items()))
+            if vence > ahora:
+                break
+            del self._entradas[clave]
+    
+    def __len__(self) -> int:
+        """Claves recordadas"""
+        with self._lock:
+            return len(self._entradas)
+
+
+def _validar_paciente(datos) -> Optional[str]:
+    """
+    Revisa los datos de un paciente recibidos de un cliente
+    
+    Returns:
+        Mensaje de error, o None si los datos son válidos
+    """
+    if not isinstance(datos, dict):
+        return 'los datos del paciente deben ser un objeto'
+    nombre = datos.get('nombre')
+    if not isinstance(nombre, str) or not nombre.strip():
+        return 'falta el nombre del paciente'
+    prioridad = datos.get('prioridad')
+    if prioridad is not None and (isinstance(prioridad, bool) or prioridad not in (1, 2, 3)):
+        return 'prioridad debe ser 1, 2 o 3'
+    try:
+        tamano = len(json.dumps(datos, ensure_ascii=False).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 'los datos del paciente no son serializables'
+    if tamano > MAX_BYTES_PACIENTE:
+        return f'los datos del paciente ocupan {tamano} bytes (máximo {MAX_BYTES_PACIENTE})'
+    return None
+
+
+def _clave_coalescible(mensaje: dict) -> Optional[str]:
+    """Devuelve el tipo del mensaje si es una instantánea de estado coalescible"""
+    tipo = mensaje.get('tipo')
+    return tipo if tipo in TIPOS_COALESCIBLES else None
+
+
+class _Conexion:
+    """Estado de un cliente conectado al bucle de eventos"""
+    
+    __slots__ = (
+        'socket', 'direccion', 'formato', 'compresion', 'decodificador', 'salida', 'pendientes', 'enviado',
+        'escribiendo', 'saturada', 'descartadas', 'por_cerrar', 'cerrada', 'filtro', 'solicitud', 'latido',
+        'esperando'
+    )
+    
+    def __init__(self, sock: socket.socket, direccion):
+        """
+        Inicializa el estado de la conexión
+        
+        Args:
+            sock: Socket no bloqueante del cliente
+            direccion: Dirección remota
+        """
+        self.socket = sock
+        self.direccion = direccion
+        self.formato = 'json'  # Formato de trama negociado
+        self.compresion = False  # Si se comprimen los mensajes grandes
+        self.solicitud = None  # id_solicitud del comando que se está respondiendo
+        self.decodificador = DecodificadorLineas()  # Bytes recibidos aún sin procesar
+        self.salida = deque()  # Tramas pendientes de enviar: (bytes, clave coalescible, descartable)
+        self.pendientes = 0  # Bytes en salida aún sin enviar
+        self.enviado = 0  # Bytes ya enviados de la primera trama
+        self.escribiendo = False  # Si el selector vigila escritura
+        self.saturada = False  # Si ya se avisó que se están descartando mensajes
+        self.descartadas = 0  # Tramas descartadas por la política de clientes lentos
+        self.por_cerrar = False  # Marcada para desconexión por lenta
+        self.cerrada = False
+        self.filtro = _FILTRO_TODOS  # Suscripción a eventos
+        self.latido: Optional[Latido] = None  # Detección de cliente caído (None sin latidos)
+        self.esperando = False  # Comandos en pausa hasta encolar su instantánea
+
+
+class _Filtro:
+    """
+    Suscripción compilada de un cliente
+    
+    Cada criterio es un conjunto de valores aceptados, o None para no filtrar
+    por ese campo. Un evento que no tiene el campo (por ejemplo una
+    actualización de estado sin médico) pasa el filtro de ese campo.
+    """
+    
+    __slots__ = ('tipos', 'medicos', 'prioridades', 'por_campos')
+    
+    def __init__(self, tipos=None, medicos=None, prioridades=None):
+        """
+        Inicializa el filtro
+        
+        Args:
+            tipos: Tipos de evento aceptados
+            medicos: Nombres de médico aceptados
+            prioridades: Prioridades aceptadas
+        """
+        self.tipos = frozenset(tipos) if tipos is not None else None
+        self.medicos = frozenset(medicos) if medicos is not None else None
+        self.prioridades = frozenset(prioridades) if prioridades is not None else None
+        self.por_campos = self.medicos is not None or self.prioridades is not None
+    
+    @classmethod
+    def desde_mensaje(cls, mensaje: dict) -> '_Filtro':
+        """
+        Compila el filtro de un comando suscribir
+        
+        Args:
+            mensaje: {'comando': 'suscribir', 'tipos': [...], 'medicos': [...], 'prioridades': [...]}
+        
+        Raises:
+            ValueError: Si algún criterio no es válido
+        """
+        tipos = _lista_o_none(mensaje, 'tipos', str)
+        if tipos is not None:
+            desconocidos = set(tipos) - TIPOS_EVENTO
+            if desconocidos:
+                raise ValueError(f"Tipos de evento desconocidos: {', '.join(sorted(desconocidos))}")
+        return cls(tipos, _lista_o_none(mensaje, 'medicos', str), _lista_o_none(mensaje, 'prioridades', int))
+    
+    def acepta(self, tipo, medico, prioridad) -> bool:
+        """Indica si un evento pasa el filtro"""
+        if self.tipos is not None and tipo not in self.tipos:
+            return False
+        if self.medicos is not None and medico is not None and medico not in self.medicos:
+            return False
+        if self.prioridades is not None and prioridad is not None and prioridad not in self.prioridades:
+            return False
+        return True
+    
+    def evento_para(self, evento: _EventoDifundido) -> Optional[_EventoDifundido]:
+        """
+        Devuelve el evento tal como lo recibe quien tiene este filtro
+        
+        Los eventos de lote (TIPOS_LOTE) se filtran paciente por paciente:
+        si el filtro por médico o prioridad descarta algunos, se devuelve
+        una copia con solo los aceptados (y sin tramas codificadas).
+        
+        Returns:
+            El evento (o su copia recortada), o None si no pasa el filtro
+        """
+        if not self.acepta(evento.tipo, evento.medico, evento.prioridad):
+            return None
+        if not self.por_campos or evento.tipo not in TIPOS_LOTE:
+            return evento
+        pacientes = evento.mensaje.get('pacientes') or []
+        aceptados = [p for p in pacientes if self.acepta(evento.tipo, *_campos_paciente(p))]
+        if len(aceptados) == len(pacientes):
+            return evento
+        if not aceptados:
+            return None
+        return evento._replace(mensaje=dict(evento.mensaje, pacientes=aceptados), tramas={})
+    
+    def describir(self) -> Dict[str, Any]:
+        """Filtro en forma serializable (para confirmar la suscripción)"""
+        return {
+            'tipos': sorted(self.tipos) if self.tipos is not None else None,
+            'medicos': sorted(self.medicos) if self.medicos is not None else None,
+            'prioridades': sorted(self.prioridades) if self.prioridades is not None else None
+        }
+
+
+def _lista_o_none(mensaje: dict, campo: str, tipo: type) -> Optional[list]:
+    """Lee un criterio de suscripción: lista de valores del tipo indicado, o None"""
+    valor = mensaje.get(campo)
+    if valor is None:
+        return None
+    if not isinstance(valor, list) or not all(isinstance(v, tipo) and not isinstance(v, bool) for v in valor):
+        raise ValueError(f"'{campo}' debe ser una lista de {tipo.__name__}")
+    return valor
+
+
+# Suscripción por defecto: todos los eventos
+_FILTRO_TODOS = _Filtro()
@@ -11,6 +11,9 @@ from concurrencia.buffer import BufferPacientes
 from concurrencia.productor import ProductorPacientes
 from concurrencia.consumidor import Medico
 from concurrencia.lector_escritor import SistemaExpedientes
+from concurrencia.ingesta import IngestaPacientes
+from core.bus_eventos import BusEventos
+from diagnostico.perfil_locks import PerfiladorLocks, instrumentar_hospital
 
 class Hospital:
     """
@@ -21,10 +24,13 @@ class Hospital:
     - Productores de pacientes (threads)
     - Médicos consumidores (threads)
     - Sistema de expedientes (Lectores-Escritores)
+    - Ingesta de pacientes registrados desde las interfaces
+    - Bus de eventos interno (lo que ocurre en los threads, para las vistas)
     - Servidor de eventos para interfaces
     """
     
-    def __init__(self, capacidad_buffer: int = 5, num_productores: int = 2, num_medicos: int = 3, verbose: bool = True):
+    def __init__(self, capacidad_buffer: int = 5, num_productores: int = 2, num_medicos: int = 3, verbose: bool = True,
+                 perfilar_locks: bool = False):
         """
         Inicializa el hospital con sus componentes
         
@@ -33,6 +39,7 @@ class Hospital:
             num_productores: Número de threads productores
             num_medicos: Número de médicos (threads consumidores)
             verbose: Si es True, muestra logs en consola; si es False, solo en archivo
+            perfilar_locks: Si es True, instrumenta los locks para medir su contención
         """
         # Configurar logging
         os.makedirs('data/logs', exist_ok=True)
@@ -54,9 +61,12 @@ class Hospital:
         # Servidor de eventos (se asignará externamente)
         self.event_server = None
         
+        # Bus de eventos: productores, médicos y expedientes publican en él
+        self.bus = BusEventos()
+        
         # Inicializar componentes
         self.buffer = BufferPacientes(capacidad_buffer)
-        self.sistema_expedientes = SistemaExpedientes()
+        self.sistema_expedientes = SistemaExpedientes(bus=self.bus)
         
         # Crear productores
         self.productores: List[ProductorPacientes] = []
@@ -65,7 +75,8 @@ class Hospital:
                 nombre=f"Productor-{i+1}",
                 buffer=self.buffer,
                 intervalo_min=2,
-                intervalo_max=5
+                intervalo_max=5,
+                bus=self.bus
             )
             self.productores.append(productor)
         
@@ -76,16 +87,29 @@ class Hospital:
             medico = Medico(
                 nombre=nombres_medicos[i] if i < len(nombres_medicos) else f"Dr. Médico-{i+1}",
                 buffer=self.buffer,
-                sistema_expedientes=self.sistema_expedientes
+                sistema_expedientes=self.sistema_expedientes,
+                bus=self.bus
             )
             self.medicos.append(medico)
         
+        # Pacientes registrados desde las interfaces (no bloquea al servidor de eventos)
+        self.ingesta = IngestaPacientes(self.buffer, self.medicos)
+        
+        # Perfilado de contención de locks (opcional)
+        self.perfilador_locks = None
+        if perfilar_locks:
+            self.perfilador_locks = PerfiladorLocks()
+            instrumentar_hospital(self, self.perfilador_locks)
+        
         self.logger.info(f"🏥 Hospital inicializado: {num_productores} productores, {num_medicos} médicos")
     
     def iniciar(self):
         """Inicia todos los threads del hospital"""
         self.logger.info("🚀 Iniciando sistema hospitalario...")
         
+        # El bus primero, para no perder los eventos de los threads
+        self.bus.start()
+        
         # Iniciar productores
         for productor in self.productores:
             productor.start()
@@ -96,6 +120,8 @@ class Hospital:
             medico.start()
             self.logger.info(f"✅ {medico.name} iniciado")
         
+        self.ingesta.start()
+        
         self.logger.info("🟢 Sistema hospitalario en funcionamiento")
     
     def detener(self):
@@ -110,6 +136,8 @@ class Hospital:
         for medico in self.medicos:
             medico.detener()
         
+        self.ingesta.detener()
+        
         # Esperar a que terminen todos los threads
         for productor in self.productores:
             if productor.is_alive():
@@ -121,8 +149,41 @@ class Hospital:
                 medico.join(timeout=2)
             self.logger.info(f"🔴 {medico.name} detenido")
         
+        if self.ingesta.is_alive():
+            self.ingesta.join(timeout=2)
+        
+        # El bus al final: entrega lo que publicaron los threads antes de detenerse
+        self.bus.detener()
+        if self.bus.is_alive():
+            self.bus.join(timeout=2)
+        
         self.logger.info("✅ Sistema hospitalario detenido correctamente")
     
+    def reiniciar_trabajador(self, hilo):
+        """
+        Reemplaza un productor, médico, la ingesta o el bus si terminó inesperadamente
+        
+        Args:
+            hilo: Thread muerto
+        
+        Returns:
+            Thread nuevo ya iniciado
+        """
+        nuevo = hilo.reemplazo()
+        if hilo is self.ingesta:
+            self.ingesta = nuevo
+        elif hilo is self.bus:
+            # Quienes publican pasan al bus nuevo
+            self.bus = nuevo
+            for publicador in self.productores + self.medicos + [self.sistema_expedientes]:
+                publicador.bus = nuevo
+        else:
+            lista = self.productores if isinstance(hilo, ProductorPacientes) else self.medicos
+            lista[lista.index(hilo)] = nuevo
+        nuevo.start()
+        self.logger.warning(f"♻️ {nuevo.name} reiniciado")
+        return nuevo
+    
     def get_estadisticas(self) -> dict:
         """
         Obtiene estadísticas del sistema
@@ -139,6 +200,9 @@ class Hospital:
             'medicos_activos': sum(1 for m in self.medicos if m.is_alive()),
             'pacientes_generados': sum(p.pacientes_generados for p in self.productores),
             'pacientes_atendidos': sum(m.pacientes_atendidos for m in self.medicos),
+            'pacientes_ingresados': self.ingesta.pacientes_ingresados,
+            'pacientes_en_ingesta': len(self.ingesta.pendientes),
+            'bus_eventos': self.bus.obtener_estadisticas(),
             'expedientes': estadisticas_expedientes
         }
     
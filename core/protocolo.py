@@ -0,0 +1,865 @@
+# core/protocolo.py
+"""
+Protocolo de mensajes entre el servidor de eventos y las interfaces
+
+Formatos de trama:
+- json (por defecto): objeto JSON en UTF-8 terminado en salto de línea
+- binario: 4 bytes de longitud (big-endian) seguidos del mensaje en
+  codificación compatible con MessagePack
+
+Toda conexión empieza en json. El cliente puede pedir otro formato con
+{'comando': 'negociar', 'formato': 'binario'} y no debe enviar nada más
+hasta recibir la respuesta 'negociacion', que llega todavía en json. Desde
+ese punto ambos lados usan el formato nuevo.
+
+Con 'compresion': True en el mismo comando, el servidor comprime con zlib
+(y un diccionario compartido, DICCIONARIO_ZLIB) los mensajes que superan su
+umbral. Una trama comprimida se marca así:
+- json: la línea es '~' seguido del mensaje comprimido en base64
+- binario: el bit más alto del prefijo de longitud está encendido
+Los decodificadores aceptan tramas comprimidas en cualquier caso.
+
+Un comando puede llevar 'id_solicitud' (cualquier valor JSON simple): todas
+sus respuestas lo repiten, así el cliente puede tener varios comandos en
+vuelo por la misma conexión (ver SolicitudesPendientes).
+
+Transporte: además del puerto TCP, el servidor escucha en un socket Unix
+(ruta_unix(port)) cuando la plataforma lo permite. conectar() lo prefiere
+si el servidor es local y vuelve a TCP si no está disponible.
+
+Latidos: cualquier lado puede enviar un ping ({'tipo': 'ping'} el servidor,
+{'comando': 'ping'} el cliente) y el otro contesta pong. Cualquier dato
+recibido cuenta como señal de vida, así que solo se envían pings cuando la
+conexión está en silencio (ver Latido).
+"""
+
+import abc
+import base64
+import binascii
+import itertools
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack as _msgpack  # Opcional: la misma codificación, implementada en C
+except ImportError:
+    _msgpack = None
+
+# Tamaño máximo de una trama sin terminar (protege la memoria del servidor)
+MAX_TRAMA = 1024 * 1024
+
+# Niveles de arrays/maps anidados que acepta el decodificador MessagePack
+MAX_ANIDAMIENTO = 32
+
+# Prefijo de longitud de las tramas binarias
+_LARGO = struct.Struct('>I')
+
+# Marcas de trama comprimida
+_BIT_COMPRIMIDA = 0x80000000
+_MARCA_COMPRIMIDA = b'~'
+
+# Diccionario compartido para zlib: claves y valores que se repiten en los
+# mensajes (zlib aprovecha mejor lo que está al final)
+DICCIONARIO_ZLIB = (
+    b'"hora_atencion": null, "tiempo_espera": "diagnostico": "fecha_registro": '
+    b'"productores_activos": "medicos_activos": "pacientes_generados": '
+    b'"capacidad_buffer": "pacientes_en_buffer": "por_prioridad": {"urgente": '
+    b'"normal": "baja": "atendidos": "total": "expedientes": "estadisticas": '
+    b'"Dr. Garc\u00eda", "Dra. Mart\u00ednez", "Dr. L\u00f3pez", "Dra. Rodr\u00edguez", '
+    b'"Dr. S\u00e1nchez", "medicos": [{"nombre": "pacientes_atendidos": '
+    b'{"tipo": "estado_inicial", {"tipo": "actualizacion_estado", '
+    b'{"tipo": "paciente_atendido", "estado": "Atendido", "En espera", '
+    b'"medico_asignado": "doctor_asignado": "hora_llegada": "prioridad": '
+    b'{"tipo": "paciente_registrado", "paciente": {"id": "nombre": "seq": '
+)
+
+
+class ErrorProtocolo(Exception):
+    """Error irrecuperable en el flujo de bytes (la conexión debe cerrarse)"""
+
+
+class _Decodificador(abc.ABC):
+    """
+    Base de los decodificadores incrementales
+    
+    Acepta los bytes tal como llegan de recv(): varias tramas en un mismo
+    segmento, o una trama partida en varios segmentos. siguiente() entrega
+    las tramas de a una, así que se puede cambiar de formato entre dos tramas
+    sin perder los bytes ya recibidos (ver cambiar_formato).
+    """
+    
+    def __init__(self, max_trama: int = MAX_TRAMA):
+        """
+        Inicializa el decodificador
+        
+        Args:
+            max_trama: Bytes máximos de una trama
+        """
+        self.max_trama = max_trama
+        self._buffer = bytearray()
+        self._inicio = 0  # Bytes del buffer ya entregados como tramas
+    
+    def agregar(self, data: bytes):
+        """Agrega bytes recibidos del socket"""
+        self._buffer += data
+    
+    @abc.abstractmethod
+    def siguiente(self) -> Optional[bytes]:
+        """
+        Extrae la siguiente trama completa
+        
+        Returns:
+            La trama, o None si faltan bytes
+        
+        Raises:
+            ErrorProtocolo: Si una trama supera max_trama
+        """
+    
+    def alimentar(self, data: bytes) -> List[bytes]:
+        """
+        Agrega bytes recibidos y extrae todas las tramas completas
+        
+        Args:
+            data: Bytes recibidos del socket
+        
+        Returns:
+            Tramas completas, en orden
+        """
+        self.agregar(data)
+        return list(iter(self.siguiente, None))
+    
+    def resto(self) -> bytes:
+        """Retira y devuelve los bytes recibidos que aún no forman una trama"""
+        data = bytes(self._buffer[self._inicio:])
+        self._buffer = bytearray()
+        self._inicio = 0
+        return data
+    
+    def pendientes(self) -> int:
+        """Bytes recibidos que aún no forman una trama completa"""
+        return len(self._buffer) - self._inicio
+    
+    def _compactar(self):
+        """Descarta del buffer los bytes ya entregados"""
+        if self._inicio:
+            del self._buffer[:self._inicio]
+            self._inicio = 0
+
+
+class DecodificadorLineas(_Decodificador):
+    """Decodificador de tramas delimitadas por salto de línea (formato json)"""
+    
+    def __init__(self, max_trama: int = MAX_TRAMA):
+        super().__init__(max_trama)
+        self._revisado = 0  # Posición hasta la que ya se buscó '\n'
+    
+    def siguiente(self) -> Optional[bytes]:
+        while True:
+            fin = self._buffer.find(b'\n', self._revisado)
+            if fin < 0:
+                self._compactar()
+                self._revisado = len(self._buffer)
+                if len(self._buffer) > self.max_trama:
+                    raise ErrorProtocolo(f"Trama de más de {self.max_trama} bytes sin terminar")
+                return None
+            
+            trama = bytes(self._buffer[self._inicio:fin])
+            self._inicio = self._revisado = fin + 1
+            if trama.startswith(_MARCA_COMPRIMIDA):
+                try:
+                    comprimida = base64.b64decode(trama[1:], validate=True)
+                except binascii.Error:
+                    raise ErrorProtocolo("Trama comprimida con base64 inválido")
+                return descomprimir(comprimida, self.max_trama)
+            if trama.strip():
+                return trama
+    
+    def resto(self) -> bytes:
+        self._revisado = 0
+        return super().resto()
+
+
+class DecodificadorLongitud(_Decodificador):
+    """Decodificador de tramas con prefijo de longitud (formato binario)"""
+    
+    def siguiente(self) -> Optional[bytes]:
+        disponibles = len(self._buffer) - self._inicio
+        if disponibles >= _LARGO.size:
+            (largo,) = _LARGO.unpack_from(self._buffer, self._inicio)
+            comprimida = largo & _BIT_COMPRIMIDA
+            largo &= ~_BIT_COMPRIMIDA
+            if largo > self.max_trama:
+                raise ErrorProtocolo(f"Trama de {largo} bytes (máximo {self.max_trama})")
+            if disponibles >= _LARGO.size + largo:
+                inicio = self._inicio + _LARGO.size
+                self._inicio = inicio + largo
+                trama = bytes(self._buffer[inicio:self._inicio])
+                return descomprimir(trama, self.max_trama) if comprimida else trama
+        
+        self._compactar()
+        return None
+
+
+def codificar(mensaje: dict) -> bytes:
+    """
+    Codifica un mensaje como trama JSON terminada en salto de línea
+    
+    Args:
+        mensaje: Mensaje a enviar
+    
+    Returns:
+        Trama lista para enviar
+    """
+    return json.dumps(mensaje).encode('utf-8') + b'\n'
+
+
+def decodificar(trama: bytes) -> dict:
+    """
+    Decodifica una trama devuelta por DecodificadorLineas
+    
+    Args:
+        trama: Trama sin el salto de línea
+    
+    Returns:
+        Mensaje decodificado
+    
+    Raises:
+        ValueError: Si la trama no es un objeto JSON válido
+    """
+    mensaje = json.loads(trama.decode('utf-8'))
+    if not isinstance(mensaje, dict):
+        raise ValueError("La trama no es un objeto JSON")
+    return mensaje
+
+
+def codificar_binario(mensaje: dict) -> bytes:
+    """
+    Codifica un mensaje como trama binaria con prefijo de longitud
+    
+    Args:
+        mensaje: Mensaje a enviar
+    
+    Returns:
+        Trama lista para enviar
+    """
+    if _msgpack is not None:
+        datos = _msgpack.packb(mensaje, use_bin_type=True)
+    else:
+        datos = empaquetar(mensaje)
+    return _LARGO.pack(len(datos)) + datos
+
+
+def decodificar_binario(trama: bytes) -> dict:
+    """
+    Decodifica una trama devuelta por DecodificadorLongitud
+    
+    Args:
+        trama: Trama sin el prefijo de longitud
+    
+    Returns:
+        Mensaje decodificado
+    
+    Raises:
+        ValueError: Si la trama no es un mapa válido
+    """
+    if _msgpack is not None:
+        try:
+            mensaje = _msgpack.unpackb(trama, raw=False)
+        except Exception as e:
+            raise ValueError(f"Trama MessagePack inválida: {e}")
+    else:
+        mensaje = desempaquetar(trama)
+    if not isinstance(mensaje, dict):
+        raise ValueError("La trama no es un mapa")
+    return mensaje
+
+
+def comprimir_trama(trama: bytes, formato: str, umbral: int) -> bytes:
+    """
+    Comprime una trama ya codificada si supera el umbral
+    
+    Args:
+        trama: Trama completa (con su salto de línea o prefijo de longitud)
+        formato: Formato de la trama ('json' o 'binario')
+        umbral: Bytes a partir de los cuales se comprime
+    
+    Returns:
+        La trama comprimida, o la original si es chica o no se reduce
+    """
+    if len(trama) < umbral:
+        return trama
+    
+    if formato == 'binario':
+        datos = _comprimir(trama[_LARGO.size:])
+        comprimida = _LARGO.pack(len(datos) | _BIT_COMPRIMIDA) + datos
+    else:
+        comprimida = _MARCA_COMPRIMIDA + base64.b64encode(_comprimir(trama[:-1])) + b'\n'
+    return comprimida if len(comprimida) < len(trama) else trama
+
+
+def _comprimir(datos: bytes) -> bytes:
+    """Comprime un mensaje de forma independiente con el diccionario compartido"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS, zdict=DICCIONARIO_ZLIB)
+    return compresor.compress(datos) + compresor.flush()
+
+
+def descomprimir(datos: bytes, max_trama: int = MAX_TRAMA) -> bytes:
+    """
+    Descomprime un mensaje comprimido con comprimir_trama
+    
+    Args:
+        datos: Mensaje comprimido
+        max_trama: Tamaño máximo del mensaje descomprimido
+    
+    Returns:
+        Mensaje sin comprimir
+    
+    Raises:
+        ErrorProtocolo: Si los datos son inválidos o exceden max_trama
+    """
+    descompresor = zlib.decompressobj(zlib.MAX_WBITS, zdict=DICCIONARIO_ZLIB)
+    try:
+        mensaje = descompresor.decompress(datos, max_trama)
+    except zlib.error as e:
+        raise ErrorProtocolo(f"Trama comprimida inválida: {e}")
+    if descompresor.unconsumed_tail:
+        raise ErrorProtocolo(f"Trama descomprimida de más de {max_trama} bytes")
+    if not descompresor.eof:
+        raise ErrorProtocolo("Trama comprimida incompleta")
+    return mensaje
+
+
+# ============================================================
+# Codificación compatible con MessagePack (solo biblioteca estándar)
+# Tipos: None, bool, int (64 bits), float, str, bytes, list/tuple, dict
+# ============================================================
+
+def empaquetar(obj: Any) -> bytes:
+    """
+    Codifica un valor en formato MessagePack
+    
+    Args:
+        obj: Valor a codificar
+    
+    Returns:
+        Bytes codificados
+    
+    Raises:
+        TypeError: Si el valor contiene un tipo no soportado
+    """
+    salida = bytearray()
+    _empaquetar(obj, salida)
+    return bytes(salida)
+
+
+def _empaquetar(obj: Any, salida: bytearray):
+    """Agrega a salida la codificación de obj"""
+    if obj is None:
+        salida.append(0xc0)
+    elif obj is True:
+        salida.append(0xc3)
+    elif obj is False:
+        salida.append(0xc2)
+    elif isinstance(obj, int):
+        _empaquetar_entero(obj, salida)
+    elif isinstance(obj, float):
+        salida.append(0xcb)
+        salida += struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        datos = obj.encode('utf-8')
+        _encabezado(len(datos), salida, 0xa0, 31, (0xd9, 0xda, 0xdb))
+        salida += datos
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        datos = bytes(obj)
+        _encabezado(len(datos), salida, None, 0, (0xc4, 0xc5, 0xc6))
+        salida += datos
+    elif isinstance(obj, (list, tuple)):
+        _encabezado(len(obj), salida, 0x90, 15, (None, 0xdc, 0xdd))
+        for valor in obj:
+            _empaquetar(valor, salida)
+    elif isinstance(obj, dict):
+        _encabezado(len(obj), salida, 0x80, 15, (None, 0xde, 0xdf))
+        for clave, valor in obj.items():
+            _empaquetar(clave, salida)
+            _empaquetar(valor, salida)
+    else:
+        raise TypeError(f"Tipo no soportado: {type(obj).__name__}")
+
+
+def _empaquetar_entero(n: int, salida: bytearray):
+    """Agrega un entero con la codificación más corta posible"""
+    if 0 <= n <= 0x7f:
+        salida.append(n)
+    elif -32 <= n < 0:
+        salida.append(n & 0xff)
+    elif n >= 0:
+        for codigo, formato, maximo in ((0xcc, '>B', 0xff), (0xcd, '>H', 0xffff),
+                                        (0xce, '>I', 0xffffffff), (0xcf, '>Q', 0xffffffffffffffff)):
+            if n <= maximo:
+                salida.append(codigo)
+                salida += struct.pack(formato, n)
+                return
+        raise OverflowError("Entero demasiado grande para MessagePack")
+    else:
+        for codigo, formato, minimo in ((0xd0, '>b', -0x80), (0xd1, '>h', -0x8000),
+                                        (0xd2, '>i', -0x80000000), (0xd3, '>q', -0x8000000000000000)):
+            if n >= minimo:
+                salida.append(codigo)
+                salida += struct.pack(formato, n)
+                return
+        raise OverflowError("Entero demasiado grande para MessagePack")
+
+
+def _encabezado(largo: int, salida: bytearray, fijo: Optional[int], max_fijo: int, codigos: tuple):
+    """Agrega el encabezado de un str/bin/array/map según su largo"""
+    if fijo is not None and largo <= max_fijo:
+        salida.append(fijo | largo)
+    elif codigos[0] is not None and largo <= 0xff:
+        salida.append(codigos[0])
+        salida.append(largo)
+    elif largo <= 0xffff:
+        salida.append(codigos[1])
+        salida += struct.pack('>H', largo)
+    else:
+        salida.append(codigos[2])
+        salida += struct.pack('>I', largo)
+
+
+def desempaquetar(datos: bytes) -> Any:
+    """
+    Decodifica un valor en formato MessagePack
+    
+    Args:
+        datos: Bytes codificados (un único valor)
+    
+    Returns:
+        Valor decodificado (los arrays se devuelven como listas)
+    
+    Raises:
+        ValueError: Si los datos están truncados, sobran bytes, usan un tipo no
+            soportado o anidan más de MAX_ANIDAMIENTO niveles
+    """
+    try:
+        valor, fin = _desempaquetar(memoryview(datos), 0, 0)
+    except (IndexError, struct.error):
+        raise ValueError("Datos MessagePack truncados")
+    except ValueError:
+        raise
+    except Exception as e:
+        # Cualquier otra falla es un dato inválido del cliente, no un error del servidor
+        raise ValueError(f"Datos MessagePack inválidos: {e!r}")
+    if fin != len(datos):
+        raise ValueError("Sobran bytes después del valor MessagePack")
+    return valor
+
+
+def _desempaquetar(datos: memoryview, i: int, nivel: int) -> Tuple[Any, int]:
+    """
+    Decodifica el valor que empieza en i y devuelve (valor, posición siguiente)
+    
+    nivel es la cantidad de arrays/maps que lo contienen.
+    """
+    codigo = datos[i]
+    i += 1
+    
+    if codigo <= 0x7f:
+        return codigo, i
+    if codigo >= 0xe0:
+        return codigo - 0x100, i
+    if 0xa0 <= codigo <= 0xbf:
+        return _texto(datos, i, codigo & 0x1f)
+    if 0x90 <= codigo <= 0x9f:
+        return _lista(datos, i, codigo & 0x0f, nivel)
+    if 0x80 <= codigo <= 0x8f:
+        return _mapa(datos, i, codigo & 0x0f, nivel)
+    
+    if codigo == 0xc0:
+        return None, i
+    if codigo == 0xc2:
+        return False, i
+    if codigo == 0xc3:
+        return True, i
+    
+    if codigo in _NUMEROS:
+        formato = _NUMEROS[codigo]
+        return formato.unpack_from(datos, i)[0], i + formato.size
+    if codigo in _LARGOS:
+        tipo, formato = _LARGOS[codigo]
+        largo = formato.unpack_from(datos, i)[0]
+        i += formato.size
+        if tipo == 'str':
+            return _texto(datos, i, largo)
+        if tipo == 'bin':
+            if i + largo > len(datos):
+                raise IndexError
+            return bytes(datos[i:i + largo]), i + largo
+        if tipo == 'array':
+            return _lista(datos, i, largo, nivel)
+        return _mapa(datos, i, largo, nivel)
+    
+    raise ValueError(f"Código MessagePack no soportado: 0x{codigo:02x}")
+
+
+def _texto(datos: memoryview, i: int, largo: int) -> Tuple[str, int]:
+    """Decodifica un str de largo bytes"""
+    if i + largo > len(datos):
+        raise IndexError
+    return str(datos[i:i + largo], 'utf-8'), i + largo
+
+
+def _lista(datos: memoryview, i: int, largo: int, nivel: int) -> Tuple[list, int]:
+    """Decodifica un array de largo elementos"""
+    if nivel >= MAX_ANIDAMIENTO:
+        raise ValueError(f"MessagePack anidado en más de {MAX_ANIDAMIENTO} niveles")
+    lista = []
+    for _ in range(largo):
+        valor, i = _desempaquetar(datos, i, nivel + 1)
+        lista.append(valor)
+    return lista, i
+
+
+def _mapa(datos: memoryview, i: int, largo: int, nivel: int) -> Tuple[dict, int]:
+    """Decodifica un map de largo pares (las claves deben ser valores simples)"""
+    if nivel >= MAX_ANIDAMIENTO:
+        raise ValueError(f"MessagePack anidado en más de {MAX_ANIDAMIENTO} niveles")
+    mapa = {}
+    for _ in range(largo):
+        clave, i = _desempaquetar(datos, i, nivel + 1)
+        if isinstance(clave, (list, dict)):
+            raise ValueError("Clave de map MessagePack no válida")
+        valor, i = _desempaquetar(datos, i, nivel + 1)
+        mapa[clave] = valor
+    return mapa, i
+
+
+_NUMEROS = {
+    0xca: struct.Struct('>f'), 0xcb: struct.Struct('>d'),
+    0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'), 0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q'),
+    0xd0: struct.Struct('>b'), 0xd1: struct.Struct('>h'), 0xd2: struct.Struct('>i'), 0xd3: struct.Struct('>q'),
+}
+
+_LARGOS = {
+    0xd9: ('str', struct.Struct('>B')), 0xda: ('str', struct.Struct('>H')), 0xdb: ('str', struct.Struct('>I')),
+    0xc4: ('bin', struct.Struct('>B')), 0xc5: ('bin', struct.Struct('>H')), 0xc6: ('bin', struct.Struct('>I')),
+    0xdc: ('array', struct.Struct('>H')), 0xdd: ('array', struct.Struct('>I')),
+    0xde: ('map', struct.Struct('>H')), 0xdf: ('map', struct.Struct('>I')),
+}
+
+
+# ============================================================
+# Formatos negociables
+# ============================================================
+
+Formato = namedtuple('Formato', 'nombre codificar decodificar decodificador')
+
+FORMATOS = {
+    'json': Formato('json', codificar, decodificar, DecodificadorLineas),
+    'binario': Formato('binario', codificar_binario, decodificar_binario, DecodificadorLongitud),
+}
+
+
+def cambiar_formato(decodificador: _Decodificador, nombre: str) -> Tuple[Formato, _Decodificador]:
+    """
+    Pasa a otro formato conservando los bytes ya recibidos
+    
+    Args:
+        decodificador: Decodificador actual (se vacía)
+        nombre: Formato nuevo
+    
+    Returns:
+        (formato, decodificador nuevo con los bytes pendientes)
+    """
+    formato = FORMATOS[nombre]
+    nuevo = formato.decodificador(decodificador.max_trama)
+    nuevo.agregar(decodificador.resto())
+    return formato, nuevo
+
+
+# ============================================================
+# Transporte
+# ============================================================
+
+# Hosts que se consideran esta misma máquina
+HOSTS_LOCALES = {'localhost', '127.0.0.1', '::1'}
+
+
+def ruta_unix(port: int) -> str:
+    """
+    Ruta del socket Unix del servidor que escucha en un puerto
+    
+    Args:
+        port: Puerto TCP del servidor
+    
+    Returns:
+        Ruta en el directorio temporal del sistema
+    """
+    return os.path.join(tempfile.gettempdir(), f"hospital-{port}.sock")
+
+
+def conectar(host: str, port: int, timeout: Optional[float] = None,
+             ruta: Optional[str] = None) -> socket.socket:
+    """
+    Conecta con el servidor de eventos por el transporte más barato
+    
+    Si el servidor es local y su socket Unix existe, se usa ese (menos
+    latencia y sin pila TCP); si no, o si falla, se conecta por TCP.
+    
+    Args:
+        host: Host del servidor
+        port: Puerto TCP del servidor
+        timeout: Timeout del socket (None para bloqueante)
+        ruta: Ruta del socket Unix (default: ruta_unix(port))
+    
+    Returns:
+        Socket conectado
+    
+    Raises:
+        OSError: Si no se pudo conectar por ningún transporte
+    """
+    if hasattr(socket, 'AF_UNIX') and host in HOSTS_LOCALES:
+        ruta = ruta or ruta_unix(port)
+        if os.path.exists(ruta):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(ruta)
+                return sock
+            except OSError:
+                sock.close()  # Socket huérfano de un servidor que ya no corre
+    return socket.create_connection((host, port), timeout=timeout)
+
+
+# ============================================================
+# Correlación de pedidos y respuestas (lado cliente)
+# ============================================================
+
+class SolicitudesPendientes:
+    """
+    Tabla de comandos en vuelo de un cliente, indexada por id_solicitud
+    
+    Cada comando enviado con registrar() recibe un id y un Future que se
+    resuelve con su respuesta, falla con TimeoutError si no llega a tiempo
+    o con ConnectionError si se pierde la conexión. Es segura entre threads:
+    normalmente registra el thread de la interfaz y resuelve el receptor.
+    """
+    
+    def __init__(self, timeout: float = 10.0):
+        """
+        Inicializa la tabla
+        
+        Args:
+            timeout: Segundos por defecto para recibir cada respuesta
+        """
+        self.timeout = timeout
+        self._pendientes: Dict[int, Tuple[Future, float]] = {}  # {id: (future, vence)}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def registrar(self, comando: dict, timeout: Optional[float] = None) -> Tuple[dict, Future]:
+        """
+        Asigna un id a un comando y crea el Future de su respuesta
+        
+        Args:
+            comando: Comando a enviar (no se modifica)
+            timeout: Segundos para recibir la respuesta (None: el de la tabla)
+        
+        Returns:
+            (comando con id_solicitud, future de la respuesta)
+        """
+        futuro = Future()
+        futuro.set_running_or_notify_cancel()
+        vence = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            id_solicitud = next(self._ids)
+            self._pendientes[id_solicitud] = (futuro, vence)
+        return dict(comando, id_solicitud=id_solicitud), futuro
+    
+    def resolver(self, respuesta: dict) -> bool:
+        """
+        Entrega una respuesta al Future de su pedido
+        
+        Args:
+            respuesta: Mensaje recibido del servidor
+        
+        Returns:
+            True si la respuesta correspondía a un pedido pendiente
+        """
+        with self._lock:
+            pendiente = self._pendientes.pop(respuesta.get('id_solicitud'), None)
+        if pendiente is None:
+            return False
+        pendiente[0].set_result(respuesta)
+        return True
+    
+    def vencer(self) -> int:
+        """
+        Hace fallar los pedidos cuyo plazo terminó
+        
+        Returns:
+            Cantidad de pedidos vencidos
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            vencidos = [i for i, (_, vence) in self._pendientes.items() if vence <= ahora]
+            futuros = [self._pendientes.pop(i)[0] for i in vencidos]
+        for futuro in futuros:
+            futuro.set_exception(TimeoutError("El servidor no respondió a tiempo"))
+        return len(futuros)
+    
+    def cancelar_todas(self, motivo: str = "Conexión perdida"):
+        """Hace fallar todos los pedidos pendientes (por ejemplo al desconectarse)"""
+        with self._lock:
+            futuros = [futuro for futuro, _ in self._pendientes.values()]
+            self._pendientes.clear()
+        for futuro in futuros:
+            futuro.set_exception(ConnectionError(motivo))
+    
+    def __len__(self) -> int:
+        """Cantidad de pedidos en vuelo"""
+        with self._lock:
+            return len(self._pendientes)
+
+
+# ============================================================
+# Latidos y detección de pares caídos
+# ============================================================
+
+# Latido de las interfaces: silencio del servidor antes de enviarle un ping, y
+# espera de la respuesta antes de dar la conexión por caída
+INTERVALO_PING_CLIENTE = 15
+TIMEOUT_PING_CLIENTE = 10
+
+
+class Latido:
+    """
+    Detección de un par caído (conexión medio abierta) en una conexión
+    
+    Tras intervalo segundos sin recibir nada se envía un ping; si pasan
+    timeout segundos más sin recibir nada, el par se da por caído. No usa
+    threads ni timers propios: quien lo usa llama a revisar() cuando le
+    conviene (el bucle del servidor, el receptor de un cliente).
+    """
+    
+    __slots__ = ('intervalo', 'timeout', 'ultimo_recibido', 'ping_enviado')
+    
+    def __init__(self, intervalo: float, timeout: float):
+        """
+        Inicializa el latido
+        
+        Args:
+            intervalo: Segundos de silencio antes de enviar un ping
+            timeout: Segundos de espera de respuesta al ping
+        """
+        self.intervalo = intervalo
+        self.timeout = timeout
+        self.ultimo_recibido = time.monotonic()
+        self.ping_enviado: Optional[float] = None  # Momento del ping sin respuesta
+    
+    def recibido(self, ahora: Optional[float] = None):
+        """Registra que llegaron datos del par (cualquier mensaje, no solo pong)"""
+        self.ultimo_recibido = time.monotonic() if ahora is None else ahora
+        self.ping_enviado = None
+    
+    def revisar(self, ahora: Optional[float] = None) -> str:
+        """
+        Decide qué hacer con la conexión en este momento
+        
+        Returns:
+            'ping' si hay que enviar un ping (se da por enviado), 'caido' si
+            el par no respondió a tiempo, u 'ok'
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        if self.ping_enviado is not None:
+            return 'caido' if ahora - self.ping_enviado >= self.timeout else 'ok'
+        if ahora - self.ultimo_recibido >= self.intervalo:
+            self.ping_enviado = ahora
+            return 'ping'
+        return 'ok'
+    
+    def vence_en(self, ahora: Optional[float] = None) -> float:
+        """Segundos hasta que revisar() pueda devolver algo distinto de 'ok'"""
+        ahora = time.monotonic() if ahora is None else ahora
+        if self.ping_enviado is not None:
+            return max(0.0, self.ping_enviado + self.timeout - ahora)
+        return max(0.0, self.ultimo_recibido + self.intervalo - ahora)
+
+
+class RuedaTemporizadores:
+    """
+    Rueda de temporizadores (timing wheel) de resolución fija
+    
+    Programar y cancelar cuestan O(1) y avanzar cuesta O(vencidos), sin
+    importar cuántos temporizadores haya: sirve para vigilar miles de
+    conexiones desde un solo thread. Cada elemento tiene como mucho un
+    temporizador; los plazos más largos que la vuelta completa vencen antes
+    de tiempo y quien los recibe vuelve a programarlos con lo que falta.
+    
+    No es segura entre threads: se usa desde el bucle de eventos.
+    """
+    
+    def __init__(self, resolucion: float = 1.0, ranuras: int = 64):
+        """
+        Inicializa la rueda
+        
+        Args:
+            resolucion: Segundos que cubre cada ranura
+            ranuras: Cantidad de ranuras (una vuelta = resolucion * ranuras)
+        """
+        self.resolucion = resolucion
+        self._ranuras: List[set] = [set() for _ in range(ranuras)]
+        self._ubicacion: Dict[Any, int] = {}  # {elemento: índice de su ranura}
+        self._actual = 0
+        self._proximo_tick = time.monotonic() + resolucion
+    
+    def programar(self, elemento, retraso: float):
+        """Programa (o reprograma) el vencimiento de un elemento"""
+        self.cancelar(elemento)
+        ticks = min(len(self._ranuras) - 1, max(1, int(-(-retraso // self.resolucion))))
+        indice = (self._actual + ticks) % len(self._ranuras)
+        self._ranuras[indice].add(elemento)
+        self._ubicacion[elemento] = indice
+    
+    def cancelar(self, elemento):
+        """Quita el temporizador de un elemento (si tenía)"""
+        indice = self._ubicacion.pop(elemento, None)
+        if indice is not None:
+            self._ranuras[indice].discard(elemento)
+    
+    def avanzar(self, ahora: Optional[float] = None) -> List[Any]:
+        """
+        Avanza la rueda hasta el momento indicado
+        
+        Returns:
+            Elementos vencidos (ya sin temporizador)
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        vencidos = []
+        while ahora >= self._proximo_tick:
+            self._actual = (self._actual + 1) % len(self._ranuras)
+            ranura = self._ranuras[self._actual]
+            if ranura:
+                for elemento in ranura:
+                    del self._ubicacion[elemento]
+                vencidos.extend(ranura)
+                ranura.clear()
+            self._proximo_tick += self.resolucion
+        return vencidos
+    
+    def espera(self, ahora: Optional[float] = None) -> float:
+        """Segundos hasta el próximo tick"""
+        ahora = time.monotonic() if ahora is None else ahora
+        return max(0.0, self._proximo_tick - ahora)
+    
+    def __len__(self) -> int:
+        """Temporizadores programados"""
+        return len(self._ubicacion)
+
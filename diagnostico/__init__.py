@@ -0,0 +1,15 @@
+# diagnostico/__init__.py
+"""
+Módulo de diagnóstico del sistema hospitalario
+Herramientas opcionales para medir el comportamiento de la concurrencia
+"""
+
+from .perfil_locks import LockInstrumentado, PerfiladorLocks, instrumentar_hospital
+from .trazas import Trazador, trazador
+from .muestreo import PerfiladorMuestreo
+from .vigilante import Vigilante, volcar_pilas
+
+__all__ = [
+    'LockInstrumentado', 'PerfiladorLocks', 'instrumentar_hospital',
+    'Trazador', 'trazador', 'PerfiladorMuestreo', 'Vigilante', 'volcar_pilas'
+]
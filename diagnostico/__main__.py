@@ -0,0 +1,27 @@
+# diagnostico/__main__.py
+"""
+Herramientas de diagnóstico contra un servidor en ejecución
+
+Uso:
+    python -m diagnostico locks [opciones]      # Ranking de contención de locks
+    python -m diagnostico muestreo [opciones]   # Perfilado por muestreo (flamegraph)
+"""
+
+import sys
+from .perfil_locks import main as reporte_locks
+from .muestreo import main as perfilar_muestreo
+
+COMANDOS = {
+    'locks': reporte_locks,
+    'muestreo': perfilar_muestreo,
+}
+
+def main():
+    """Despacha el subcomando indicado"""
+    if len(sys.argv) < 2 or sys.argv[1] not in COMANDOS:
+        print(__doc__)
+        sys.exit(1)
+    COMANDOS[sys.argv[1]](sys.argv[2:])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# diagnostico/muestreo.py
+"""
+Perfilador por muestreo de todos los hilos del hospital
+Toma la pila de cada hilo con sys._current_frames() a una frecuencia fija
+y genera salida "collapsed stacks" para herramientas de flamegraph
+(flamegraph.pl, speedscope, inferno)
+
+Uso contra un servidor en ejecución:
+    python -m diagnostico muestreo --segundos 30 --salida perfil.txt
+"""
+
+import sys
+import os
+import threading
+import time
+import logging
+from collections import Counter
+from typing import Optional
+
+# Muestras por segundo admitidas: más de 1000 solo mide al propio perfilador
+FRECUENCIA_MINIMA = 1
+FRECUENCIA_MAXIMA = 1000
+
+class PerfiladorMuestreo(threading.Thread):
+    """
+    Thread que muestrea periódicamente las pilas de todos los hilos
+
+    Cada muestra se acumula como una línea "hilo;func_externa;...;func_interna"
+    con su número de apariciones. El costo por muestra es proporcional al
+    número de hilos y a la profundidad de sus pilas, no a la carga del hospital.
+    """
+
+    def __init__(self, frecuencia: float = 100, profundidad_max: int = 64):
+        """
+        Inicializa el perfilador (no muestrea hasta llamar start())
+
+        Args:
+            frecuencia: Muestras por segundo (se ajusta al rango
+                FRECUENCIA_MINIMA..FRECUENCIA_MAXIMA)
+            profundidad_max: Marcos máximos por pila (los más externos se truncan)
+        """
+        super().__init__(name="PerfiladorMuestreo", daemon=True)
+        frecuencia = min(max(frecuencia, FRECUENCIA_MINIMA), FRECUENCIA_MAXIMA)
+        self.intervalo = 1.0 / frecuencia
+        self.frecuencia = frecuencia
+        self.profundidad_max = profundidad_max
+        self.pilas = Counter()
+        self.muestras = 0
+        self._mutex = threading.Lock()  # Protege pilas y muestras
+        self._detener = threading.Event()
+        self._etiquetas = {}  # Cache {code: etiqueta}
+        self.logger = logging.getLogger(__name__)
+
+    def run(self):
+        """Ejecuta el bucle de muestreo"""
+        self.logger.info(f"🔥 Perfilado por muestreo iniciado a {self.frecuencia} Hz")
+        while not self._detener.wait(self.intervalo):
+            self._muestrear()
+        self.logger.info(f"🔥 Perfilado detenido. Muestras: {self.muestras}")
+
+    def _muestrear(self):
+        """Toma una muestra de la pila de cada hilo"""
+        nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+        propio = threading.get_ident()
+        nuevas = []
+
+        for ident, frame in sys._current_frames().items():
+            if ident == propio:
+                continue
+
+            marcos = []
+            while frame is not None and len(marcos) < self.profundidad_max:
+                marcos.append(self._etiqueta(frame.f_code))
+                frame = frame.f_back
+
+            nombre = nombres.get(ident, f"hilo-{ident}").replace(';', ':')
+            marcos.append(nombre)
+            marcos.reverse()
+            nuevas.append(';'.join(marcos))
+
+        with self._mutex:
+            self.pilas.update(nuevas)
+            self.muestras += 1
+
+    def _etiqueta(self, code) -> str:
+        """Obtiene la etiqueta 'funcion (archivo:línea)' de un objeto code"""
+        etiqueta = self._etiquetas.get(code)
+        if etiqueta is None:
+            archivo = os.path.basename(code.co_filename)
+            etiqueta = f"{code.co_name} ({archivo}:{code.co_firstlineno})".replace(';', ':')
+            self._etiquetas[code] = etiqueta
+        return etiqueta
+
+    def colapsado(self) -> str:
+        """
+        Genera la salida en formato collapsed stacks
+
+        Returns:
+            Una línea "pila conteo" por cada pila distinta
+        """
+        with self._mutex:
+            pilas = list(self.pilas.items())
+        return "\n".join(f"{pila} {conteo}" for pila, conteo in sorted(pilas))
+
+    def exportar(self, ruta: str) -> int:
+        """
+        Escribe la salida collapsed en un archivo
+
+        Args:
+            ruta: Archivo de destino
+
+        Returns:
+            Número de muestras tomadas
+        """
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(self.colapsado() + "\n")
+        return self.muestras
+
+    def detener(self, timeout: Optional[float] = 2):
+        """Detiene el muestreo y espera a que termine el thread"""
+        self._detener.set()
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+
+def main(argv=None):
+    """Perfila un servidor en ejecución durante un tiempo y guarda el resultado"""
+    import argparse
+    import json
+    import select
+    import socket
+
+    parser = argparse.ArgumentParser(
+        prog="python -m diagnostico muestreo",
+        description="Perfilado por muestreo de un servidor en ejecución"
+    )
+    parser.add_argument("--host", default="localhost", help="Host del servidor (default: localhost)")
+    parser.add_argument("--port", type=int, default=5555, help="Puerto del servidor (default: 5555)")
+    parser.add_argument("--segundos", type=float, default=10, help="Duración del perfilado (default: 10)")
+    parser.add_argument("--frecuencia", type=float, default=100, help="Muestras por segundo (default: 100)")
+    parser.add_argument("--salida", default="perfil.txt", help="Archivo collapsed de salida (default: perfil.txt)")
+    args = parser.parse_args(argv)
+
+    def enviar(sock, comando):
+        sock.sendall(json.dumps(comando).encode('utf-8') + b'\n')
+
+    with socket.create_connection((args.host, args.port), timeout=10) as sock:
+        enviar(sock, {'comando': 'iniciar_perfilado', 'frecuencia': args.frecuencia})
+        print(f"🔥 Perfilando durante {args.segundos}s a {args.frecuencia} Hz...")
+
+        # Mientras tanto se leen los mensajes y se contestan los pings: si no,
+        # el servidor da la conexión por caída y se pierde el perfil
+        fin = time.monotonic() + args.segundos
+        detenido = False
+        buffer = b""
+        while True:
+            if not detenido and time.monotonic() >= fin:
+                enviar(sock, {'comando': 'detener_perfilado'})
+                detenido = True
+            espera = 10 if detenido else max(0.0, fin - time.monotonic())
+            listos, _, _ = select.select([sock], [], [], espera)
+            if not listos:
+                if detenido:
+                    print("❌ El servidor no envió el perfil")
+                    return
+                continue
+
+            data = sock.recv(65536)
+            if not data:
+                print("❌ El servidor cerró la conexión")
+                return
+            buffer += data
+            while b'\n' in buffer:
+                linea, buffer = buffer.split(b'\n', 1)
+                mensaje = json.loads(linea)
+                if mensaje.get('tipo') == 'ping':
+                    enviar(sock, {'comando': 'pong'})
+                # Se ignoran los eventos hasta recibir el perfil
+                elif mensaje.get('tipo') == 'perfilado' and 'colapsado' in mensaje:
+                    with open(args.salida, 'w', encoding='utf-8') as f:
+                        f.write(mensaje['colapsado'] + "\n")
+                    print(f"✅ {mensaje['muestras']} muestras guardadas en {args.salida}")
+                    print(f"   flamegraph.pl {args.salida} > perfil.svg")
+                    return
+
@@ -0,0 +1,294 @@
+# diagnostico/perfil_locks.py
+"""
+Perfilador de contención de locks y semáforos
+Mide tiempo de espera, tiempo de retención y contención por lock y por hilo
+
+Uso desde un servidor en ejecución:
+    python -m diagnostico locks [--host localhost] [--port 5555]
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+class PerfiladorLocks:
+    """
+    Acumula las mediciones de todos los locks instrumentados
+
+    Por cada par (lock, hilo) guarda:
+    - adquisiciones: Veces que el hilo obtuvo el lock
+    - contenciones: Veces que tuvo que esperar porque estaba ocupado
+    - espera_total / espera_max: Tiempo bloqueado esperando (segundos)
+    - retencion_total / retencion_max: Tiempo con el lock tomado (segundos)
+    """
+
+    CAMPOS = ('adquisiciones', 'contenciones', 'espera_total', 'espera_max',
+              'retencion_total', 'retencion_max')
+
+    def __init__(self):
+        """Inicializa el perfilador sin mediciones"""
+        self._stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._mutex = threading.Lock()  # Protege las estadísticas
+        self.logger = logging.getLogger(__name__)
+
+    def envolver(self, nombre: str, primitiva, medir_retencion: bool = True) -> 'LockInstrumentado':
+        """
+        Envuelve un Lock o Semaphore para que reporte a este perfilador
+
+        Args:
+            nombre: Nombre con el que aparecerá en el reporte
+            primitiva: Lock o Semaphore original
+            medir_retencion: False para semáforos (los libera otro hilo)
+
+        Returns:
+            Lock instrumentado con la misma interfaz que la primitiva
+        """
+        return LockInstrumentado(nombre, primitiva, self, medir_retencion)
+
+    def _entrada(self, nombre: str, hilo: str) -> Dict[str, float]:
+        """Obtiene (o crea) las estadísticas de un par lock/hilo. Requiere _mutex"""
+        clave = (nombre, hilo)
+        stats = self._stats.get(clave)
+        if stats is None:
+            stats = dict.fromkeys(self.CAMPOS, 0)
+            self._stats[clave] = stats
+        return stats
+
+    def registrar_adquisicion(self, nombre: str, hilo: str, espera: float, contendido: bool):
+        """Registra una adquisición con su tiempo de espera"""
+        with self._mutex:
+            stats = self._entrada(nombre, hilo)
+            stats['adquisiciones'] += 1
+            if contendido:
+                stats['contenciones'] += 1
+                stats['espera_total'] += espera
+                if espera > stats['espera_max']:
+                    stats['espera_max'] = espera
+
+    def registrar_retencion(self, nombre: str, hilo: str, retencion: float):
+        """Registra cuánto tiempo estuvo tomado un lock"""
+        with self._mutex:
+            stats = self._entrada(nombre, hilo)
+            stats['retencion_total'] += retencion
+            if retencion > stats['retencion_max']:
+                stats['retencion_max'] = retencion
+
+    def reiniciar(self):
+        """Descarta todas las mediciones acumuladas"""
+        with self._mutex:
+            self._stats.clear()
+
+    def ranking(self, criterio: str = 'espera_total') -> List[Dict]:
+        """
+        Agrupa las mediciones por lock y las ordena de más a menos caliente
+
+        Args:
+            criterio: Campo por el que ordenar (default: espera_total)
+
+        Returns:
+            Lista de locks con sus totales y el detalle por hilo
+        """
+        with self._mutex:
+            copia = {clave: dict(stats) for clave, stats in self._stats.items()}
+
+        locks: Dict[str, Dict] = {}
+        for (nombre, hilo), stats in copia.items():
+            total = locks.setdefault(nombre, {
+                'lock': nombre,
+                **dict.fromkeys(self.CAMPOS, 0),
+                'hilos': {}
+            })
+            for campo in ('adquisiciones', 'contenciones', 'espera_total', 'retencion_total'):
+                total[campo] += stats[campo]
+            total['espera_max'] = max(total['espera_max'], stats['espera_max'])
+            total['retencion_max'] = max(total['retencion_max'], stats['retencion_max'])
+            total['hilos'][hilo] = stats
+
+        return sorted(locks.values(), key=lambda l: l[criterio], reverse=True)
+
+    def reporte(self, top: int = 10, criterio: str = 'espera_total') -> str:
+        """
+        Genera un reporte de texto con los locks más calientes
+
+        Args:
+            top: Número máximo de locks a mostrar
+            criterio: Campo por el que ordenar
+
+        Returns:
+            Reporte listo para imprimir
+        """
+        return formatear_reporte(self.ranking(criterio)[:top])
+
+
+class LockInstrumentado:
+    """
+    Envoltorio de Lock/Semaphore que mide espera, retención y contención
+
+    Primero intenta adquirir sin bloquear: si falla, la adquisición
+    cuenta como contendida y se mide el tiempo bloqueado.
+    """
+
+    def __init__(self, nombre: str, primitiva, perfilador: PerfiladorLocks,
+                 medir_retencion: bool = True):
+        """
+        Inicializa el envoltorio
+
+        Args:
+            nombre: Nombre del lock en el reporte
+            primitiva: Lock o Semaphore original
+            perfilador: Perfilador que acumula las mediciones
+            medir_retencion: Si se mide el tiempo que el lock permanece tomado
+        """
+        self.nombre = nombre
+        self.primitiva = primitiva
+        self.perfilador = perfilador
+        self.medir_retencion = medir_retencion
+        self._adquirido_en = 0.0
+        self._adquirido_por = ''
+
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = -1) -> bool:
+        """Adquiere la primitiva registrando la espera"""
+        hilo = threading.current_thread().name
+        contendido = False
+        espera = 0.0
+
+        obtenido = self.primitiva.acquire(blocking=False)
+        if not obtenido and blocking:
+            contendido = True
+            inicio = time.perf_counter()
+            # Semaphore espera timeout=None para bloquear indefinidamente, Lock espera -1
+            if timeout is None or timeout < 0:
+                obtenido = self.primitiva.acquire()
+            else:
+                obtenido = self.primitiva.acquire(True, timeout)
+            espera = time.perf_counter() - inicio
+
+        if obtenido:
+            self.perfilador.registrar_adquisicion(self.nombre, hilo, espera, contendido)
+            if self.medir_retencion:
+                self._adquirido_en = time.perf_counter()
+                self._adquirido_por = hilo
+        return obtenido
+
+    def release(self, *args):
+        """Libera la primitiva registrando el tiempo de retención"""
+        if self.medir_retencion:
+            # Se lee antes de liberar: después otro hilo puede sobrescribirlo
+            retencion = time.perf_counter() - self._adquirido_en
+            hilo = self._adquirido_por
+            self.primitiva.release(*args)
+            self.perfilador.registrar_retencion(self.nombre, hilo, retencion)
+        else:
+            self.primitiva.release(*args)
+
+    def locked(self) -> bool:
+        """Indica si la primitiva está tomada (solo para Lock)"""
+        return self.primitiva.locked()
+
+    def __enter__(self):
+        """Context manager: adquirir"""
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager: liberar"""
+        self.release()
+
+    def __repr__(self) -> str:
+        """Representación técnica del lock"""
+        return f"LockInstrumentado({self.nombre}, {self.primitiva!r})"
+
+
+def instrumentar_hospital(hospital, perfilador: PerfiladorLocks):
+    """
+    Reemplaza los locks del buffer y de los expedientes por versiones instrumentadas
+    Debe llamarse antes de iniciar los threads del hospital
+
+    Args:
+        hospital: Instancia del hospital
+        perfilador: Perfilador que acumulará las mediciones
+    """
+    buffer = hospital.buffer
+    buffer.mutex = perfilador.envolver('BufferPacientes.mutex', buffer.mutex)
+    buffer.empty = perfilador.envolver('BufferPacientes.empty', buffer.empty, medir_retencion=False)
+    buffer.full = perfilador.envolver('BufferPacientes.full', buffer.full, medir_retencion=False)
+
+    expedientes = hospital.sistema_expedientes
+    expedientes.mutex = perfilador.envolver('SistemaExpedientes.mutex', expedientes.mutex)
+    # Lo toma el primer lector y lo libera el último: puede cambiar de hilo
+    expedientes.escritor_lock = perfilador.envolver(
+        'SistemaExpedientes.escritor_lock', expedientes.escritor_lock
+    )
+
+    perfilador.logger.info("🔬 Locks del hospital instrumentados")
+
+
+def formatear_reporte(ranking: List[Dict]) -> str:
+    """
+    Formatea un ranking de locks como tabla de texto
+
+    Args:
+        ranking: Resultado de PerfiladorLocks.ranking()
+
+    Returns:
+        Tabla con un renglón por lock y el detalle de sus hilos
+    """
+    if not ranking:
+        return "Sin mediciones de locks"
+
+    lineas = [
+        f"{'LOCK':<34} {'ADQ':>8} {'CONT':>7} {'ESPERA(ms)':>11} "
+        f"{'MAX(ms)':>9} {'RETENC(ms)':>11} {'MAX(ms)':>9}",
+        "-" * 95
+    ]
+    for lock in ranking:
+        lineas.append(
+            f"{lock['lock']:<34} {lock['adquisiciones']:>8} {lock['contenciones']:>7} "
+            f"{lock['espera_total'] * 1000:>11.2f} {lock['espera_max'] * 1000:>9.2f} "
+            f"{lock['retencion_total'] * 1000:>11.2f} {lock['retencion_max'] * 1000:>9.2f}"
+        )
+        hilos = sorted(lock['hilos'].items(), key=lambda h: h[1]['espera_total'], reverse=True)
+        for hilo, stats in hilos:
+            lineas.append(
+                f"  └─ {hilo:<29} {stats['adquisiciones']:>8} {stats['contenciones']:>7} "
+                f"{stats['espera_total'] * 1000:>11.2f} {stats['espera_max'] * 1000:>9.2f} "
+                f"{stats['retencion_total'] * 1000:>11.2f} {stats['retencion_max'] * 1000:>9.2f}"
+            )
+    return "\n".join(lineas)
+
+
+def main(argv=None):
+    """Solicita el reporte de locks a un servidor en ejecución"""
+    import argparse
+    import json
+    import socket
+
+    parser = argparse.ArgumentParser(
+        prog="python -m diagnostico locks",
+        description="Reporte de contención de locks del servidor"
+    )
+    parser.add_argument("--host", default="localhost", help="Host del servidor (default: localhost)")
+    parser.add_argument("--port", type=int, default=5555, help="Puerto del servidor (default: 5555)")
+    parser.add_argument("--top", type=int, default=10, help="Número de locks a mostrar (default: 10)")
+    args = parser.parse_args(argv)
+
+    with socket.create_connection((args.host, args.port), timeout=5) as sock:
+        sock.sendall(json.dumps({'comando': 'reporte_locks'}).encode('utf-8') + b'\n')
+        buffer = b""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            buffer += data
+            while b'\n' in buffer:
+                linea, buffer = buffer.split(b'\n', 1)
+                mensaje = json.loads(linea)
+                # Se ignoran los eventos hasta recibir el reporte
+                if mensaje.get('tipo') == 'reporte_locks':
+                    if not mensaje.get('activo'):
+                        print("El servidor no tiene el perfilado de locks activo (--perfilar-locks)")
+                    else:
+                        print(formatear_reporte(mensaje['locks'][:args.top]))
+                    return
+
@@ -0,0 +1,193 @@
+# diagnostico/trazas.py
+"""
+Trazado del ciclo de vida de cada paciente
+Registra tramos (spans) en un buffer circular y los exporta en formato
+Chrome Trace / Perfetto (abrir en chrome://tracing o ui.perfetto.dev)
+"""
+
+import threading
+import time
+import json
+import os
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+class _Tramo:
+    """Tramo en curso; se registra al salir del bloque with"""
+
+    __slots__ = ('trazador', 'nombre', 'paciente_id', 'inicio')
+
+    def __init__(self, trazador: 'Trazador', nombre: str, paciente_id: Optional[int]):
+        self.trazador = trazador
+        self.nombre = nombre
+        self.paciente_id = paciente_id
+        self.inicio = 0.0
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.trazador.registrar(self.nombre, self.paciente_id, self.inicio, time.perf_counter())
+
+
+class _TramoNulo:
+    """Tramo que no hace nada (trazado desactivado)"""
+
+    paciente_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_TRAMO_NULO = _TramoNulo()
+
+
+class Trazador:
+    """
+    Colector de tramos por paciente
+
+    Tipos de registro:
+    - Tramos síncronos: operaciones dentro de un hilo (generar, agregar, atender...)
+    - Tramos asíncronos: intervalos que cruzan hilos (tiempo en cola del buffer)
+
+    Desactivado por defecto: mientras no se active, tramo() devuelve un
+    objeto nulo compartido y el costo es una sola comprobación.
+    """
+
+    def __init__(self, capacidad: int = 100000):
+        """
+        Inicializa el trazador (desactivado)
+
+        Args:
+            capacidad: Número máximo de registros en el buffer circular
+        """
+        self.activo = False
+        self._registros = deque(maxlen=capacidad)
+        self._asincronos_abiertos: Dict[tuple, float] = {}
+        self._hilos: Dict[int, str] = {}
+        self._mutex = threading.Lock()  # Protege los tramos asíncronos abiertos
+        self._origen = time.perf_counter()
+        self.logger = logging.getLogger(__name__)
+
+    def activar(self, capacidad: Optional[int] = None):
+        """
+        Activa el registro de tramos
+
+        Args:
+            capacidad: Nueva capacidad del buffer circular (opcional)
+        """
+        if capacidad is not None:
+            self._registros = deque(maxlen=capacidad)
+        self._origen = time.perf_counter()
+        self.activo = True
+        self.logger.info(f"🧭 Trazado activado (capacidad: {self._registros.maxlen})")
+
+    def desactivar(self):
+        """Detiene el registro de tramos (conserva los ya registrados)"""
+        self.activo = False
+
+    def tramo(self, nombre: str, paciente_id: Optional[int] = None):
+        """
+        Crea un tramo síncrono para usar con with
+
+        El paciente_id puede asignarse dentro del bloque cuando aún no se
+        conoce al entrar (por ejemplo, al generar o extraer un paciente).
+
+        Args:
+            nombre: Nombre de la operación
+            paciente_id: ID del paciente asociado
+
+        Returns:
+            Context manager del tramo
+        """
+        if not self.activo:
+            return _TRAMO_NULO
+        return _Tramo(self, nombre, paciente_id)
+
+    def registrar(self, nombre: str, paciente_id: Optional[int], inicio: float, fin: float):
+        """Registra un tramo síncrono del hilo actual"""
+        hilo = threading.current_thread()
+        self._hilos[hilo.ident] = hilo.name
+        # deque.append es atómico: no requiere lock
+        self._registros.append(('X', nombre, paciente_id, inicio, fin - inicio, hilo.ident))
+
+    def iniciar_asincrono(self, nombre: str, paciente_id: int):
+        """Abre un tramo que terminará en otro hilo"""
+        if not self.activo:
+            return
+        with self._mutex:
+            self._asincronos_abiertos[(nombre, paciente_id)] = time.perf_counter()
+
+    def finalizar_asincrono(self, nombre: str, paciente_id: int):
+        """Cierra un tramo abierto con iniciar_asincrono"""
+        if not self.activo:
+            return
+        with self._mutex:
+            inicio = self._asincronos_abiertos.pop((nombre, paciente_id), None)
+        if inicio is not None:
+            self._registros.append(('A', nombre, paciente_id, inicio, time.perf_counter() - inicio, None))
+
+    def limpiar(self):
+        """Descarta todos los registros"""
+        with self._mutex:
+            self._registros.clear()
+            self._asincronos_abiertos.clear()
+
+    def eventos_chrome(self) -> Dict:
+        """
+        Convierte los registros al formato JSON de Chrome Trace
+
+        Returns:
+            Diccionario con la lista traceEvents
+        """
+        pid = os.getpid()
+        eventos = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': nombre}}
+            for tid, nombre in list(self._hilos.items())
+        ]
+
+        for tipo, nombre, paciente_id, inicio, duracion, tid in list(self._registros):
+            ts = (inicio - self._origen) * 1e6  # microsegundos
+            args = {'paciente_id': paciente_id}
+            if tipo == 'X':
+                eventos.append({
+                    'name': nombre, 'cat': 'hospital', 'ph': 'X',
+                    'ts': ts, 'dur': duracion * 1e6, 'pid': pid, 'tid': tid, 'args': args
+                })
+            else:
+                # Par de eventos asíncronos agrupados por paciente
+                comun = {'name': nombre, 'cat': 'paciente', 'id': paciente_id, 'pid': pid}
+                eventos.append({**comun, 'ph': 'b', 'ts': ts, 'args': args})
+                eventos.append({**comun, 'ph': 'e', 'ts': ts + duracion * 1e6})
+
+        return {'traceEvents': eventos, 'displayTimeUnit': 'ms'}
+
+    def exportar_chrome(self, ruta: str) -> int:
+        """
+        Escribe los tramos en un archivo de Chrome Trace
+
+        Args:
+            ruta: Archivo de destino
+
+        Returns:
+            Número de tramos exportados
+        """
+        datos = self.eventos_chrome()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(datos, f)
+
+        total = len(self._registros)
+        self.logger.info(f"🧭 {total} tramos exportados a {ruta}")
+        return total
+
+
+# Instancia global usada por los componentes del hospital
+trazador = Trazador()
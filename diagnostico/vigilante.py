@@ -0,0 +1,180 @@
+# diagnostico/vigilante.py
+"""
+Vigilante de hilos del hospital
+Detecta productores, médicos, la ingesta y el bus de eventos muertos, bloqueados o estancados, y escritores
+de expedientes que no consiguen el lock (inanición por lectores)
+"""
+
+import sys
+import threading
+import time
+import traceback
+import logging
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+class Vigilante(threading.Thread):
+    """
+    Thread que revisa periódicamente el estado de los trabajadores
+
+    Alertas:
+    - muerto: el thread terminó sin que se pidiera su detención
+    - bloqueado: lleva más de umbral_bloqueo esperando un recurso
+    - estancado: no late desde hace umbral_estancamiento sin estar bloqueado
+    - inanicion_escritor: un escritor espera escritor_lock más de umbral_inanicion
+
+    Cada episodio se reporta una sola vez, con el volcado de pila del hilo.
+    """
+
+    # Esperas que no son un problema: un médico sin pacientes está ocioso
+    ESPERAS_OCIOSAS = {'BufferPacientes.full'}
+
+    def __init__(self, hospital, intervalo: float = 5, umbral_bloqueo: float = 30,
+                 umbral_estancamiento: float = 60, umbral_inanicion: float = 10,
+                 reiniciar_muertos: bool = False, max_reinicios: int = 5):
+        """
+        Inicializa el vigilante
+
+        Args:
+            hospital: Instancia del hospital a vigilar
+            intervalo: Segundos entre revisiones
+            umbral_bloqueo: Segundos bloqueado antes de alertar
+            umbral_estancamiento: Segundos sin latido antes de alertar
+            umbral_inanicion: Segundos de espera de un escritor antes de alertar
+            reiniciar_muertos: Si es True, reemplaza los trabajadores muertos
+            max_reinicios: Reinicios máximos por trabajador (evita bucles de caídas)
+        """
+        super().__init__(name="Vigilante", daemon=True)
+        self.hospital = hospital
+        self.intervalo = intervalo
+        self.umbral_bloqueo = umbral_bloqueo
+        self.umbral_estancamiento = umbral_estancamiento
+        self.umbral_inanicion = umbral_inanicion
+        self.reiniciar_muertos = reiniciar_muertos
+        self.max_reinicios = max_reinicios
+        self.alertas = deque(maxlen=100)  # Historial de alertas recientes
+        self.reinicios = Counter()  # {nombre_hilo: reinicios}
+        self._reportados = set()  # Episodios ya alertados
+        self._detener = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def run(self):
+        """Ejecuta el bucle de revisión"""
+        self.logger.info(f"🐕 Vigilante iniciado (intervalo: {self.intervalo}s)")
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.revisar()
+            except Exception as e:
+                self.logger.error(f"❌ Error en vigilante: {e}")
+        self.logger.info("🐕 Vigilante detenido")
+
+    def revisar(self) -> List[Dict]:
+        """
+        Revisa todos los trabajadores y escritores una vez
+
+        Returns:
+            Alertas nuevas generadas en esta revisión
+        """
+        ahora = time.monotonic()
+        nuevas = []
+        episodios = set()
+
+        for hilo in self._trabajadores():
+            if hilo.ident is None:
+                continue  # Aún no iniciado
+
+            if not hilo.is_alive():
+                if hilo._detener.is_set():
+                    continue  # Detención ordenada
+                nuevas.append(self._alerta('muerto', hilo.name, ahora, episodios, (hilo.ident,)))
+                if self.reiniciar_muertos:
+                    if self.reinicios[hilo.name] < self.max_reinicios:
+                        self.hospital.reiniciar_trabajador(hilo)
+                        self.reinicios[hilo.name] += 1
+                    elif self.reinicios[hilo.name] == self.max_reinicios:
+                        self.logger.error(f"❌ {hilo.name} superó {self.max_reinicios} reinicios, no se reinicia más")
+                        self.reinicios[hilo.name] += 1
+                continue
+
+            desde = hilo.bloqueado_desde
+            if desde is not None:
+                recurso = hilo.bloqueado_en
+                if recurso not in self.ESPERAS_OCIOSAS and ahora - desde > self.umbral_bloqueo:
+                    nuevas.append(self._alerta(
+                        'bloqueado', hilo.name, ahora, episodios, (desde,),
+                        recurso=recurso, segundos=round(ahora - desde, 1), ident=hilo.ident
+                    ))
+            elif ahora - hilo.ultimo_latido > self.umbral_estancamiento:
+                nuevas.append(self._alerta(
+                    'estancado', hilo.name, ahora, episodios, (hilo.ultimo_latido,),
+                    segundos=round(ahora - hilo.ultimo_latido, 1), ident=hilo.ident
+                ))
+
+        expedientes = self.hospital.sistema_expedientes
+        for nombre, desde in list(expedientes.escritores_esperando.items()):
+            if ahora - desde > self.umbral_inanicion:
+                nuevas.append(self._alerta(
+                    'inanicion_escritor', nombre, ahora, episodios, (desde,),
+                    segundos=round(ahora - desde, 1), lectores=expedientes.lectores
+                ))
+
+        # Los episodios que ya no ocurren pueden volver a reportarse
+        self._reportados &= episodios
+        return [alerta for alerta in nuevas if alerta]
+
+    def _trabajadores(self) -> List[threading.Thread]:
+        """Threads con latido que se revisan (y se reinician si mueren)"""
+        hospital = self.hospital
+        return list(hospital.productores) + list(hospital.medicos) + [hospital.ingesta, hospital.bus]
+
+    def _alerta(self, tipo: str, hilo: str, ahora: float, episodios: set,
+                clave: tuple, ident: Optional[int] = None, **datos) -> Optional[Dict]:
+        """
+        Registra una alerta si el episodio no fue reportado antes
+
+        Returns:
+            La alerta, o None si el episodio ya se había reportado
+        """
+        episodio = (tipo, hilo) + clave
+        episodios.add(episodio)
+        if episodio in self._reportados:
+            return None
+        self._reportados.add(episodio)
+
+        alerta = {'tipo': tipo, 'hilo': hilo, 'instante': time.time(), **datos}
+        self.alertas.append(alerta)
+
+        detalle = ", ".join(f"{k}={v}" for k, v in datos.items())
+        self.logger.warning(f"🚨 {tipo}: {hilo} ({detalle})")
+        if tipo == 'inanicion_escritor':
+            # Los culpables son los lectores: se vuelcan todos los hilos
+            self.logger.warning(volcar_pilas())
+        elif ident is not None:
+            self.logger.warning(volcar_pilas([ident]))
+        return alerta
+
+    def detener(self):
+        """Detiene el vigilante"""
+        self._detener.set()
+        if self.is_alive():
+            self.join(timeout=2)
+
+
+def volcar_pilas(idents: Optional[List[int]] = None) -> str:
+    """
+    Genera el volcado de pila de los hilos indicados
+
+    Args:
+        idents: Identificadores de hilo (None para todos)
+
+    Returns:
+        Texto con la pila de cada hilo
+    """
+    nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+    lineas = []
+    for ident, frame in sys._current_frames().items():
+        if idents is not None and ident not in idents:
+            continue
+        lineas.append(f"--- Pila de {nombres.get(ident, ident)} ---")
+        lineas.append("".join(traceback.format_stack(frame)).rstrip())
+    return "\n".join(lineas)
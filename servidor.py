@@ -26,23 +26,61 @@ import argparse
 import signal
 import time
 from core.hospital import Hospital
-from core.event_server import EventServer
+from core.event_server import EventServer, POLITICAS_LENTOS
+from diagnostico.trazas import trazador
+from diagnostico.vigilante import Vigilante
 
 # Variables globales para manejo de señales
 hospital_instance = None
 event_server_instance = None
+vigilante_instance = None
+servidor_http_instance = None
 
 def signal_handler(sig, frame):
     """Maneja las señales de interrupción (Ctrl+C)"""
+    if vigilante_instance:
+        vigilante_instance.detener()
+    if servidor_http_instance:
+        servidor_http_instance.detener()
     if event_server_instance:
         event_server_instance.detener()
     if hospital_instance:
         hospital_instance.detener()
     sys.exit(0)
 
+def _positivo(texto: str) -> float:
+    """Tipo de argparse: número mayor que 0"""
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{texto}' no es un número")
+    if not valor > 0:
+        raise argparse.ArgumentTypeError(f"debe ser mayor que 0 (se recibió {texto})")
+    return valor
+
+def _no_negativo(texto: str) -> float:
+    """Tipo de argparse: número mayor o igual que 0"""
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{texto}' no es un número")
+    if not valor >= 0:
+        raise argparse.ArgumentTypeError(f"no puede ser negativo (se recibió {texto})")
+    return valor
+
+def _entero_no_negativo(texto: str) -> int:
+    """Tipo de argparse: entero mayor o igual que 0"""
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{texto}' no es un entero")
+    if valor < 0:
+        raise argparse.ArgumentTypeError(f"no puede ser negativo (se recibió {texto})")
+    return valor
+
 def main():
     """Función principal del servidor"""
-    global hospital_instance, event_server_instance
+    global hospital_instance, event_server_instance, vigilante_instance, servidor_http_instance
     
     # Configurar manejador de señales
     signal.signal(signal.SIGINT, signal_handler)
@@ -75,20 +113,148 @@ def main():
         default=5555,
         help="Puerto del servidor de eventos (default: 5555)"
     )
+    parser.add_argument(
+        "--limite-salida",
+        type=int,
+        default=256,
+        help="KB pendientes por cliente antes de aplicar la política de clientes lentos (default: 256)"
+    )
+    parser.add_argument(
+        "--politica-lentos",
+        choices=POLITICAS_LENTOS,
+        default="descartar_antiguos",
+        help="Qué hacer con un cliente que no lee a tiempo (default: descartar_antiguos)"
+    )
+    parser.add_argument(
+        "--max-actualizaciones",
+        type=_positivo,
+        default=4,
+        help="Instantáneas de estado por segundo como máximo (default: 4)"
+    )
+    parser.add_argument(
+        "--historial-eventos",
+        type=_entero_no_negativo,
+        default=1000,
+        help="Eventos recientes que se conservan para obtener_cambios (default: 1000)"
+    )
+    parser.add_argument(
+        "--umbral-compresion",
+        type=int,
+        default=1024,
+        help="Bytes a partir de los cuales se comprimen los mensajes a clientes que lo pidan (default: 1024)"
+    )
+    parser.add_argument(
+        "--ventana-idempotencia",
+        type=float,
+        default=300,
+        help="Segundos durante los que un registro reintentado con la misma clave no se duplica (default: 300)"
+    )
+    parser.add_argument(
+        "--ruta-unix",
+        help="Ruta del socket Unix para interfaces locales (default: hospital-<puerto>.sock en el directorio temporal)"
+    )
+    parser.add_argument(
+        "--sin-unix",
+        action="store_true",
+        help="No escuchar en un socket Unix, solo por TCP"
+    )
+    parser.add_argument(
+        "--intervalo-ping",
+        type=_no_negativo,
+        default=15,
+        help="Segundos de silencio de una interfaz antes de enviarle un ping; 0 los desactiva (default: 15)"
+    )
+    parser.add_argument(
+        "--timeout-ping",
+        type=_positivo,
+        default=10,
+        help="Segundos sin respuesta al ping tras los que se cierra la conexión (default: 10)"
+    )
+    parser.add_argument(
+        "--http-port",
+        type=int,
+        help="Puerto de la API HTTP y eventos SSE (requiere fastapi y uvicorn; default: deshabilitada)"
+    )
+    parser.add_argument(
+        "--perfilar-locks",
+        action="store_true",
+        help="Mide la contención de los locks del buffer y expedientes"
+    )
+    parser.add_argument(
+        "--perfilar-muestreo",
+        metavar="ARCHIVO",
+        help="Perfila todos los hilos por muestreo y guarda pilas collapsed al detener"
+    )
+    parser.add_argument(
+        "--frecuencia-muestreo",
+        type=float,
+        default=100,
+        help="Muestras por segundo del perfilador, de 1 a 1000 (default: 100)"
+    )
+    parser.add_argument(
+        "--vigilante",
+        action="store_true",
+        help="Vigila hilos muertos, bloqueados o estancados e inanición de escritores"
+    )
+    parser.add_argument(
+        "--reiniciar-muertos",
+        action="store_true",
+        help="Con --vigilante, reemplaza productores, médicos, la ingesta o el bus si terminan por error"
+    )
+    parser.add_argument(
+        "--umbral-bloqueo",
+        type=float,
+        default=30,
+        help="Segundos bloqueado en el buffer antes de alertar (default: 30)"
+    )
+    parser.add_argument(
+        "--umbral-inanicion",
+        type=float,
+        default=10,
+        help="Segundos de espera de un escritor de expedientes antes de alertar (default: 10)"
+    )
+    parser.add_argument(
+        "--trazas",
+        metavar="ARCHIVO",
+        help="Traza el ciclo de vida de cada paciente y lo exporta al detener (Chrome/Perfetto JSON)"
+    )
+    parser.add_argument(
+        "--trazas-capacidad",
+        type=int,
+        default=100000,
+        help="Tramos máximos conservados en el buffer circular de trazas (default: 100000)"
+    )
     
     args = parser.parse_args()
     
+    if args.trazas:
+        trazador.activar(args.trazas_capacidad)
+    
     try:
         # Crear instancia del hospital con configuración (sin logs en consola)
         hospital_instance = Hospital(
             capacidad_buffer=args.buffer_size,
             num_productores=args.productores,
             num_medicos=args.medicos,
-            verbose=False
+            verbose=False,
+            perfilar_locks=args.perfilar_locks
         )
         
         # Crear servidor de eventos para comunicación con interfaces
-        event_server_instance = EventServer(hospital_instance, port=args.port)
+        event_server_instance = EventServer(
+            hospital_instance,
+            port=args.port,
+            limite_salida=args.limite_salida * 1024,
+            politica_lentos=args.politica_lentos,
+            max_actualizaciones=args.max_actualizaciones,
+            historial=args.historial_eventos,
+            umbral_compresion=args.umbral_compresion,
+            ventana_idempotencia=args.ventana_idempotencia,
+            unix=not args.sin_unix,
+            ruta_unix=args.ruta_unix,
+            intervalo_ping=args.intervalo_ping,
+            timeout_ping=args.timeout_ping
+        )
         
         # Iniciar el hospital (hilos productores y consumidores)
         hospital_instance.iniciar()
@@ -96,7 +262,34 @@ def main():
         # Iniciar servidor de eventos
         event_server_instance.iniciar()
         
+        if args.perfilar_muestreo:
+            event_server_instance.iniciar_perfilado(args.frecuencia_muestreo)
+        
+        # API HTTP (opcional: sus dependencias se importan solo si se pide)
+        if args.http_port:
+            try:
+                from web.api import ServidorHTTP
+            except ImportError as e:
+                print(f"⚠️ API HTTP deshabilitada: falta {e.name} (pip install -r requirements.txt)")
+            else:
+                servidor_http_instance = ServidorHTTP(hospital_instance, event_server_instance, port=args.http_port)
+                servidor_http_instance.iniciar()
+        
+        # Vigilante de hilos (opcional)
+        if args.vigilante:
+            vigilante_instance = Vigilante(
+                hospital_instance,
+                umbral_bloqueo=args.umbral_bloqueo,
+                umbral_inanicion=args.umbral_inanicion,
+                reiniciar_muertos=args.reiniciar_muertos
+            )
+            vigilante_instance.start()
+        
         print(f"🏥 Servidor corriendo en puerto {args.port}")
+        if servidor_http_instance:
+            print(f"🌍 API HTTP en http://localhost:{args.http_port}/docs")
+        if args.perfilar_locks:
+            print("🔬 Perfilado de locks activo (python -m diagnostico locks)")
         
         # Mantener el servidor corriendo
         try:
@@ -104,19 +297,41 @@ def main():
                 time.sleep(1)
         except KeyboardInterrupt:
             pass
-        
+    
     except KeyboardInterrupt:
         pass
     except Exception as e:
         print(f"\n❌ Error: {e}")
     finally:
+        # Detener vigilante antes que los hilos que vigila
+        if vigilante_instance:
+            vigilante_instance.detener()
+        
+        # La API HTTP depende del servidor de eventos: se detiene antes
+        if servidor_http_instance:
+            servidor_http_instance.detener()
+        
         # Detener servidor de eventos
         if event_server_instance:
+            perfilador = event_server_instance.detener_perfilado()
+            if perfilador and args.perfilar_muestreo:
+                muestras = perfilador.exportar(args.perfilar_muestreo)
+                print(f"\n🔥 {muestras} muestras guardadas en {args.perfilar_muestreo}")
             event_server_instance.detener()
         
         # Detener hospital (hilos productores y consumidores)
         if hospital_instance:
             hospital_instance.detener()
+            
+            # Reporte final de contención de locks
+            if hospital_instance.perfilador_locks:
+                print("\n🔬 Contención de locks:")
+                print(hospital_instance.perfilador_locks.reporte())
+        
+        # Exportar trazas de pacientes
+        if args.trazas:
+            total = trazador.exportar_chrome(args.trazas)
+            print(f"\n🧭 {total} tramos exportados a {args.trazas}")
         
         print("\n🛑 Servidor detenido")
 
@@ -29,6 +29,10 @@ import time
 # Agregar directorio raíz al path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from core.protocolo import (
+    FORMATOS, INTERVALO_PING_CLIENTE, TIMEOUT_PING_CLIENTE, Latido, cambiar_formato, conectar
+)
+
 # Ruta del archivo de expedientes
 EXPEDIENTES_FILE = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
@@ -36,11 +40,19 @@ EXPEDIENTES_FILE = os.path.join(
     'expedientes.json'
 )
 
+# Intervalo mínimo entre redibujos de los bloques de médicos (ms)
+REDIBUJO_MS = 100
+
+# Espera entre reintentos de conexión (segundos, se duplica en cada fallo)
+RECONEXION_INICIAL = 0.5
+RECONEXION_MAXIMA = 30
+
 
 class PanelHospital(tk.Toplevel):
     """Panel Principal del Hospital con Logs y Médicos"""
     
-    def __init__(self, parent=None, host='localhost', port=5555):
+    def __init__(self, parent=None, host='localhost', port=5555, formato='json',
+                 compresion=False):
         """
         Inicializar panel del hospital
         
@@ -48,6 +60,8 @@ class PanelHospital(tk.Toplevel):
             parent: Ventana padre (None para ventana independiente)
             host: Host del servidor
             port: Puerto del servidor
+            formato: Formato de trama a negociar ('json' o 'binario')
+            compresion: Si es True, pide que los mensajes grandes lleguen comprimidos
         """
         # Si no hay parent, crear como ventana independiente
         if parent is None:
@@ -68,8 +82,12 @@ class PanelHospital(tk.Toplevel):
         
         self.host = host
         self.port = port
+        self.formato = formato
+        self.compresion = compresion
         self.socket = None
         self.conectado = False
+        self._formato_envio = FORMATOS['json']  # Formato acordado en la conexión actual
+        self._negociando = False  # Esperando la confirmación de 'negociar'
         
         # Configuración de la ventana
         self.title("🏥 Panel Principal del Hospital")
@@ -78,6 +96,16 @@ class PanelHospital(tk.Toplevel):
         
         # Datos de médicos y pacientes
         self.medicos_data = {}  # {nombre_medico: [lista_pacientes]}
+        self._redibujo_pendiente = False  # Hay un redibujo agendado
+        
+        # Último evento aplicado (para pedir solo los cambios posteriores)
+        self.ultimo_seq = 0
+        self.sesion_servidor = None
+        self._reanudando = False  # Esperando la respuesta a obtener_cambios
+        self._retenidos = []  # Eventos en vivo llegados antes de los perdidos
+        self._por_reproducir = 0  # Mensajes perdidos que faltan recibir tras 'cambios'
+        self._fin_reanudacion = 0  # seq del servidor al responder obtener_cambios
+        self._cerrando = threading.Event()  # Detiene la reconexión al cerrar
         
         # Diccionario para tracking de expedientes (para calcular tiempos)
         self.expedientes_tracking = {}  # {paciente_id: datos_temporales}
@@ -96,38 +124,87 @@ class PanelHospital(tk.Toplevel):
             self.protocol("WM_DELETE_WINDOW", self.on_closing)
     
     def _conectar_servidor(self):
-        """Intenta conectarse al servidor del hospital"""
-        def conectar():
-            try:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.settimeout(2.0)
-                self.socket.connect((self.host, self.port))
-                self.conectado = True
-                self._agregar_log("Conectado al sistema hospitalario", "success")
-                
-                # Iniciar thread para recibir eventos
-                thread = threading.Thread(target=self._recibir_eventos, daemon=True)
-                thread.start()
-                
-                # Solicitar estado inicial
-                self._enviar_comando({'comando': 'obtener_estado'})
-                
-            except Exception as e:
-                self.conectado = False
-                self._agregar_log("Sin conexión al sistema", "warning")
-                self._agregar_log("Modo visualización sin datos", "info")
-        
-        thread = threading.Thread(target=conectar, daemon=True)
+        """Inicia el thread que mantiene la conexión con el servidor del hospital"""
+        thread = threading.Thread(target=self._bucle_conexion, daemon=True)
         thread.start()
     
+    def _bucle_conexion(self):
+        """
+        Conecta, recibe eventos y reconecta con espera exponencial
+        
+        Al reconectar pide solo los eventos posteriores al último aplicado
+        (obtener_cambios); el servidor responde con un estado completo si el
+        panel quedó demasiado atrás o el servidor se reinició.
+        """
+        espera = RECONEXION_INICIAL
+        avisado = False
+        while not self._cerrando.is_set():
+            try:
+                # Socket Unix si el servidor es local, TCP si no
+                sock = conectar(self.host, self.port, timeout=2.0)
+            except OSError:
+                if not avisado:
+                    avisado = True
+                    self.after(0, lambda: self._agregar_log("Sin conexión al sistema", "warning"))
+                    self.after(0, lambda: self._agregar_log("Modo visualización sin datos", "info"))
+                # Espera con variación aleatoria para no reconectar todos a la vez
+                self._cerrando.wait(espera * random.uniform(0.5, 1.0))
+                espera = min(espera * 2, RECONEXION_MAXIMA)
+                continue
+            
+            sock.settimeout(2.0)
+            self.socket = sock
+            self.conectado = True
+            self._formato_envio = FORMATOS['json']
+            espera = RECONEXION_INICIAL
+            avisado = False
+            
+            # Reconexión: el estado inicial se ignora hasta recibir los cambios
+            self._reanudando = self.sesion_servidor is not None
+            self._retenidos = []
+            self._por_reproducir = 0
+            
+            if self.formato != 'json' or self.compresion:
+                # No enviar nada más hasta que el servidor confirme el formato
+                self._negociando = True
+                self._enviar_comando({
+                    'comando': 'negociar',
+                    'formato': self.formato,
+                    'compresion': self.compresion
+                })
+            else:
+                self._al_conectar()
+            
+            self._recibir_eventos()
+            
+            try:
+                sock.close()
+            except OSError:
+                pass
+    
+    def _al_conectar(self):
+        """Primeros comandos de cada conexión, ya con el formato acordado"""
+        if not self._reanudando:
+            self.after(0, lambda: self._agregar_log("Conectado al sistema hospitalario", "success"))
+        else:
+            self._pedir_cambios()
+    
+    def _pedir_cambios(self):
+        """Pide los eventos posteriores al último aplicado; hasta la respuesta se retienen los nuevos"""
+        self._reanudando = True
+        self._enviar_comando({
+            'comando': 'obtener_cambios',
+            'desde_seq': self.ultimo_seq,
+            'sesion': self.sesion_servidor
+        })
+    
     def _enviar_comando(self, comando):
         """Envía un comando al servidor"""
         if not self.conectado or not self.socket:
             return False
         
         try:
-            data = json.dumps(comando).encode('utf-8')
-            self.socket.sendall(data + b'\n')
+            self.socket.sendall(self._formato_envio.codificar(comando))
             return True
         except Exception as e:
             self.conectado = False
@@ -136,44 +213,150 @@ class PanelHospital(tk.Toplevel):
     
     def _recibir_eventos(self):
         """Recibe eventos del servidor en tiempo real"""
-        buffer = ""
+        formato = FORMATOS['json']
+        decodificador = formato.decodificador()
+        latido = Latido(INTERVALO_PING_CLIENTE, TIMEOUT_PING_CLIENTE)
         while self.conectado:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(65536)
                 if not data:
                     break
                 
-                buffer += data
-                while '\n' in buffer:
-                    linea, buffer = buffer.split('\n', 1)
-                    if linea.strip():
-                        mensaje = json.loads(linea)
-                        self._procesar_evento(mensaje)
+                latido.recibido()
+                decodificador.agregar(data)
+                while True:
+                    trama = decodificador.siguiente()
+                    if trama is None:
+                        break
+                    evento = formato.decodificar(trama)
+                    
+                    if evento.get('tipo') == 'ping':
+                        self._enviar_comando({'comando': 'pong'})
+                        continue
+                    if evento.get('tipo') == 'pong':
+                        continue
+                    
+                    if self._negociando and evento.get('tipo') in ('negociacion', 'error'):
+                        # Lo que sigue a la confirmación ya llega en el formato nuevo
+                        self._negociando = False
+                        if evento['tipo'] == 'negociacion':
+                            formato, decodificador = cambiar_formato(decodificador, evento['formato'])
+                            self._formato_envio = formato
+                        self._al_conectar()
+                        continue
+                    
+                    self._procesar_evento(evento)
             
             except socket.timeout:
-                continue
+                pass
             except Exception as e:
-                if self.conectado:
-                    self.conectado = False
-                    self.after(0, lambda: self._agregar_log("Conexión perdida", "error"))
                 break
+            
+            # Servidor en silencio: un ping; sin respuesta, la conexión quedó medio abierta
+            accion = latido.revisar()
+            if accion == 'ping':
+                self._enviar_comando({'comando': 'ping'})
+            elif accion == 'caido':
+                self.after(0, lambda: self._agregar_log("El servidor no responde", "warning"))
+                break
+        
+        if self.conectado and not self._cerrando.is_set():
+            self.after(0, lambda: self._agregar_log("Conexión perdida, reconectando...", "error"))
+        self.conectado = False
     
     def _procesar_evento(self, evento):
-        """Procesa un evento recibido del servidor"""
+        """
+        Procesa un mensaje recibido del servidor
+        
+        Al reanudar, la conexión ya recibe eventos en vivo antes de la
+        respuesta a obtener_cambios; esos se retienen y se aplican después
+        de los perdidos, para que su seq no haga descartar a los perdidos.
+        Un salto en seq (eventos descartados por el servidor) se recupera
+        igual, con obtener_cambios sin reconectar.
+        """
+        tipo = evento.get('tipo')
+        seq = evento.get('seq')
+        
+        if tipo == 'cambios':
+            # Respuesta a obtener_cambios (al reconectar o tras un hueco en seq): le siguen los perdidos
+            self._reanudando = False
+            self._fin_reanudacion = seq or 0
+            completo = evento.get('completo')
+            self._por_reproducir = 1 if completo else evento.get('eventos', 0)
+            if completo:
+                self.after(0, lambda: self._agregar_log("Eventos perdidos: recargando estado completo", "warning"))
+            else:
+                eventos = evento.get('eventos', 0)
+                self.after(0, lambda: self._agregar_log(f"{eventos} eventos perdidos recuperados", "success"))
+            if not self._por_reproducir:
+                self._aplicar_retenidos()
+            return
+        
+        if self._reanudando and seq is not None and tipo != 'estado_inicial':
+            self._retenidos.append(evento)
+            return
+        
+        if self._por_reproducir and (seq is not None or tipo == 'estado_inicial'):
+            if tipo != 'estado_inicial' and seq > self._fin_reanudacion:
+                # Ya es un evento en vivo (el servidor no envió todos los perdidos)
+                self._aplicar_retenidos()
+            else:
+                self._aplicar_evento(evento)
+                self._por_reproducir -= 1
+                if not self._por_reproducir:
+                    self._aplicar_retenidos()
+                return
+        
+        if (seq is not None and tipo != 'estado_inicial' and self.sesion_servidor is not None
+                and seq > self.ultimo_seq + 1 and not self._negociando):
+            # Faltan eventos (el servidor los descartó por ir atrasado): se piden
+            # y este se aplica después de ellos
+            self._retenidos.append(evento)
+            self._pedir_cambios()
+            return
+        
+        self._aplicar_evento(evento)
+    
+    def _aplicar_retenidos(self):
+        """Aplica los eventos en vivo retenidos durante la reanudación"""
+        self._por_reproducir = 0
+        retenidos, self._retenidos = self._retenidos, []
+        for evento in retenidos:
+            self._aplicar_evento(evento)  # Los ya recuperados se descartan por seq
+    
+    def _aplicar_evento(self, evento):
+        """Aplica un evento del servidor (descarta los repetidos por seq)"""
         tipo = evento.get('tipo')
+        seq = evento.get('seq')
+        
+        if tipo == 'estado_inicial':
+            if self._reanudando and evento.get('sesion') == self.sesion_servidor:
+                return  # Llegan a continuación solo los eventos perdidos
+            # La instantánea ya refleja todos los eventos hasta su seq
+            self.ultimo_seq = seq or 0
+            self.sesion_servidor = evento.get('sesion')
+        elif seq is not None:
+            if seq <= self.ultimo_seq:
+                return  # Evento repetido o ya incluido en la instantánea
+            self.ultimo_seq = seq
         
         if tipo == 'estado_inicial':
             # Inicializar médicos y datos
             medicos = evento.get('medicos', [])
             for medico in medicos:
                 self.medicos_data[medico['nombre']] = []
-            self.after(0, self._crear_bloques_medicos)
+            self.after(0, self._programar_redibujo)
         
         elif tipo == 'paciente_registrado':
             # Nuevo paciente registrado
             paciente = evento.get('paciente')
             self.after(0, lambda: self.agregar_paciente(paciente))
         
+        elif tipo == 'pacientes_registrados':
+            # Lote de pacientes registrados de una vez
+            pacientes = evento.get('pacientes', [])
+            self.after(0, lambda: self.agregar_pacientes(pacientes))
+        
         elif tipo == 'paciente_atendido':
             # Paciente atendido
             paciente = evento.get('paciente')
@@ -183,7 +366,7 @@ class PanelHospital(tk.Toplevel):
         
         elif tipo == 'actualizacion_estado':
             # Actualización general
-            self.after(0, self._crear_bloques_medicos)
+            self.after(0, self._programar_redibujo)
     
     def inicializar_medicos(self):
         """Inicializar estructura de datos de médicos"""
@@ -316,6 +499,23 @@ class PanelHospital(tk.Toplevel):
         # Crear bloques de médicos
         self._crear_bloques_medicos()
     
+    def _programar_redibujo(self):
+        """
+        Agenda un redibujo de los bloques de médicos
+        
+        Varios cambios seguidos (ráfagas de eventos) producen un solo redibujo
+        cada REDIBUJO_MS en lugar de reconstruir los widgets por cada evento.
+        """
+        if self._redibujo_pendiente:
+            return
+        self._redibujo_pendiente = True
+        self.after(REDIBUJO_MS, self._redibujar)
+    
+    def _redibujar(self):
+        """Ejecuta el redibujo agendado"""
+        self._redibujo_pendiente = False
+        self._crear_bloques_medicos()
+    
     def _crear_bloques_medicos(self):
         """Crear bloques visuales para cada médico"""
         # Limpiar frame
@@ -492,7 +692,7 @@ class PanelHospital(tk.Toplevel):
             # Guardar todo de vuelta
             with open(EXPEDIENTES_FILE, 'w', encoding='utf-8') as f:
                 json.dump({'expedientes': expedientes}, f, indent=2, ensure_ascii=False)
-                
+        
         except Exception as e:
             print(f"Error guardando expediente: {e}")
     
@@ -533,8 +733,25 @@ class PanelHospital(tk.Toplevel):
                 "info"
             )
             
-            # Actualizar vista inmediatamente (event-driven)
-            self._crear_bloques_medicos()
+            # Actualizar vista (event-driven, agrupando ráfagas)
+            self._programar_redibujo()
+    
+    def agregar_pacientes(self, pacientes):
+        """Agregar un lote de pacientes con un solo mensaje en el log"""
+        agregados = 0
+        for paciente_data in pacientes:
+            doctor = paciente_data.get('doctor_asignado')
+            if doctor and doctor in self.medicos_data:
+                self.medicos_data[doctor].append(paciente_data)
+                agregados += 1
+        
+        if agregados:
+            self._agregar_log(
+                f"🆕 Lote de {agregados} pacientes registrados",
+                "info",
+                agregar_separador=True
+            )
+            self._programar_redibujo()
     
     def cambiar_estado_paciente(self, paciente_id, nuevo_estado):
         """Cambiar el estado de un paciente"""
@@ -555,7 +772,7 @@ class PanelHospital(tk.Toplevel):
                         f"Estado: {nuevo_estado}",
                         "warning"
                     )
-                    self._crear_bloques_medicos()
+                    self._programar_redibujo()
                     return
     
     def _iniciar_actualizaciones(self):
@@ -582,7 +799,7 @@ class PanelHospital(tk.Toplevel):
         if not self.medicos_data:
             for medico in self.medicos_simulados:
                 self.medicos_data[medico] = []
-            self._crear_bloques_medicos()
+            self._programar_redibujo()
         
         # Crear threads productores (generadores de pacientes)
         for i in range(2):  # 2 productores
@@ -652,7 +869,7 @@ class PanelHospital(tk.Toplevel):
                 
                 # Esperar tiempo aleatorio (2-5 segundos)
                 time.sleep(random.uniform(2, 5))
-                
+            
             except Exception as e:
                 break
     
@@ -680,7 +897,7 @@ class PanelHospital(tk.Toplevel):
                 else:
                     # No hay pacientes, esperar
                     time.sleep(1)
-                    
+            
             except Exception as e:
                 break
     
@@ -722,7 +939,7 @@ class PanelHospital(tk.Toplevel):
                 "info"
             )
             
-            self._crear_bloques_medicos()
+            self._programar_redibujo()
     
     def _convertir_prioridad_texto_a_numero(self, prioridad_texto):
         """Convierte prioridad de texto a número"""
@@ -759,7 +976,7 @@ class PanelHospital(tk.Toplevel):
                         "info"
                     )
                     
-                    self._crear_bloques_medicos()
+                    self._programar_redibujo()
                     break
     
     def _completar_atencion(self, paciente_id, medico_nombre):
@@ -820,11 +1037,12 @@ class PanelHospital(tk.Toplevel):
                         "info"
                     )
                     
-                    self._crear_bloques_medicos()
+                    self._programar_redibujo()
                     break
     
     def on_closing(self):
         """Manejar cierre de ventana (modo no standalone)"""
+        self._cerrando.set()
         if self.socket:
             try:
                 self.socket.close()
@@ -834,8 +1052,9 @@ class PanelHospital(tk.Toplevel):
     
     def _on_closing_standalone(self):
         """Manejar cierre de ventana standalone"""
-        # Detener simulación
+        # Detener simulación y reconexión
         self.simulacion_activa = False
+        self._cerrando.set()
         
         if self.socket:
             try:
@@ -862,7 +1081,12 @@ def main():
     print("   python launcher.py")
     print("\n=" * 60 + "\n")
     
-    app = PanelHospital()
+    # Formato binario opcional: menos bytes y menos CPU con muchos eventos
+    formato = 'binario' if '--binario' in sys.argv[1:] else 'json'
+    # Compresión opcional: las instantáneas grandes ocupan menos en la red
+    compresion = '--comprimir' in sys.argv[1:]
+    
+    app = PanelHospital(formato=formato, compresion=compresion)
     app.mainloop()
 
 
@@ -20,10 +20,19 @@ import socket
 import json
 import sys
 import os
+import uuid
 
 # Agregar directorio raíz al path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from core.protocolo import (
+    INTERVALO_PING_CLIENTE, TIMEOUT_PING_CLIENTE, DecodificadorLineas, Latido, SolicitudesPendientes,
+    codificar, conectar, decodificar
+)
+
+# Reintentos de un registro sin respuesta (la clave de idempotencia evita duplicados)
+REINTENTOS_REGISTRO = 2
+
 
 class RegistroPaciente(tk.Toplevel):
     """Ventana de Registro de Pacientes"""
@@ -58,6 +67,7 @@ class RegistroPaciente(tk.Toplevel):
         self.port = port
         self.socket = None
         self.conectado = False
+        self.solicitudes = SolicitudesPendientes()  # Comandos esperando respuesta
         
         # Configuración de la ventana
         self.title("🏥 Registro de Pacientes")
@@ -87,27 +97,29 @@ class RegistroPaciente(tk.Toplevel):
     
     def _conectar_servidor(self):
         """Intenta conectarse al servidor del hospital"""
-        def conectar():
+        def _conectar():
             try:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.settimeout(2.0)
-                self.socket.connect((self.host, self.port))
+                # Socket Unix si el servidor es local, TCP si no
+                self.socket = conectar(self.host, self.port, timeout=2.0)
                 self.conectado = True
                 self.after(0, lambda: self._actualizar_estado_conexion(True))
                 
+                # El registro solo usa respuestas: no recibir eventos difundidos
+                self._enviar_comando({'comando': 'suscribir', 'tipos': []})
+                
                 # Solicitar lista de médicos
                 self._enviar_comando({'comando': 'obtener_medicos'})
                 
                 # Iniciar thread para recibir respuestas
                 thread = threading.Thread(target=self._recibir_respuestas, daemon=True)
                 thread.start()
-                
+            
             except Exception as e:
                 self.conectado = False
                 self.after(0, lambda: self._actualizar_estado_conexion(False))
                 self.after(0, self._cargar_doctores)
         
-        thread = threading.Thread(target=conectar, daemon=True)
+        thread = threading.Thread(target=_conectar, daemon=True)
         thread.start()
     
     def _enviar_comando(self, comando):
@@ -116,51 +128,88 @@ class RegistroPaciente(tk.Toplevel):
             return False
         
         try:
-            data = json.dumps(comando).encode('utf-8')
-            self.socket.sendall(data + b'\n')
+            self.socket.sendall(codificar(comando))
             return True
         except Exception as e:
             self.conectado = False
             return False
     
+    def solicitar(self, comando, timeout=None):
+        """
+        Envía un comando y devuelve el Future de su respuesta
+        
+        Varios comandos pueden estar en vuelo a la vez: cada respuesta se
+        asocia a su pedido por id_solicitud.
+        
+        Args:
+            comando: Comando a enviar
+            timeout: Segundos para recibir la respuesta (None: el default)
+        
+        Returns:
+            Future que se resuelve con la respuesta del servidor, o falla con
+            TimeoutError o ConnectionError
+        """
+        comando, futuro = self.solicitudes.registrar(comando, timeout)
+        if not self._enviar_comando(comando):
+            self.solicitudes.cancelar_todas()
+        return futuro
+    
     def _recibir_respuestas(self):
         """Recibe respuestas del servidor"""
-        buffer = ""
+        decodificador = DecodificadorLineas()
+        latido = Latido(INTERVALO_PING_CLIENTE, TIMEOUT_PING_CLIENTE)
         while self.conectado:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(65536)
                 if not data:
                     break
                 
-                buffer += data
-                while '\n' in buffer:
-                    linea, buffer = buffer.split('\n', 1)
-                    if linea.strip():
-                        mensaje = json.loads(linea)
-                        self._procesar_respuesta(mensaje)
+                latido.recibido()
+                for trama in decodificador.alimentar(data):
+                    self._procesar_respuesta(decodificar(trama))
             
             except socket.timeout:
-                continue
+                pass
             except Exception as e:
                 if self.conectado:
                     self.conectado = False
                     self.after(0, lambda: self._actualizar_estado_conexion(False))
                 break
+            
+            self.solicitudes.vencer()
+            
+            # Servidor en silencio: un ping; sin respuesta, la conexión quedó medio abierta
+            accion = latido.revisar()
+            if accion == 'ping':
+                self._enviar_comando({'comando': 'ping'})
+            elif accion == 'caido':
+                self.conectado = False
+                self.after(0, lambda: self._actualizar_estado_conexion(False))
+                break
+        
+        self.solicitudes.cancelar_todas()
     
     def _procesar_respuesta(self, respuesta):
         """Procesa una respuesta del servidor"""
+        if self.solicitudes.resolver(respuesta):
+            return  # La atiende quien hizo el pedido
+        if respuesta.get('id_solicitud') is not None:
+            return  # Llegó tarde: su pedido ya venció y se informó como error
+        
         tipo = respuesta.get('tipo')
         
-        if tipo == 'medicos':
+        if tipo == 'ping':
+            # Latido del servidor
+            self._enviar_comando({'comando': 'pong'})
+        
+        elif tipo == 'medicos':
             # Lista de médicos recibida
             medicos = [m['nombre'] for m in respuesta.get('medicos', [])]
             self.after(0, lambda: self._actualizar_lista_medicos(medicos))
         
         elif tipo == 'confirmacion':
-            # Confirmación de registro
-            estado = respuesta.get('estado')
-            if estado == 'ok':
-                self.after(0, lambda: self._confirmar_registro())
+            # Confirmación de registro sin id_solicitud
+            self.after(0, lambda: self._mostrar_resultado_registro(respuesta))
     
     def _actualizar_estado_conexion(self, conectado):
         """Actualiza el indicador de estado de conexión"""
@@ -480,12 +529,10 @@ class RegistroPaciente(tk.Toplevel):
         if self.conectado:
             comando = {
                 'comando': 'registrar_paciente',
-                'datos': paciente_data
+                'datos': paciente_data,
+                'clave_idempotencia': uuid.uuid4().hex  # La misma en cada reintento
             }
-            if self._enviar_comando(comando):
-                # El servidor confirmará el registro
-                pass
-            else:
+            if not self._enviar_registro(comando, REINTENTOS_REGISTRO):
                 # Conexión perdida, mostrar en modo demo
                 self._mostrar_confirmacion_demo(nombre_completo, doctor)
         else:
@@ -499,6 +546,52 @@ class RegistroPaciente(tk.Toplevel):
         # Limpiar formulario
         self._limpiar_formulario()
     
+    def _enviar_registro(self, comando, reintentos):
+        """
+        Envía un registro; si no hay respuesta a tiempo, lo reintenta
+        
+        Args:
+            comando: Comando registrar_paciente con su clave_idempotencia
+            reintentos: Reintentos que quedan
+        
+        Returns:
+            False si no se pudo enviar (conexión perdida)
+        """
+        futuro = self.solicitar(comando)
+        if futuro.done() and futuro.exception():
+            return False
+        # El servidor confirmará el registro (sin bloquear la interfaz)
+        futuro.add_done_callback(
+            lambda f: self.after(0, lambda: self._al_responder_registro(f, comando, reintentos))
+        )
+        return True
+    
+    def _al_responder_registro(self, futuro, comando, reintentos):
+        """Muestra la respuesta (o la falta de respuesta) a un registro"""
+        try:
+            respuesta = futuro.result()
+        except TimeoutError as e:
+            if reintentos > 0 and self._enviar_registro(comando, reintentos - 1):
+                return
+            messagebox.showwarning("Sin confirmación", f"{e}. El registro puede no haberse completado.")
+            return
+        except ConnectionError as e:
+            messagebox.showwarning("Sin confirmación", f"{e}. El registro puede no haberse completado.")
+            return
+        if respuesta.get('reintentar') and reintentos > 0:
+            # El mismo registro sigue en curso (por otra vía): se pregunta de nuevo
+            self.after(1000, lambda: self._enviar_registro(comando, reintentos - 1))
+            return
+        self._mostrar_resultado_registro(respuesta)
+    
+    def _mostrar_resultado_registro(self, respuesta):
+        """Muestra la confirmación o el rechazo de un registro"""
+        if respuesta.get('estado') == 'ok':
+            self._confirmar_registro()
+        else:
+            mensaje = respuesta.get('mensaje', 'No se pudo registrar el paciente')
+            messagebox.showwarning("Registro no aceptado", mensaje)
+    
     def _confirmar_registro(self):
         """Confirmación de registro desde el servidor"""
         messagebox.showinfo(
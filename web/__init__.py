@@ -0,0 +1,8 @@
+# web/__init__.py
+"""
+Módulo web del sistema hospitalario
+API HTTP y eventos en vivo para dashboards en el navegador
+
+Requiere FastAPI, uvicorn y websockets (requirements.txt); se importa solo si se pide
+con --http-port, así que el resto del sistema funciona sin ellos.
+"""
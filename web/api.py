@@ -0,0 +1,357 @@
+# web/api.py
+"""
+API HTTP del hospital con FastAPI
+Endpoints JSON para estadísticas, médicos, expedientes y registro de
+pacientes, y eventos en vivo por Server-Sent Events o WebSocket
+
+Corre con uvicorn en un thread propio, junto al EventServer, y recibe sus
+eventos en proceso (sin abrir un socket por dashboard).
+
+Uso:
+    python servidor.py --http-port 8000
+    curl http://localhost:8000/api/estadisticas
+    curl -N http://localhost:8000/api/eventos?tipos=paciente_registrado
+    websocat ws://localhost:8000/ws/eventos?prioridades=1
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import Body, FastAPI, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from core.event_server import MAX_LOTE_REGISTRO
+from web.difusor import ClienteWeb, DifusorEventos, leer_ultimo_id, trama_sse
+
+# Segundos sin eventos tras los que se envía un comentario SSE (mantiene viva la conexión)
+INTERVALO_LATIDO_SSE = 15
+
+# Segundos que puede tardar un cliente WebSocket en aceptar un mensaje antes de cortarlo
+TIMEOUT_ENVIO_WS = 10
+
+# Código de cierre WebSocket para clientes lentos (1013: "Try Again Later")
+CIERRE_CLIENTE_LENTO = 1013
+
+
+def _lista(texto: Optional[str]) -> Optional[List[str]]:
+    """Convierte 'a,b' en ['a', 'b'] (None si no se indicó)"""
+    if texto is None:
+        return None
+    return [valor.strip() for valor in texto.split(',') if valor.strip()]
+
+
+def compilar_filtro(event_server, tipos: Optional[str], medicos: Optional[str], prioridades: Optional[str]):
+    """
+    Compila los filtros de suscripción recibidos como parámetros de consulta
+
+    Raises:
+        HTTPException: 422 si algún criterio no es válido
+    """
+    try:
+        lista_prioridades = _lista(prioridades)
+        if lista_prioridades is not None:
+            lista_prioridades = [int(p) for p in lista_prioridades]
+        return event_server.compilar_filtro({
+            'tipos': _lista(tipos),
+            'medicos': _lista(medicos),
+            'prioridades': lista_prioridades
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def crear_app(hospital, event_server, difusor: DifusorEventos) -> FastAPI:
+    """
+    Crea la aplicación FastAPI
+
+    Args:
+        hospital: Instancia del hospital
+        event_server: Servidor de eventos (registro y eventos en vivo)
+        difusor: Puente de eventos hacia el bucle de la aplicación
+
+    Returns:
+        Aplicación lista para uvicorn
+    """
+    @contextlib.asynccontextmanager
+    async def ciclo_vida(app):
+        difusor.iniciar(asyncio.get_running_loop())
+        yield
+        difusor.detener()
+
+    app = FastAPI(title="Sistema Hospitalario", lifespan=ciclo_vida)
+
+    # Las funciones sin async corren en el pool de threads de FastAPI:
+    # pueden bloquear en los locks del hospital sin frenar el bucle
+
+    @app.get("/api/estado")
+    def estado():
+        """Instantánea completa con el seq y la sesión que refleja"""
+        return event_server.estado_actual()
+
+    @app.get("/api/estadisticas")
+    def estadisticas():
+        """Estadísticas del hospital"""
+        return hospital.get_estadisticas()
+
+    @app.get("/api/medicos")
+    def medicos():
+        """Médicos y pacientes atendidos por cada uno"""
+        return [
+            {'nombre': m.name, 'pacientes_atendidos': m.pacientes_atendidos, 'activo': m.is_alive()}
+            for m in hospital.medicos
+        ]
+
+    @app.get("/api/expedientes")
+    def expedientes(limite: int = Query(100, ge=1, le=1000), desplazamiento: int = Query(0, ge=0)):
+        """Página de expedientes en orden de registro"""
+        todos = hospital.sistema_expedientes.leer_todos_expedientes()
+        return {
+            'total': len(todos),
+            'desplazamiento': desplazamiento,
+            'expedientes': todos[desplazamiento:desplazamiento + limite]
+        }
+
+    @app.get("/api/expedientes/{paciente_id}")
+    def expediente(paciente_id: int):
+        """Expediente de un paciente"""
+        encontrado = hospital.sistema_expedientes.leer_expediente(paciente_id)
+        if encontrado is None:
+            raise HTTPException(status_code=404, detail=f"No hay expediente del paciente {paciente_id}")
+        return encontrado
+
+    @app.post("/api/pacientes")
+    def registrar_paciente(datos: Dict[str, Any] = Body(...),
+                           clave_idempotencia: Optional[str] = Header(None, alias="Idempotency-Key")):
+        """
+        Registra un paciente (como el comando registrar_paciente)
+
+        202 si se aceptó, 503 con Retry-After si la sala está llena, 422 si
+        los datos no son válidos.
+        """
+        respuesta = event_server.registrar_paciente(datos, clave_idempotencia)
+        if respuesta['estado'] == 'ok':
+            return JSONResponse(respuesta, status_code=202)
+        if respuesta['estado'] == 'cola_llena':
+            espera = max(1, round(respuesta.get('reintentar_en_s', 1)))
+            return JSONResponse(respuesta, status_code=503, headers={'Retry-After': str(espera)})
+        return JSONResponse(respuesta, status_code=422)
+
+    @app.post("/api/pacientes/lote")
+    def registrar_pacientes(pacientes: List[Any] = Body(..., embed=True)):
+        """Registra un lote de pacientes con una sola respuesta (como registrar_pacientes)"""
+        if not pacientes or len(pacientes) > MAX_LOTE_REGISTRO:
+            raise HTTPException(status_code=422, detail=f"El lote debe tener entre 1 y {MAX_LOTE_REGISTRO} pacientes")
+        return event_server.registrar_lote(pacientes)
+
+    @app.get("/api/eventos")
+    async def eventos(tipos: Optional[str] = None,
+                      medicos: Optional[str] = None,
+                      prioridades: Optional[str] = None,
+                      ultimo_id: Optional[str] = Header(None, alias="Last-Event-ID")):
+        """
+        Eventos en vivo por Server-Sent Events
+
+        Filtros opcionales como listas separadas por comas. El primer evento
+        es un estado_inicial; al reconectarse, el navegador envía
+        Last-Event-ID y recibe solo lo que se perdió.
+        """
+        filtro = compilar_filtro(event_server, tipos, medicos, prioridades)
+        desde_seq, sesion = leer_ultimo_id(ultimo_id)
+        cliente, iniciales = await difusor.conectar(filtro, desde_seq, sesion)
+        sesion_actual = event_server.sesion
+
+        async def flujo():
+            try:
+                for mensaje in iniciales:
+                    yield trama_sse(mensaje, sesion_actual)
+                while True:
+                    try:
+                        evento = await cliente.siguiente(INTERVALO_LATIDO_SSE)
+                    except asyncio.TimeoutError:
+                        yield b": latido\n\n"
+                        continue
+                    if evento is None:
+                        return  # Cliente lento o servidor deteniéndose: que reconecte
+                    yield difusor.trama_sse_evento(evento, sesion_actual)
+            finally:
+                difusor.desconectar(cliente)
+
+        return StreamingResponse(
+            flujo(),
+            media_type="text/event-stream",
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    @app.websocket("/ws/eventos")
+    async def eventos_ws(websocket: WebSocket,
+                         tipos: Optional[str] = None,
+                         medicos: Optional[str] = None,
+                         prioridades: Optional[str] = None,
+                         desde_seq: Optional[int] = Query(None, ge=0),
+                         sesion: Optional[str] = None):
+        """
+        Eventos en vivo por WebSocket (un mensaje de texto JSON por evento)
+
+        Los filtros iniciales son los de /api/eventos; después el cliente
+        puede enviar {'comando': 'suscribir', ...} para cambiarlos u
+        {'comando': 'obtener_estado'} para pedir una instantánea. Con
+        desde_seq y sesion recibe solo lo que se perdió desde ese seq.
+        """
+        try:
+            filtro = compilar_filtro(event_server, tipos, medicos, prioridades)
+        except HTTPException as e:
+            await websocket.close(code=1008, reason=str(e.detail)[:120])
+            return
+
+        await websocket.accept()
+        cliente, iniciales = await difusor.conectar(filtro, desde_seq, sesion)
+        canal = _CanalWS(websocket, cliente, difusor)
+        tareas = [asyncio.ensure_future(canal.emitir()), asyncio.ensure_future(canal.recibir())]
+        try:
+            for mensaje in iniciales:
+                await canal.enviar(json.dumps(mensaje, ensure_ascii=False))
+            await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+        except (WebSocketDisconnect, asyncio.TimeoutError, RuntimeError):
+            pass
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            difusor.desconectar(cliente)
+
+        if cliente.descartados or canal.lento:
+            # Cliente lento: que reconecte con desde_seq y recupere lo perdido
+            with contextlib.suppress(Exception):
+                await websocket.close(code=CIERRE_CLIENTE_LENTO, reason="cliente lento")
+
+    return app
+
+
+class _CanalWS:
+    """
+    Una conexión WebSocket: envía los eventos de su cliente y atiende sus
+    comandos
+
+    Los envíos pasan por un lock porque eventos y respuestas salen de dos
+    tareas distintas.
+    """
+
+    def __init__(self, websocket: WebSocket, cliente: ClienteWeb, difusor: DifusorEventos):
+        self.websocket = websocket
+        self.cliente = cliente
+        self.difusor = difusor
+        self.event_server = difusor.event_server
+        self.lento = False
+        self._lock_envio = asyncio.Lock()
+
+    async def enviar(self, texto: str):
+        """
+        Envía un mensaje de texto
+
+        Raises:
+            asyncio.TimeoutError: Si el cliente no lo aceptó en TIMEOUT_ENVIO_WS
+        """
+        async with self._lock_envio:
+            try:
+                await asyncio.wait_for(self.websocket.send_text(texto), TIMEOUT_ENVIO_WS)
+            except asyncio.TimeoutError:
+                self.lento = True
+                raise
+
+    async def emitir(self):
+        """Envía los eventos del cliente hasta que se cierre"""
+        while True:
+            evento = await self.cliente.siguiente()
+            if evento is None:
+                return
+            await self.enviar(self.difusor.texto_ws_evento(evento))
+
+    async def recibir(self):
+        """Atiende los comandos del cliente hasta que se desconecte"""
+        while True:
+            texto = await self.websocket.receive_text()
+            try:
+                mensaje = json.loads(texto)
+            except ValueError:
+                mensaje = None
+            if not isinstance(mensaje, dict):
+                respuesta = {'tipo': 'error', 'mensaje': 'Se esperaba un objeto JSON'}
+            else:
+                respuesta = await self._procesar_comando(mensaje)
+                if 'id_solicitud' in mensaje:
+                    respuesta['id_solicitud'] = mensaje['id_solicitud']
+            await self.enviar(json.dumps(respuesta, ensure_ascii=False))
+
+    async def _procesar_comando(self, mensaje: Dict[str, Any]) -> Dict[str, Any]:
+        """Procesa un comando del cliente (como EventServer._procesar_comando)"""
+        comando = mensaje.get('comando')
+
+        if comando == 'suscribir':
+            try:
+                self.cliente.filtro = self.event_server.compilar_filtro(mensaje)
+            except ValueError as e:
+                return {'tipo': 'error', 'mensaje': str(e)}
+            return dict(self.cliente.filtro.describir(), tipo='suscripcion')
+
+        if comando == 'obtener_estado':
+            loop = asyncio.get_running_loop()
+            estado = await loop.run_in_executor(None, self.event_server.estado_actual)
+            # Los eventos ya incluidos en la instantánea no se reenvían
+            self.cliente.ultimo_seq = max(self.cliente.ultimo_seq, estado['seq'])
+            return estado
+
+        return {'tipo': 'error', 'mensaje': f"Comando desconocido: {comando}"}
+
+
+class ServidorHTTP:
+    """
+    Servidor uvicorn en un thread propio, con el mismo ciclo de vida que
+    el EventServer (iniciar/detener)
+    """
+
+    def __init__(self, hospital, event_server, host: str = 'localhost', port: int = 8000,
+                 max_cola: int = 256):
+        """
+        Inicializa el servidor HTTP
+
+        Args:
+            hospital: Instancia del hospital
+            event_server: Servidor de eventos
+            host: Host de escucha
+            port: Puerto HTTP
+            max_cola: Eventos pendientes por cliente web antes de cortarlo
+        """
+        self.host = host
+        self.port = port
+        self.difusor = DifusorEventos(event_server, max_cola)
+        self.app = crear_app(hospital, event_server, self.difusor)
+        self._servidor = uvicorn.Server(uvicorn.Config(
+            self.app, host=host, port=port, log_level="warning",
+            lifespan="on", timeout_graceful_shutdown=2
+        ))
+        self._hilo: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    def iniciar(self):
+        """Inicia uvicorn en segundo plano"""
+        self._hilo = threading.Thread(target=self._servidor.run, name="HTTP", daemon=True)
+        self._hilo.start()
+        self.logger.info(f"🌍 API HTTP iniciada en http://{self.host}:{self.port}")
+
+    def detener(self):
+        """Cierra los flujos abiertos y detiene uvicorn"""
+        loop = self.difusor.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.difusor.cerrar_todos)
+            except RuntimeError:
+                pass
+        self._servidor.should_exit = True
+        if self._hilo and self._hilo.is_alive():
+            self._hilo.join(timeout=5)
+        self.logger.info("🔴 API HTTP detenida")
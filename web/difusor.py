@@ -0,0 +1,254 @@
+# web/difusor.py
+"""
+Reparto de los eventos del servidor de eventos a clientes web
+Un oyente del EventServer pasa cada evento a un bucle asyncio, donde se
+reparte a las colas de los clientes conectados (SSE o WebSocket)
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+class ClienteWeb:
+    """
+    Cola de eventos de un cliente web
+
+    Acotada: si el cliente no consume al ritmo de los eventos, la cola se
+    descarta y el cliente queda cerrado. Al reconectarse con su último seq
+    recupera lo perdido del historial (o una instantánea completa).
+
+    Solo se usa desde el bucle asyncio del servidor HTTP.
+    """
+
+    def __init__(self, filtro, max_cola: int):
+        """
+        Inicializa el cliente
+
+        Args:
+            filtro: Suscripción compilada (EventServer.compilar_filtro)
+            max_cola: Eventos pendientes como máximo
+        """
+        self.filtro = filtro
+        self.max_cola = max_cola
+        self.cola = deque()  # _EventoDifundido pendientes de enviar
+        self.ultimo_seq = 0  # Último seq enviado (descarta repetidos)
+        self.cerrado = False
+        self.descartados = 0
+        self._hay_eventos = asyncio.Event()
+
+    def entregar(self, evento):
+        """Encola un evento difundido si pasa el filtro del cliente"""
+        if self.cerrado:
+            return
+        evento = self.filtro.evento_para(evento)
+        if evento is None:
+            return
+        if len(self.cola) >= self.max_cola:
+            # Cliente lento: se corta y recupera al reconectarse
+            self.descartados += len(self.cola)
+            self.cola.clear()
+            self.cerrar()
+            return
+        self.cola.append(evento)
+        self._hay_eventos.set()
+
+    async def siguiente(self, timeout: Optional[float] = None):
+        """
+        Espera el siguiente evento nuevo para este cliente
+
+        Args:
+            timeout: Segundos de espera como máximo (None sin límite)
+
+        Returns:
+            El evento, o None si el cliente se cerró
+
+        Raises:
+            asyncio.TimeoutError: Si no llegó nada en timeout segundos
+        """
+        while True:
+            while self.cola:
+                evento = self.cola.popleft()
+                if evento.seq > self.ultimo_seq:
+                    self.ultimo_seq = evento.seq
+                    return evento
+            if self.cerrado:
+                return None
+            self._hay_eventos.clear()
+            await asyncio.wait_for(self._hay_eventos.wait(), timeout)
+
+    def cerrar(self):
+        """Marca el cliente como cerrado y despierta a quien lo espera"""
+        self.cerrado = True
+        self._hay_eventos.set()
+
+
+class DifusorEventos:
+    """
+    Puente entre el EventServer (threads) y un bucle asyncio
+
+    Cada evento difundido cruza al bucle con una sola llamada, sin importar
+    cuántos clientes web haya; el reparto a las colas ocurre ya en el bucle.
+    Las codificaciones SSE/WebSocket de cada evento se guardan aquí, no en el
+    evento: así no se toca el evento compartido con el EventServer.
+    """
+
+    def __init__(self, event_server, max_cola: int = 256):
+        """
+        Inicializa el difusor
+
+        Args:
+            event_server: Servidor de eventos del que se reciben los eventos
+            max_cola: Eventos pendientes por cliente antes de cortarlo
+        """
+        self.event_server = event_server
+        self.max_cola = max_cola
+        self.clientes: Set[ClienteWeb] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._codificados: Dict[Tuple[int, str], Any] = {}  # (seq, formato) -> trama (solo en el bucle)
+        self.logger = logging.getLogger(__name__)
+
+    def iniciar(self, loop: asyncio.AbstractEventLoop):
+        """Empieza a recibir eventos del EventServer en el bucle indicado"""
+        self.loop = loop
+        self.event_server.agregar_oyente(self._al_difundir)
+
+    def detener(self):
+        """Deja de recibir eventos y cierra todos los clientes"""
+        self.event_server.quitar_oyente(self._al_difundir)
+        self.cerrar_todos()
+        self.loop = None
+
+    def cerrar_todos(self):
+        """Cierra los clientes conectados (llamar desde el bucle)"""
+        for cliente in list(self.clientes):
+            cliente.cerrar()
+
+    def _al_difundir(self, evento):
+        """Oyente del EventServer (thread que difunde): pasa el evento al bucle"""
+        loop = self.loop
+        if loop is not None and self.clientes:
+            try:
+                loop.call_soon_threadsafe(self._repartir, evento)
+            except RuntimeError:
+                pass  # El bucle ya se cerró
+
+    def _repartir(self, evento):
+        """Entrega un evento a todos los clientes (en el bucle)"""
+        for cliente in list(self.clientes):
+            cliente.entregar(evento)
+            if cliente.cerrado:
+                self.clientes.discard(cliente)
+
+    async def conectar(self, filtro, desde_seq: Optional[int] = None,
+                       sesion: Optional[str] = None) -> Tuple[ClienteWeb, List[Dict[str, Any]]]:
+        """
+        Da de alta un cliente y prepara lo que debe recibir primero
+
+        El cliente se registra antes de leer el historial, así que ningún
+        evento queda entre ambos; los repetidos se descartan por seq.
+
+        Args:
+            filtro: Suscripción compilada
+            desde_seq: Último seq que el cliente ya tiene (None si es nuevo)
+            sesion: Sesión del servidor a la que corresponde desde_seq
+
+        Returns:
+            (cliente, mensajes iniciales): un estado_inicial o los eventos
+            posteriores a desde_seq, en orden
+        """
+        cliente = ClienteWeb(filtro, self.max_cola)
+        self.clientes.add(cliente)
+        loop = asyncio.get_running_loop()
+        try:
+            iniciales, seq = await loop.run_in_executor(None, self._iniciales, filtro, desde_seq, sesion)
+        except Exception:
+            self.desconectar(cliente)
+            raise
+        cliente.ultimo_seq = seq
+        return cliente, iniciales
+
+    def _iniciales(self, filtro, desde_seq: Optional[int], sesion: Optional[str]) -> Tuple[List[Dict[str, Any]], int]:
+        """Mensajes iniciales de un cliente y el seq que cubren (en un thread aparte)"""
+        if desde_seq is not None:
+            completo, eventos, seq = self.event_server.cambios_desde(desde_seq, sesion, filtro)
+            if not completo:
+                return [evento.mensaje for evento in eventos], seq
+        estado = self.event_server.estado_actual()
+        return [estado], estado['seq']
+
+    def trama_sse_evento(self, evento, sesion: str) -> bytes:
+        """
+        Evento SSE de un evento difundido, formateado una sola vez para todos
+
+        Args:
+            evento: _EventoDifundido
+            sesion: Sesión del servidor de eventos
+        """
+        return self._codificado(evento, 'sse', lambda: trama_sse(evento.mensaje, sesion))
+
+    def texto_ws_evento(self, evento) -> str:
+        """
+        Mensaje WebSocket de un evento difundido, serializado una sola vez para todos
+
+        Args:
+            evento: _EventoDifundido
+        """
+        return self._codificado(evento, 'ws', lambda: json.dumps(evento.mensaje, ensure_ascii=False))
+
+    def _codificado(self, evento, formato: str, codificar):
+        """
+        Devuelve la codificación de un evento, calculándola la primera vez
+
+        Solo se guardan las de los últimos max_cola eventos: los clientes que
+        van más atrasados se cortan igualmente.
+        """
+        clave = (evento.seq, formato)
+        codificado = self._codificados.get(clave)
+        if codificado is None:
+            codificado = self._codificados[clave] = codificar()
+            while len(self._codificados) > 2 * self.max_cola:
+                del self._codificados[next(iter(self._codificados))]
+        return codificado
+
+    def desconectar(self, cliente: ClienteWeb):
+        """Da de baja un cliente"""
+        cliente.cerrar()
+        self.clientes.discard(cliente)
+        if cliente.descartados:
+            self.logger.warning(f"🐢 Cliente web lento desconectado ({cliente.descartados} eventos descartados)")
+
+
+def trama_sse(mensaje: Dict[str, Any], sesion: str) -> bytes:
+    """
+    Formatea un mensaje como evento Server-Sent Events
+
+    El id lleva sesión y seq: el navegador lo devuelve en Last-Event-ID al
+    reconectarse.
+
+    Args:
+        mensaje: Mensaje con 'tipo' y 'seq'
+        sesion: Sesión del servidor de eventos
+
+    Returns:
+        Evento SSE codificado
+    """
+    datos = json.dumps(mensaje, ensure_ascii=False)
+    return f"id: {sesion}:{mensaje.get('seq', 0)}\nevent: {mensaje.get('tipo')}\ndata: {datos}\n\n".encode('utf-8')
+
+
+def leer_ultimo_id(ultimo_id: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Interpreta un Last-Event-ID ('sesion:seq')
+
+    Returns:
+        (seq, sesion), o (None, None) si no hay o no es válido
+    """
+    if not ultimo_id:
+        return None, None
+    sesion, _, seq = ultimo_id.rpartition(':')
+    try:
+        return int(seq), sesion or None
+    except ValueError:
+        return None, None